@@ -1,92 +1,229 @@
-import json
 import os
+import sys
 import time
 import re
-from multiprocessing import Process, Queue
-from queue import Empty
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+import sqlite3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Process
+from typing import Dict, List, Optional, Tuple, Union
 from bs4 import BeautifulSoup
 import requests
 from transliterate import translit
 
+from common.metrics import Metrics, MetricsReporter, ratio
+from common.sinks import create_sink
+from driver_pool import DEFAULT_MAX_PAGES, DEFAULT_MEMORY_LIMIT, DEFAULT_POOL_SIZE, WebDriverPool
+from extractor import FieldExtractor
+from fetcher import PooledFetcher, DEFAULT_PER_HOST_LIMIT, DEFAULT_WORKERS
+from history import CHANGE_CHANGED, CHANGE_NEW, AppHistory
+from play_search import BASE_LINK, DETAILS_PATH, PlayStoreSearch
+from response_cache import DEFAULT_MAX_SIZE, DEFAULT_TTL, ResponseCache
+
 SCROLL_PAUSE_TIME = 0.7
 DRIVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chromedriver')
-BASE_LINK = 'https://play.google.com'
+APP_FIELDS = ('query', 'link', 'name', 'author', 'category', 'description', 'average_rate', 'rates_count',
+              'last_update')
 
 
 class AppsScanner(Process):
     """
-    Главный класс-процесс, отвечает за подготовку начальных ссылок, генерацию, запуск под-процессов
-    и сохранение результата в формате json.
+    Главный класс-процесс, отвечает за подготовку начальных ссылок, параллельную загрузку страниц приложений
+    через общий пул подключений и сохранение результата по мере поступления, по умолчанию в формате json.
+    Принимает одно название приложения или список названий, поисковые запросы выполняются параллельно.
+    Ссылки на приложения ищутся http запросами к выдаче магазина, браузер используется только для запросов,
+    по которым поиск без браузера не дал результатов, или если явно запрошен параметром browser.
+    Запросы через браузер распределяются по пулу из drivers прогретых драйверов, драйвер перезапускается
+    после driver_pages страниц или при превышении ограничения памяти driver_memory.
+    При заданном history_db результаты сохраняются в хранилище истории приложений, а страницы приложений,
+    карточка которых в выдаче поиска не изменилась с прошлого запуска, не загружаются повторно.
+    При заданном cache_dir страницы приложений кэшируются на диске, в режиме offline сеть не используется:
+    разбираются все закэшированные страницы приложений, подходящие по названию.
+    :param app_name - название приложения или список названий для поиска.
+    :param browser - искать приложения через браузер (selenium).
+    :param workers - количество потоков загрузки страниц приложений.
+    :param per_host_limit - максимальное количество одновременных запросов к одному хосту.
+    :param cache_dir - каталог кэша ответов, по умолчанию кэш не используется.
+    :param cache_ttl - время жизни записи кэша в секундах.
+    :param cache_size - максимальный размер кэша в мегабайтах.
+    :param offline - использовать только закэшированные страницы.
+    :param drivers - количество одновременно запущенных браузеров.
+    :param driver_pages - количество страниц, после которого браузер перезапускается.
+    :param driver_memory - ограничение памяти всех браузеров в мегабайтах.
+    :param history_db - путь к базе истории приложений, по умолчанию история не ведется.
+    :param max_rate - максимальное количество запросов страниц приложений в секунду, 0 - без ограничения.
+    :param per_target_rate - максимальное количество запросов в секунду к одному хосту, 0 - без ограничения.
+    :param metrics_file - файл, в который раз в секунду записываются метрики скана в формате Prometheus.
+    :param metrics_listen - адрес host:port, по которому метрики отдаются по HTTP (GET /metrics).
+    :param progress - выводить строку прогресса на stderr.
     """
 
-    def __init__(self, app_name: str, json_file: str = 'data.json') -> None:
+    def __init__(self, app_name: Union[str, List[str]], json_file: str = 'data.json', log_format: Optional[str] = None,
+                 browser: bool = False, workers: int = DEFAULT_WORKERS, per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+                 cache_dir: Optional[str] = None, cache_ttl: float = DEFAULT_TTL,
+                 cache_size: int = DEFAULT_MAX_SIZE // 2 ** 20, offline: bool = False,
+                 drivers: int = DEFAULT_POOL_SIZE, driver_pages: int = DEFAULT_MAX_PAGES,
+                 driver_memory: int = DEFAULT_MEMORY_LIMIT, history_db: Optional[str] = None,
+                 max_rate: float = 0, per_target_rate: float = 0, metrics_file: Optional[str] = None,
+                 metrics_listen: Optional[str] = None, progress: bool = False) -> None:
         super(AppsScanner, self).__init__()
         self.json_file = json_file
-        self.app_name = app_name
+        self.log_format = log_format
+        self.app_names = [app_name] if isinstance(app_name, str) else list(dict.fromkeys(app_name))
+        self.browser = browser
         self.app_links = list()
-        self.apps_info_queue = Queue()
-        self.results = list()
-        self.web_driver = None
-        self.scanners = list()
+        self.link_queries = dict()
+        self.fingerprints = dict()
+        self.unverified_links = set()
+        self.workers = workers
+        self.per_host_limit = per_host_limit
+        self.cache_dir = cache_dir
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.offline = offline
+        self.drivers = drivers
+        self.driver_pages = driver_pages
+        self.driver_memory = driver_memory
+        self.history_db = history_db
+        self.max_rate = max_rate
+        self.per_target_rate = per_target_rate
+        self.interrupted = False
+        self.cache = None
+        self.history = None
+        self.results_count = 0
+        self.errors_count = 0
+        self.changes = Counter()
+        self.sink = None
+        self.metrics = Metrics()
+        self.metrics_file = metrics_file
+        self.metrics_listen = metrics_listen
+        self.progress = progress
 
     def run(self) -> None:
-        self.init_web_driver()
-        self.prepare_links()
-        self._generate_scanners()
-        for scanner in self.scanners:
-            scanner.start()
-        while True:
-            try:
-                app_info = self.apps_info_queue.get(timeout=0.001)
-                self.results.append(app_info)
-            except Empty:
-                if not any(scanner.is_alive() for scanner in self.scanners):
-                    break
-        for scanner in self.scanners:
-            scanner.join()
-        self.web_driver.close()
-        if self.results:
-            self._save_info_to_json()
-            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), self.json_file)
-            print(f'Скан окончен, результат сохранен в {path}')
+        if self.cache_dir:
+            self.cache = ResponseCache(self.cache_dir, self.cache_ttl, self.cache_size * 2 ** 20)
+            self.cache.open()
+        with self._prepare_reporter():
+            if self.offline:
+                self.cached_links()
+            else:
+                missing = self.app_names if self.browser else self.search_links()
+                if missing:
+                    self.browser_links(missing)
+            self.metrics.set('apps_planned', len(self.app_links))
+            self._prepare_sink()
+            if self.history_db:
+                self._prepare_history()
+            with self.sink:
+                self._scan_apps()
+        if self.cache is not None:
+            self.cache.close()
+        if self.history is not None:
+            self.history.close()
+            print(f'Страниц без изменений в выдаче (не загружались): {self.changes["skipped"]}, '
+                  f'новых приложений: {self.changes[CHANGE_NEW]}, изменившихся: {self.changes[CHANGE_CHANGED]}')
+        if self.interrupted:
+            print('Скан прерван, сохранены результаты по загруженным страницам')
+        if self.errors_count:
+            print(f'Не удалось загрузить страниц приложений: {self.errors_count}')
+        if self.results_count:
+            path = os.path.abspath(self.json_file)
+            print(f'Скан окончен, найдено приложений: {self.results_count}, результат сохранен в {path}')
         else:
             print('Скан не показал результатов')
 
-    def init_web_driver(self) -> None:
+    def search_links(self) -> List[str]:
+        """
+        Функция параллельно ищет ссылки на приложения по всем запросам без браузера, постранично запрашивая
+         выдачу магазина. Ссылки, название которых в выдаче не указано, проверяются по названию
+         со страницы приложения. Возвращает запросы, по которым поиск не дал результатов.
+        """
+        session = requests.Session()
+        missing = list()
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(self.app_names))) as executor:
+            for query, results in zip(self.app_names, executor.map(self._search_query, self.app_names,
+                                                                   [session] * len(self.app_names))):
+                if isinstance(results, requests.RequestException):
+                    print(f'Поиск без браузера по запросу {query} недоступен ({results}), используется браузер')
+                    results, fingerprints = list(), dict()
+                else:
+                    results, fingerprints = results
+                for link, fingerprint in fingerprints.items():
+                    self.fingerprints.setdefault(link, fingerprint)
+                found = len(self.app_links)
+                for link, app_name in results:
+                    if app_name is None:
+                        self._add_link(link, query, verified=False)
+                    elif self.check_app_name(app_name, query):
+                        self._add_link(link, query)
+                if len(self.app_links) == found:
+                    missing.append(query)
+        session.close()
+        return missing
+
+    def cached_links(self) -> None:
         """
-        Функция инициализирует вэб драйвер для анализа страниц.
+        Функция берет ссылки на приложения из кэша ответов, названия проверяются по странице приложения
+         для каждого из запросов.
+        """
+        for link in self.cache.urls(BASE_LINK + DETAILS_PATH):
+            self._add_link(link[len(BASE_LINK):], None, verified=False)
+
+    def browser_links(self, queries: List[str]) -> None:
+        """
+        Функция ищет ссылки на приложения через браузер, распределяя запросы по пулу драйверов.
+        """
+        with WebDriverPool(self.init_web_driver, min(self.drivers, len(queries)), self.driver_pages,
+                           self.driver_memory) as pool:
+            with ThreadPoolExecutor(max_workers=pool.size) as executor:
+                for query, links in zip(queries, executor.map(self.prepare_links, queries, [pool] * len(queries))):
+                    for link in links:
+                        self._add_link(link, query)
+        if pool.recycled:
+            print(f'Запущено браузеров: {pool.started}, из них перезапущено: {pool.recycled}')
+
+    @staticmethod
+    def init_web_driver():
         """
+        Функция создает вэб драйвер для анализа страниц.
+         Selenium импортируется только здесь, поиск без браузера его не требует.
+        """
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
         opts = Options()
         opts.add_argument('-headless')
-        self.web_driver = webdriver.Chrome(DRIVER_PATH, options=opts)
+        return webdriver.Chrome(DRIVER_PATH, options=opts)
 
-    def prepare_links(self) -> None:
+    def prepare_links(self, query: str, pool: WebDriverPool) -> List[str]:
         """"
-        Функция делает запрос на главную ссылку через драйвер,
+        Функция делает запрос на главную ссылку через свободный драйвер пула,
          запускает механизм обработки ссылок и производит фильтрацию ссылок.
         """
-        self.web_driver.get(f'{BASE_LINK}/store/search?q={self.app_name}&c=apps')
-        apps_tags = self.scroll_apps_on_page()
+        links = list()
+        with pool.driver() as web_driver:
+            web_driver.get(f'{BASE_LINK}/store/search?q={query}&c=apps')
+            apps_tags = self.scroll_apps_on_page(web_driver)
         for tag in apps_tags:
             link_tag = tag.find('div', {'class': ['b8cIId ReQCgd Q9MA7b']})
             app_name = link_tag.a.div.text
-            if self.check_app_name(app_name):
+            if self.check_app_name(app_name, query):
                 link = link_tag.a['href']
-                if link not in self.app_links:
-                    self.app_links.append(link)
+                if link not in links:
+                    links.append(link)
+        return links
 
-    def scroll_apps_on_page(self) -> list:
+    @staticmethod
+    def scroll_apps_on_page(web_driver) -> list:
         """
         Функция скролит страницу до тех пока, пока перестанут появляться необходимые теги,
         сохраняет теги в переменную и возвращает.
         """
         divs_len = 0
         while True:
-            self.web_driver.execute_script("window.scrollTo(0, document.body.scrollHeight,);")
+            web_driver.execute_script("window.scrollTo(0, document.body.scrollHeight,);")
             time.sleep(SCROLL_PAUSE_TIME)
-            soup = BeautifulSoup(self.web_driver.page_source, features='html.parser')
+            soup = BeautifulSoup(web_driver.page_source, features='html.parser')
             divs_soup = soup.find('div', {'class': ['ZmHEEd']})
             new_divs_len = len(divs_soup.find_all('c-wiz', {'jsrenderer': ['PAQZbb']}))
             if new_divs_len == divs_len:
@@ -96,133 +233,150 @@ class AppsScanner(Process):
         base_app_tags.extend(divs_soup.find_all('c-wiz', {'jsrenderer': ['PAQZbb']}))
         return base_app_tags
 
-    def check_app_name(self, app_name: str) -> bool:
+    @staticmethod
+    def check_app_name(app_name: str, query: str) -> bool:
         """
         Функция проверяет изначальный тип ввода.
         Если данные содержат кириллицу, транслитит название приложения на ru.
         :param app_name: название приложения
+        :param query: поисковый запрос
         """
-        cyrillic_input = re.search('[а-яА-Я]', self.app_name)
+        cyrillic_input = re.search('[а-яА-Я]', query)
         if cyrillic_input:
             translited_app_name = translit(app_name, 'ru').lower()
-            return translited_app_name[:4] in self.app_name
+            return translited_app_name[:4] in query
         else:
-            return app_name[:5] in self.app_name
+            return app_name[:5] in query
 
-    def _generate_scanners(self) -> None:
+    def _match_query(self, app_name: str, preferred: Optional[str] = None) -> Optional[str]:
         """
-        Функция генерирует классы под-процессы для обработки тэгов с информацией.
+        Функция возвращает запрос, которому соответствует название приложения: preferred, если подходит он,
+         иначе первый подходящий из всех запросов.
         """
-        self.scanners = [Scanner(link, self.apps_info_queue) for link in self.app_links]
+        queries = [preferred] + self.app_names if preferred else self.app_names
+        return next((query for query in queries if self.check_app_name(app_name, query)), None)
 
-    def _save_info_to_json(self):
+    def _add_link(self, link: str, query: Optional[str], verified: bool = True) -> None:
         """
-        Функция сохраняет результат в json файл.
+        Функция добавляет ссылку на приложение, найденную по запросу query. Непроверенные ссылки
+         проверяются по названию со страницы приложения.
         """
-        with open('data.json', 'w', encoding='utf8') as file:
-            file.write(json.dumps(self.results))
-
-
-class Scanner(Process):
-    """
-    Класс под-процесс, отвечающий за создание запроса по полученной ссылке,
-    обработку ответа и генерацию данных.
-    """
-
-    def __init__(self, link: str, queue: Queue) -> None:
-        super(Scanner, self).__init__()
-        self.link = link
-        self.queue = queue
-        self.soup = None
-        self.app_info = dict()
+        if link in self.link_queries:
+            if verified:
+                self.unverified_links.discard(BASE_LINK + link)
+                self.link_queries[link] = query
+            return
+        self.app_links.append(link)
+        self.link_queries[link] = query
+        if not verified:
+            self.unverified_links.add(BASE_LINK + link)
 
-    def run(self) -> None:
-        self.prepare_soup()
-        self.prepare_app_name()
-        self.prepare_author_and_category()
-        self.prepare_description()
-        self.prepare_average_rate()
-        self.prepare_rates_count()
-        self.prepare_last_update()
-        self.queue.put(self.app_info)
+    @staticmethod
+    def _search_query(query: str, session: requests.Session) -> Union[
+            Tuple[List[Tuple[str, Optional[str]]], Dict[str, str]], requests.RequestException]:
+        search = PlayStoreSearch(session)
+        try:
+            return list(search.search(query)), search.fingerprints
+        except requests.RequestException as err:
+            return err
 
-    def prepare_soup(self) -> None:
+    def _scan_apps(self) -> None:
         """
-        Функция делает http запрос, получает ответ и парсит верску для использования.
+        Функция загружает страницы приложений через пул подключений и разбирает их по мере загрузки.
+         Приложения, карточка которых в выдаче не изменилась, берутся из истории без загрузки страницы.
         """
-        link = BASE_LINK + self.link
-        self.app_info['link'] = link
-        headers = {"Accept-Language": "ru - RU, ru;q=0.5"}
-        response = requests.get(link, headers=headers)
-        self.soup = BeautifulSoup(response.content, features='html.parser')
+        links = list()
+        for link in self.app_links:
+            stored = self.history.unchanged(BASE_LINK + link, self.fingerprints.get(link)) if self.history else None
+            if stored is None:
+                links.append(BASE_LINK + link)
+                continue
+            self.history.touch(BASE_LINK + link)
+            self.changes['skipped'] += 1
+            self.metrics.inc('apps', result='skipped')
+            self._write_app(stored)
+        fetcher = PooledFetcher(self.workers, self.per_host_limit, cache=self.cache, offline=self.offline,
+                                rate=self.max_rate, per_host_rate=self.per_target_rate, metrics=self.metrics)
+        with fetcher, fetcher.scheduler.handle_signals():
+            for link, response in fetcher.fetch_all(links):
+                if isinstance(response, requests.RequestException):
+                    self.errors_count += 1
+                    self.metrics.inc('apps', result='error')
+                    continue
+                charset = 'charset' in response.headers.get('Content-Type', '').lower()
+                with self.metrics.timer('parse'):
+                    app_info = Scanner(link).parse(response.content, response.encoding if charset else None)
+                self.metrics.inc('apps', result='parsed')
+                if self.history is not None:
+                    change = self.history.record(app_info, self.fingerprints.get(link[len(BASE_LINK):]))
+                    self.changes[change] += 1
+                self._write_app(app_info)
+            self.interrupted = fetcher.scheduler.cancelled
 
-    def prepare_app_name(self) -> None:
+    def _write_app(self, app_info: dict) -> None:
         """
-        Функция ищет в верстке тег, содержащий данные о названии приложени].
+        Функция проверяет название приложения по непроверенным ссылкам и записывает результат в приемник.
         """
-        name_tag = self.soup.find('h1', {'class': ['AHFaub']})
-        if name_tag:
-            self.app_info['name'] = name_tag.span.text
-        else:
-            self.app_info['name'] = 'No name'
+        link = app_info['link']
+        query = self.link_queries[link[len(BASE_LINK):]]
+        if link in self.unverified_links:
+            query = self._match_query(app_info['name'] or '', query)
+            if query is None:
+                return
+        self.sink.write(dict(query=query, **app_info))
+        self.results_count += 1
 
-    def prepare_author_and_category(self) -> None:
+    def _prepare_reporter(self) -> MetricsReporter:
         """
-        Функция ищет в верстке теги, содержащие данные о авторстве и категории приложения.
+        Функция запускает публикацию метрик: файл, HTTP сервер и строку прогресса, если они включены.
         """
-        author_and_category_tag = self.soup.find_all('span', {'class': ['T32cc']})
-        if author_and_category_tag:
-            author, category = author_and_category_tag
-            self.app_info['author'], self.app_info['category'] = author.a.text, category.a.text
-        else:
-            self.app_info['author'] = self.app_info['category'] = 'No data'
+        reporter = MetricsReporter(self.metrics, 'apps', self.metrics_file, self.metrics_listen, self.progress,
+                                   describe=self._describe_progress)
+        try:
+            reporter.start()
+        except (ValueError, OSError) as err:
+            sys.exit(err)
+        return reporter
 
-    def prepare_description(self) -> None:
-        """
-        Функция ищет в верстке тег, содержащий описание приложения.
-        """
-        text = []
-        description = self.soup.find('div', {'jsname': ["sngebd"]})
-        if description:
-            for child in description.children:
-                string = child.string
-                if string:
-                    text.append(string)
-            self.app_info['description'] = '\n'.join(text)
-        else:
-            self.app_info['description'] = 'No description'
+    def _describe_progress(self) -> str:
+        cached = self.metrics.counter('fetches', source='cache') + self.metrics.counter('fetches', source='revalidated')
+        fetches = self.metrics.total('fetches')
+        return f'found {self.results_count} errors {self.errors_count} cache {ratio(cached, fetches)}'
 
-    def prepare_average_rate(self) -> None:
+    def _prepare_history(self) -> None:
         """
-        Функция ищет в верстке тег, содержащий данные о средней оценке приложения.
+        Функция открывает хранилище истории приложений self.history_db.
         """
-        av_rate = self.soup.find('div', {'class': ['BHMmbe']})
-        if av_rate:
-            self.app_info['average_rate'] = av_rate.text
-        else:
-            self.app_info['average_rate'] = 'No rates'
+        self.history = AppHistory(self.history_db)
+        try:
+            self.history.open()
+        except (ValueError, sqlite3.Error) as err:
+            sys.exit(err)
 
-    def prepare_rates_count(self) -> None:
+    def _prepare_sink(self) -> None:
         """
-        Функция ищет в верстке тег, содержащий данные о кол-ве оценок приложения.
+        Функция создает приемник, записывающий результат в файл self.json_file по мере поступления.
         """
-        div_tag = self.soup.find('span', {'class': ['AYi5wd']})
-        if div_tag:
-            rates_count = re.sub(r"(\xa0)", '', div_tag.span.text)
-            self.app_info['rates_count'] = "{:,d}".format(int(rates_count))
-        span_tag = self.soup.find('span', {'class': ['AYi5wd']})
-        if span_tag:
-            rates_count = re.sub(r"(\xa0)", '', div_tag.span.text)
-            self.app_info['rates_count'] = "{:,d}".format(int(rates_count))
-        else:
-            self.app_info['rates_count'] = 'No rates'
+        try:
+            self.sink = create_sink(self.json_file, APP_FIELDS, self.log_format)
+        except ValueError as err:
+            sys.exit(err)
 
-    def prepare_last_update(self) -> None:
-        """
-        Функция ищет в верстке тег, содержащий данные о последнем обновлении.
-        """
-        last_update = self.soup.find('span', {'class': ['htlgb']})
-        if last_update:
-            self.app_info['last_update'] = last_update.text
-        else:
-            self.app_info['last_update'] = 'no data'
+
+class Scanner:
+    """
+    Класс, отвечающий за разбор загруженной страницы приложения и генерацию данных.
+     Поля извлекаются по спецификации app_fields.json, скомпилированной один раз на процесс.
+    """
+
+    _extractor = None
+
+    def __init__(self, link: str) -> None:
+        self.link = link
+        self.app_info = dict()
+
+    def parse(self, content: bytes, encoding: Optional[str] = None) -> dict:
+        if Scanner._extractor is None:
+            Scanner._extractor = FieldExtractor.from_file()
+        self.app_info = dict(link=self.link, **self._extractor.extract(content, encoding))
+        return self.app_info
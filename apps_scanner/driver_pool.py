@@ -0,0 +1,133 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_MAX_PAGES = 20
+DEFAULT_MEMORY_LIMIT = 1024
+KB_PER_MB = 1024
+
+
+def process_tree_rss(pid: int) -> int:
+    """
+    Функция возвращает суммарную резидентную память процесса и всех его потомков в килобайтах по данным /proc.
+     Если /proc недоступен (не Linux), возвращает 0.
+    """
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status', 'r') as file:
+                for line in file:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+                        break
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children', 'r') as file:
+                    pending.extend(int(child) for child in file.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+class WebDriverPool:
+    """
+    Класс пула прогретых вэб драйверов для параллельного поиска через браузер.
+     Драйверы создаются по требованию, но не более size одновременно, и переиспользуются между запросами,
+     поэтому браузер запускается не для каждого запроса. Драйвер перезапускается после max_pages страниц
+     или если браузер (драйвер со всеми дочерними процессами) занимает больше memory_limit / size мегабайт,
+     чтобы утечки памяти браузера не накапливались.
+    :param factory - функция создания драйвера.
+    :param size - максимальное количество одновременно запущенных драйверов.
+    :param max_pages - количество страниц, после которого драйвер перезапускается.
+    :param memory_limit - ограничение памяти всех браузеров пула в мегабайтах.
+    """
+
+    def __init__(self, factory: Callable[[], object], size: int = DEFAULT_POOL_SIZE,
+                 max_pages: int = DEFAULT_MAX_PAGES, memory_limit: int = DEFAULT_MEMORY_LIMIT) -> None:
+        self.factory = factory
+        self.size = size
+        self.max_pages = max_pages
+        self.memory_limit = memory_limit
+        self.started = 0
+        self.recycled = 0
+        self._idle: List[object] = list()
+        self._pages: Dict[int, int] = dict()
+        self._running = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self) -> 'WebDriverPool':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @contextmanager
+    def driver(self) -> Iterator[object]:
+        """
+        Функция выдает свободный драйвер на время обработки одной страницы, ожидая его освобождения,
+         если все size драйверов заняты.
+        """
+        driver = self._acquire()
+        recycle = True
+        try:
+            yield driver
+            over_memory = self._over_memory(driver)
+            with self._condition:
+                self._pages[id(driver)] += 1
+                recycle = over_memory or self._pages[id(driver)] >= self.max_pages
+        finally:
+            self._release(driver, recycle)
+
+    def close(self) -> None:
+        with self._condition:
+            idle, self._idle = self._idle, list()
+            self._running -= len(idle)
+        for driver in idle:
+            self._quit(driver)
+
+    def _acquire(self) -> object:
+        with self._condition:
+            while not self._idle and self._running >= self.size:
+                self._condition.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._running += 1
+        try:
+            driver = self.factory()
+        except BaseException:
+            with self._condition:
+                self._running -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self.started += 1
+            self._pages[id(driver)] = 0
+        return driver
+
+    def _release(self, driver: object, recycle: bool) -> None:
+        with self._condition:
+            if recycle:
+                self._running -= 1
+                self.recycled += 1
+            else:
+                self._idle.append(driver)
+            self._condition.notify()
+        if recycle:
+            self._quit(driver)
+
+    def _quit(self, driver: object) -> None:
+        with self._condition:
+            self._pages.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _over_memory(self, driver: object) -> bool:
+        process = getattr(getattr(driver, 'service', None), 'process', None)
+        if process is None:
+            return False
+        return process_tree_rss(process.pid) > self.memory_limit * KB_PER_MB / self.size
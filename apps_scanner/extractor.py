@@ -0,0 +1,131 @@
+import json
+import os
+import re
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional
+
+from lxml import etree, html
+from lxml.cssselect import CSSSelector
+
+DEFAULT_SPEC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app_fields.json')
+
+FieldSpec = namedtuple('FieldSpec', ('name', 'selector', 'post', 'index', 'count', 'default'))
+
+
+def _text(element: html.HtmlElement) -> str:
+    return element.text_content()
+
+
+def _string(element: html.HtmlElement) -> Optional[str]:
+    """
+    Функция возвращает единственную строку элемента, спускаясь по единственным дочерним тегам, или None,
+     если у элемента несколько дочерних узлов (аналог .string в BeautifulSoup).
+    """
+    while len(element) == 1 and not element.text and not element[0].tail:
+        element = element[0]
+    return element.text if len(element) == 0 else None
+
+
+def _strings(element: html.HtmlElement) -> str:
+    """
+    Функция собирает строки дочерних узлов элемента (текст и дочерние теги с одной строкой) через перевод строки.
+    """
+    strings = [element.text] if element.text else []
+    for child in element:
+        string = _string(child)
+        if string:
+            strings.append(string)
+        if child.tail:
+            strings.append(child.tail)
+    return '\n'.join(strings)
+
+
+def _first_link(element: html.HtmlElement) -> str:
+    """
+    Функция возвращает текст первой ссылки внутри элемента.
+    :raise ValueError: если ссылок нет.
+    """
+    links = element.iterdescendants('a')
+    link = next(links, None)
+    if link is None:
+        raise ValueError('Ссылка не найдена')
+    return link.text_content()
+
+
+def _grouped_number(element: html.HtmlElement) -> str:
+    return '{:,d}'.format(int(re.sub(r'\D', '', element.text_content())))
+
+
+POST_PROCESSORS: Dict[str, Callable[[html.HtmlElement], str]] = {
+    'text': _text,
+    'strings': _strings,
+    'first_link': _first_link,
+    'grouped_number': _grouped_number,
+}
+
+
+class FieldExtractor:
+    """
+    Класс извлечения полей страницы по декларативной спецификации.
+     Спецификация поля: CSS селектор (или XPath с префиксом xpath:), функция пост-обработки из
+     POST_PROCESSORS, номер элемента среди найденных, ожидаемое количество найденных элементов
+     и значение по умолчанию. Селекторы компилируются в XPath один раз при создании извлекателя,
+     страница разбирается lxml в дерево один раз, после чего каждое поле - один запрос к дереву.
+    :param fields - список спецификаций полей.
+    """
+
+    def __init__(self, fields: List[FieldSpec]) -> None:
+        self.fields = fields
+        self._parsers = dict()
+        self._compiled = [(field, self._compile(field.selector), POST_PROCESSORS[field.post]) for field in fields]
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_SPEC_PATH) -> 'FieldExtractor':
+        """
+        Функция создает извлекатель из JSON файла вида {поле: {"selector": ..., "post": ..., ...}}.
+        :raise ValueError: если спецификация некорректна.
+        """
+        with open(path, 'r', encoding='utf8') as file:
+            spec = json.load(file)
+        fields = list()
+        for name, options in spec.items():
+            post = options.get('post', 'text')
+            if post not in POST_PROCESSORS:
+                raise ValueError(f'Неизвестная пост-обработка {post} поля {name}')
+            fields.append(FieldSpec(name, options['selector'], post, options.get('index', 0), options.get('count'),
+                                    options.get('default')))
+        return cls(fields)
+
+    def extract(self, content: bytes, encoding: Optional[str] = None) -> dict:
+        """
+        Функция разбирает страницу и возвращает словарь значений полей, для ненайденных полей - значения по умолчанию.
+        :param encoding - кодировка страницы из заголовков ответа, по умолчанию utf8.
+        """
+        encoding = encoding or 'utf8'
+        try:
+            if encoding not in self._parsers:
+                self._parsers[encoding] = html.HTMLParser(encoding=encoding)
+            tree = html.document_fromstring(content, parser=self._parsers[encoding])
+        except (etree.ParserError, ValueError, LookupError):
+            return {field.name: field.default for field in self.fields}
+        result = dict()
+        for field, selector, post in self._compiled:
+            result[field.name] = self._extract_field(tree, field, selector, post)
+        return result
+
+    @staticmethod
+    def _extract_field(tree: html.HtmlElement, field: FieldSpec, selector: etree.XPath,
+                       post: Callable[[html.HtmlElement], str]) -> Optional[str]:
+        elements = selector(tree)
+        if field.count is not None and len(elements) != field.count or len(elements) <= field.index:
+            return field.default
+        try:
+            return post(elements[field.index])
+        except ValueError:
+            return field.default
+
+    @staticmethod
+    def _compile(selector: str) -> etree.XPath:
+        if selector.startswith('xpath:'):
+            return etree.XPath(selector[len('xpath:'):])
+        return CSSSelector(selector, translator='html')
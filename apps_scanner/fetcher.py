@@ -0,0 +1,175 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from functools import partial
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from common.metrics import Metrics
+from common.scheduler import EXECUTOR_THREAD, Scheduler
+from response_cache import CachedResponse, ResponseCache
+
+DEFAULT_WORKERS = 16
+DEFAULT_PER_HOST_LIMIT = 8
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_TIMEOUT = 10.0
+MAX_BACKOFF = 30.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+HEADERS = {'Accept-Language': 'ru-RU,ru;q=0.5', 'Accept-Encoding': 'gzip, deflate'}
+
+
+class PooledFetcher:
+    """
+    Класс параллельной загрузки страниц через общую http сессию с пулом keep-alive подключений.
+     Запросы выполняются общим планировщиком пулом из workers потоков, к одному хосту одновременно выполняется
+     не более per_host_limit запросов и не более per_host_rate запросов в секунду, поэтому тысячи страниц
+     загружаются через несколько подключений
+     без повторных TCP и TLS рукопожатий. Ответы 429 и 5xx, а также ошибки подключения повторяются
+     до retries раз с экспоненциальной задержкой со случайным разбросом (с учетом заголовка Retry-After).
+     Ответы в gzip распаковываются requests автоматически.
+     При переданном кэше свежие ответы возвращаются без запроса, устаревшие перепроверяются условным
+     запросом (If-None-Match / If-Modified-Since), и при ответе 304 тело берется из кэша.
+     В режиме offline сеть не используется совсем: страницы, которых нет в кэше, считаются ошибкой.
+    :param workers - количество потоков загрузки.
+    :param per_host_limit - максимальное количество одновременных запросов к одному хосту.
+    :param retries - количество повторных запросов.
+    :param backoff - начальная задержка перед повтором в секундах.
+    :param timeout - время ожидания ответа в секундах.
+    :param cache - дисковый кэш ответов, по умолчанию не используется.
+    :param offline - отдавать страницы только из кэша.
+    :param rate - максимальное количество запросов в секунду, 0 - без ограничения.
+    :param per_host_rate - максимальное количество запросов в секунду к одному хосту, 0 - без ограничения.
+    :param metrics - набор метрик: длительность запросов (fetch), источник страниц (fetches), статусы
+     ответов (responses) и повторы (retries).
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+                 retries: int = DEFAULT_RETRIES, backoff: float = DEFAULT_BACKOFF,
+                 timeout: float = DEFAULT_TIMEOUT, cache: Optional[ResponseCache] = None,
+                 offline: bool = False, rate: float = 0, per_host_rate: float = 0,
+                 metrics: Optional[Metrics] = None) -> None:
+        if offline and cache is None:
+            raise ValueError('Режим offline требует кэша ответов')
+        self.workers = workers
+        self.per_host_limit = per_host_limit
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache
+        self.offline = offline
+        self.metrics = metrics or Metrics()
+        self.scheduler = Scheduler(EXECUTOR_THREAD, workers, rate=rate, per_target_rate=per_host_rate,
+                                   target_key=lambda url: urlsplit(url).netloc, metrics=self.metrics)
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._host_limits: Dict[str, threading.BoundedSemaphore] = defaultdict(
+            lambda: threading.BoundedSemaphore(per_host_limit))
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> 'PooledFetcher':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def fetch(self, url: str, **kwargs) -> requests.Response:
+        """
+        Функция загружает страницу с повторами при временных ошибках, используя кэш, если он задан.
+        :raise requests.RequestException: если страницу не удалось загрузить после всех повторов
+         или в режиме offline ее нет в кэше.
+        """
+        if self.cache is None:
+            self.metrics.inc('fetches', source='network')
+            return self._fetch(url, **kwargs)
+        headers = dict(kwargs.pop('headers', None) or {})
+        key_headers = {'Accept-Language': self.session.headers.get('Accept-Language'), **headers}
+        entry = self.cache.get(url, key_headers)
+        if entry is not None and (self.offline or entry.expires > time.time()):
+            self.metrics.inc('fetches', source='cache')
+            return self._cached_response(entry)
+        if self.offline:
+            raise requests.RequestException(f'Страница {url} отсутствует в кэше')
+        if entry is not None and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        response = self._fetch(url, headers=headers, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            self.cache.refresh(url, key_headers, response.headers)
+            self.metrics.inc('fetches', source='revalidated')
+            return self._cached_response(entry)
+        self.metrics.inc('fetches', source='network')
+        if response.status_code == 200:
+            self.cache.put(url, key_headers, response.status_code, response.headers, response.content)
+        return response
+
+    def _fetch(self, url: str, **kwargs) -> requests.Response:
+        host = urlsplit(url).netloc
+        with self._lock:
+            host_limit = self._host_limits[host]
+        for attempt in range(self.retries + 1):
+            with host_limit:
+                try:
+                    with self.metrics.timer('fetch'):
+                        response = self.session.get(url, timeout=self.timeout, **kwargs)
+                    self.metrics.inc('responses', status=response.status_code)
+                except (requests.ConnectionError, requests.Timeout):
+                    self.metrics.inc('responses', status='error')
+                    if attempt == self.retries:
+                        raise
+                    response = None
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return response
+            self.metrics.inc('retries')
+            if response is not None and attempt == self.retries:
+                response.raise_for_status()
+            time.sleep(self._delay(attempt, response))
+        raise requests.RequestException(f'Не удалось загрузить {url}')
+
+    def fetch_all(self, urls: Iterable[str],
+                  **kwargs) -> Iterator[Tuple[str, Union[requests.Response, requests.RequestException]]]:
+        """
+        Функция параллельно загружает страницы и выдает пары (ссылка, ответ или ошибка) по мере готовности.
+         Ссылки берутся из urls по мере освобождения потоков, после отмены планировщика новые загрузки не начинаются.
+        :raise Exception: ошибки, не связанные с загрузкой страницы.
+        """
+        for url, result in self.scheduler.run(partial(self.fetch, **kwargs), urls):
+            if isinstance(result, Exception) and not isinstance(result, requests.RequestException):
+                raise result
+            yield url, result
+
+    def close(self) -> None:
+        self.session.close()
+
+    @staticmethod
+    def _cached_response(entry: CachedResponse) -> requests.Response:
+        """
+        Функция собирает объект ответа requests из записи кэша.
+        """
+        response = requests.Response()
+        response.status_code = entry.status
+        response.url = entry.url
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = entry.body
+        return response
+
+    def _delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        """
+        Функция рассчитывает задержку перед повтором: значение Retry-After, если оно указано в секундах,
+         иначе backoff * 2^attempt со случайным множителем от 0.5 до 1.5.
+        """
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), MAX_BACKOFF)
+        return min(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5), MAX_BACKOFF)
@@ -0,0 +1,141 @@
+import json
+import re
+import sqlite3
+import time
+from typing import List, Optional
+
+SCHEMA_VERSION = 1
+COMMIT_EVERY = 1000
+TRACKED_FIELDS = ('average_rate', 'rates_count', 'last_update')
+
+CHANGE_NEW = 'new'
+CHANGE_CHANGED = 'changed'
+
+
+def _to_float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value.replace(',', '.'))
+    except (AttributeError, ValueError):
+        return None
+
+
+def _to_int(value: Optional[str]) -> Optional[int]:
+    digits = re.sub(r'\D', '', value or '')
+    return int(digits) if digits else None
+
+
+class AppHistory:
+    """
+    Класс локального хранилища результатов сканирования приложений в SQLite с ключом по ссылке.
+     Для каждого приложения хранятся последние извлеченные поля и отпечаток карточки в выдаче поиска:
+     если отпечаток не изменился, страница приложения повторно не загружается. Изменения оценки,
+     количества оценок и даты обновления записываются в таблицу истории, индексированную по ссылке
+     и времени, что позволяет быстро получать историю приложения и изменения за период.
+    :param path - путь к файлу базы данных.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.connection = None
+        self._uncommitted = 0
+
+    def __enter__(self) -> 'AppHistory':
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def open(self) -> None:
+        """
+        Функция открывает базу данных и создает таблицы при первом запуске.
+        :raise ValueError: если база создана другой версией схемы.
+        """
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        version, = self.connection.execute('PRAGMA user_version').fetchone()
+        if version not in (0, SCHEMA_VERSION):
+            self.connection.close()
+            raise ValueError(f'База {self.path} создана для версии схемы {version}, ожидается {SCHEMA_VERSION}')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS apps (link TEXT PRIMARY KEY, fingerprint TEXT, '
+                                'info TEXT NOT NULL, first_seen REAL NOT NULL, checked REAL NOT NULL)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS history (link TEXT NOT NULL, observed REAL NOT NULL, '
+                                'average_rate REAL, rates_count INTEGER, last_update TEXT)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS history_link_observed ON history (link, observed)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS history_observed ON history (observed)')
+        self.connection.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        self.connection.commit()
+
+    def unchanged(self, link: str, fingerprint: Optional[str]) -> Optional[dict]:
+        """
+        Функция возвращает сохраненные поля приложения, если отпечаток карточки в выдаче не изменился, иначе None.
+        """
+        if fingerprint is None:
+            return None
+        row = self.connection.execute('SELECT info FROM apps WHERE link = ? AND fingerprint = ?',
+                                      (link, fingerprint)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def record(self, app_info: dict, fingerprint: Optional[str], observed: Optional[float] = None) -> Optional[str]:
+        """
+        Функция сохраняет поля приложения и отпечаток карточки и дописывает историю, если отслеживаемые поля
+         изменились.
+        :return: CHANGE_NEW, CHANGE_CHANGED или None, если отслеживаемые поля не изменились.
+        """
+        observed = observed or time.time()
+        link = app_info['link']
+        row = self.connection.execute('SELECT info, first_seen FROM apps WHERE link = ?', (link,)).fetchone()
+        change = None
+        if row is None:
+            change = CHANGE_NEW
+        else:
+            previous = json.loads(row[0])
+            if any(previous.get(field) != app_info.get(field) for field in TRACKED_FIELDS):
+                change = CHANGE_CHANGED
+        if change is not None:
+            self.connection.execute('INSERT INTO history VALUES (?, ?, ?, ?, ?)',
+                                    (link, observed, _to_float(app_info.get('average_rate')),
+                                     _to_int(app_info.get('rates_count')), app_info.get('last_update')))
+        self.connection.execute('INSERT OR REPLACE INTO apps VALUES (?, ?, ?, ?, ?)',
+                                (link, fingerprint, json.dumps(app_info, ensure_ascii=False),
+                                 row[1] if row is not None else observed, observed))
+        self._count_write()
+        return change
+
+    def touch(self, link: str, observed: Optional[float] = None) -> None:
+        """
+        Функция отмечает время проверки приложения, страница которого не загружалась.
+        """
+        self.connection.execute('UPDATE apps SET checked = ? WHERE link = ?', (observed or time.time(), link))
+        self._count_write()
+
+    def history(self, link: str) -> List[dict]:
+        """
+        Функция возвращает историю изменений приложения в порядке времени.
+        """
+        rows = self.connection.execute('SELECT observed, average_rate, rates_count, last_update FROM history '
+                                       'WHERE link = ? ORDER BY observed', (link,)).fetchall()
+        return [dict(zip(('observed', ) + TRACKED_FIELDS, row)) for row in rows]
+
+    def changed_since(self, since: float) -> List[str]:
+        """
+        Функция возвращает ссылки приложений, изменившихся после момента времени since.
+        """
+        rows = self.connection.execute('SELECT DISTINCT link FROM history WHERE observed >= ?', (since,)).fetchall()
+        return [row[0] for row in rows]
+
+    def commit(self) -> None:
+        self.connection.commit()
+        self._uncommitted = 0
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+
+    def _count_write(self) -> None:
+        self._uncommitted += 1
+        if self._uncommitted >= COMMIT_EVERY:
+            self.commit()
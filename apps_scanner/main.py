@@ -1,5 +1,15 @@
 # -*- coding: utf-8 -*-
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from apps_scanner import AppsScanner
+from common.scheduler import interrupt_handler
+from common.sinks import SINK_FORMATS
+from driver_pool import DEFAULT_MAX_PAGES, DEFAULT_MEMORY_LIMIT, DEFAULT_POOL_SIZE
+from fetcher import DEFAULT_PER_HOST_LIMIT, DEFAULT_WORKERS
+from response_cache import DEFAULT_MAX_SIZE, DEFAULT_TTL
 import argparse
 
 
@@ -7,15 +17,72 @@ def main():
     parser = argparse.ArgumentParser(prog='',
                                      description='Консольное приложение для парсинга приложений в google play.',
                                      usage='%(prog)s [options]')
-    parser.add_argument('app_name', type=str, help='название приложения для поиска(например сбербанк)')
+    parser.add_argument('app_name', type=str, nargs='*',
+                        help='название приложения для поиска(например сбербанк), можно указать несколько')
+    parser.add_argument('--names_file', type=str, default=None,
+                        help="Файл с названиями приложений для поиска, по одному на строку")
 
     parser.add_argument('--json_file', type=str, default='data.json', help="Файл для сохранения результата."
                                                                            "По умолчанию data.json")
+    parser.add_argument('--log_format', type=str, default=None, choices=list(SINK_FORMATS),
+                        help="Формат файла результата. По умолчанию определяется по расширению файла")
+    parser.add_argument('--browser', action='store_true',
+                        help="Искать приложения через браузер (selenium). По умолчанию браузер используется, "
+                             "только если поиск без браузера не дал результатов")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"Количество потоков загрузки страниц приложений. По умолчанию {DEFAULT_WORKERS}")
+    parser.add_argument('--per_host_limit', type=int, default=DEFAULT_PER_HOST_LIMIT,
+                        help=f"Максимальное количество одновременных запросов к одному хосту. "
+                             f"По умолчанию {DEFAULT_PER_HOST_LIMIT}")
+    parser.add_argument('--cache_dir', type=str, default=None,
+                        help="Каталог дискового кэша страниц приложений. По умолчанию кэш не используется")
+    parser.add_argument('--cache_ttl', type=float, default=DEFAULT_TTL,
+                        help=f"Время жизни записи кэша в секундах, если сервер не указал max-age. "
+                             f"По умолчанию {DEFAULT_TTL}")
+    parser.add_argument('--cache_size', type=int, default=DEFAULT_MAX_SIZE // 2 ** 20,
+                        help=f"Максимальный размер кэша в мегабайтах. По умолчанию {DEFAULT_MAX_SIZE // 2 ** 20}")
+    parser.add_argument('--offline', action='store_true',
+                        help="Не обращаться к сети, разобрать закэшированные страницы приложений. Требует --cache_dir")
+    parser.add_argument('--drivers', type=int, default=DEFAULT_POOL_SIZE,
+                        help=f"Количество одновременно запущенных браузеров при поиске через браузер. "
+                             f"По умолчанию {DEFAULT_POOL_SIZE}")
+    parser.add_argument('--driver_pages', type=int, default=DEFAULT_MAX_PAGES,
+                        help=f"Количество страниц, после которого браузер перезапускается. "
+                             f"По умолчанию {DEFAULT_MAX_PAGES}")
+    parser.add_argument('--driver_memory', type=int, default=DEFAULT_MEMORY_LIMIT,
+                        help=f"Ограничение памяти всех браузеров в мегабайтах, браузер, превысивший свою долю, "
+                             f"перезапускается. По умолчанию {DEFAULT_MEMORY_LIMIT}")
+    parser.add_argument('--history_db', type=str, default=None,
+                        help="База SQLite истории приложений: изменения оценок и дат обновления записываются "
+                             "в историю, страницы приложений с неизменившейся карточкой в выдаче "
+                             "не загружаются повторно")
+    parser.add_argument('--max_rate', type=float, default=0,
+                        help="Максимальное количество запросов страниц приложений в секунду. "
+                             "По умолчанию без ограничения")
+    parser.add_argument('--per_target_rate', type=float, default=0,
+                        help="Максимальное количество запросов в секунду к одному хосту. "
+                             "По умолчанию без ограничения")
+    parser.add_argument('--metrics_file', type=str, default=None,
+                        help="Файл, в который раз в секунду записываются метрики скана в формате Prometheus")
+    parser.add_argument('--metrics_listen', type=str, default=None,
+                        help="Адрес host:port, по которому метрики отдаются по HTTP на пути /metrics "
+                             "(например 127.0.0.1:9100)")
+    parser.add_argument('--progress', action='store_true',
+                        help="Выводить строку прогресса (скорость, длительность загрузки и разбора) на stderr")
     args = parser.parse_args()
+    if args.offline and not args.cache_dir:
+        parser.error('--offline требует --cache_dir')
     args_dict = vars(args)
+    names_file = args_dict.pop('names_file')
+    if names_file:
+        with open(names_file, 'r', encoding='utf8') as file:
+            args_dict['app_name'].extend(line.strip() for line in file if line.strip())
+    if not args_dict['app_name']:
+        parser.error('укажите название приложения или --names_file')
     scanner = AppsScanner(**args_dict)
     scanner.start()
-    scanner.join()
+    with interrupt_handler(lambda: None):
+        scanner.join()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import re
+from collections import defaultdict
+from html.parser import HTMLParser
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+BASE_LINK = 'https://play.google.com'
+DETAILS_PATH = '/store/apps/details?id='
+BATCH_PATH = '/_/PlayStoreUi/data/batchexecute'
+SEARCH_RPC_ID = 'qnKhOb'
+CHUNK_SIZE = 16384
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_MAX_PAGES = 10
+HEADERS = {'Accept-Language': 'ru-RU,ru;q=0.5',
+           'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0'}
+# Токен продолжения выдачи: длинная base64 строка, которая передается в запрос следующей страницы.
+TOKEN_PATTERN = re.compile(r'"(C[A-Za-z0-9_\-]{40,}={0,2})"')
+DETAILS_PATTERN = re.compile(r'/store/apps/details\?id=([A-Za-z0-9_.]+)')
+SearchResult = Tuple[str, Optional[str]]
+
+
+class _SearchPageParser(HTMLParser):
+    """
+    Инкрементальный парсер страницы поиска: html подается частями по мере загрузки, найденные
+     ссылки на приложения накапливаются в results. Ссылка выдается, когда стало известно название
+     приложения (текст внутри ссылки), ссылки без названия выдаются в конце документа.
+     Тексты всех ссылок на приложение (название, разработчик, оценка) собираются в listings для отпечатка карточки.
+     Из встроенных скриптов извлекается токен продолжения выдачи.
+    """
+
+    def __init__(self) -> None:
+        super(_SearchPageParser, self).__init__(convert_charrefs=True)
+        self.results: List[SearchResult] = list()
+        self.token = None
+        self.listings: Dict[str, List[str]] = defaultdict(list)
+        self._names = dict()
+        self._link = None
+        self._text = list()
+        self._in_script = False
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag == 'script':
+            self._in_script = True
+        elif tag == 'a':
+            href = dict(attrs).get('href') or ''
+            match = DETAILS_PATTERN.search(href)
+            if match:
+                self._link = DETAILS_PATH + match.group(1)
+                self._text = list()
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == 'script':
+            self._in_script = False
+        elif tag == 'a' and self._link:
+            name = ' '.join(''.join(self._text).split()) or None
+            if name:
+                self.listings[self._link].append(name)
+            if self._link not in self._names:
+                self._names[self._link] = None
+            if name and self._names[self._link] is None:
+                self._names[self._link] = name
+                self.results.append((self._link, name))
+            self._link = None
+
+    def handle_data(self, data: str) -> None:
+        if self._link:
+            self._text.append(data)
+        elif self._in_script and self.token is None:
+            match = TOKEN_PATTERN.search(data)
+            if match:
+                self.token = match.group(1)
+
+    def close(self) -> None:
+        super(_SearchPageParser, self).close()
+        self.results.extend((link, None) for link, name in self._names.items() if name is None)
+
+
+class PlayStoreSearch:
+    """
+    Класс поиска приложений в Google Play без браузера.
+     Первая страница выдачи загружается обычным http запросом и разбирается по частям по мере загрузки,
+     следующие страницы запрашиваются через batchexecute endpoint с токеном продолжения, пока
+     выдача не закончится или не будет достигнуто max_pages страниц.
+     После разбора первой страницы в fingerprints доступны отпечатки карточек приложений (sha1 их текста):
+     если отпечаток не изменился, страницу приложения можно не загружать повторно.
+    :param session - http сессия, по умолчанию создается новая.
+    :param base_link - адрес магазина (можно подменить на локальный сервер с записанными ответами).
+    :param max_pages - максимальное количество страниц выдачи.
+    :param timeout - время ожидания ответа в секундах.
+    """
+
+    def __init__(self, session: Optional[requests.Session] = None, base_link: str = BASE_LINK,
+                 max_pages: int = DEFAULT_MAX_PAGES, timeout: float = DEFAULT_TIMEOUT) -> None:
+        self.session = session or requests.Session()
+        self.base_link = base_link
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self.fingerprints: Dict[str, str] = dict()
+
+    def search(self, query: str) -> Iterator[SearchResult]:
+        """
+        Функция выдает пары (относительная ссылка на приложение, название или None) по мере разбора выдачи.
+        :raise requests.RequestException: если первая страница выдачи недоступна.
+        """
+        seen = set()
+        parser = _SearchPageParser()
+        with self.session.get(f'{self.base_link}/store/search', params={'q': query, 'c': 'apps'},
+                              headers=HEADERS, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            response.encoding = response.encoding or 'utf8'
+            for chunk in response.iter_content(CHUNK_SIZE, decode_unicode=True):
+                parser.feed(chunk)
+                yield from self._drain(parser.results, seen)
+        parser.close()
+        for link, texts in parser.listings.items():
+            self.fingerprints[link] = hashlib.sha1('\n'.join(texts).encode('utf8')).hexdigest()
+        yield from self._drain(parser.results, seen)
+        token = parser.token
+        for _ in range(self.max_pages - 1):
+            if token is None:
+                return
+            try:
+                results, next_token = self._fetch_batch(token)
+            except (requests.RequestException, ValueError):
+                return
+            if not results:
+                return
+            yield from self._drain(results, seen)
+            token = next_token if next_token != token else None
+
+    def _fetch_batch(self, token: str) -> Tuple[List[SearchResult], Optional[str]]:
+        """
+        Функция запрашивает следующую страницу выдачи по токену продолжения.
+        """
+        request = json.dumps([[None, [[10, [10, 50]], True, None, [96, 27, 4, 8, 57, 30, 110, 79, 11, 16, 49, 1, 3, 9,
+                                                                12, 104, 55, 56, 51, 10, 34, 77]], None, token]])
+        data = {'f.req': json.dumps([[[SEARCH_RPC_ID, request, None, 'generic']]])}
+        response = self.session.post(f'{self.base_link}{BATCH_PATH}', params={'rpcids': SEARCH_RPC_ID},
+                                     data=data, headers=HEADERS, timeout=self.timeout)
+        response.raise_for_status()
+        return self.parse_batch(response.text)
+
+    @staticmethod
+    def parse_batch(text: str) -> Tuple[List[SearchResult], Optional[str]]:
+        """
+        Функция разбирает ответ batchexecute: строки с JSON массивами после защитного префикса )]}'.
+         Полезная нагрузка - JSON строка, она декодируется заново, чтобы снять экранирование символов.
+         Из полезной нагрузки ответа на запрос поиска извлекаются ссылки на приложения (названия
+         в ответе не размечены и проверяются по странице приложения) и следующий токен продолжения.
+        :raise ValueError: если ответ не содержит данных поиска.
+        """
+        payloads = list()
+        for line in text.splitlines():
+            if not line.startswith('['):
+                continue
+            try:
+                envelopes = json.loads(line)
+            except ValueError:
+                continue
+            for envelope in envelopes:
+                if isinstance(envelope, list) and len(envelope) > 2 and envelope[:2] == ['wrb.fr', SEARCH_RPC_ID]:
+                    if isinstance(envelope[2], str):
+                        payloads.append(json.dumps(json.loads(envelope[2]), ensure_ascii=False))
+        if not payloads:
+            raise ValueError('Ответ batchexecute не содержит данных поиска')
+        payload = ''.join(payloads)
+        links = list(dict.fromkeys(DETAILS_PATH + app_id for app_id in DETAILS_PATTERN.findall(payload)))
+        token = TOKEN_PATTERN.search(payload)
+        return [(link, None) for link in links], token.group(1) if token else None
+
+    @staticmethod
+    def _drain(results: List[SearchResult], seen: set) -> Iterator[SearchResult]:
+        pending = list(results)
+        results.clear()
+        for link, name in pending:
+            if link not in seen:
+                seen.add(link)
+                yield link, name
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+DEFAULT_TTL = 24 * 3600
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+EVICTION_RATIO = 0.9
+SCHEMA_VERSION = 1
+STORED_HEADERS = ('content-type', 'etag', 'last-modified', 'cache-control')
+
+CachedResponse = namedtuple('CachedResponse', ('url', 'status', 'headers', 'body', 'etag', 'last_modified',
+                                               'expires'))
+
+
+class ResponseCache:
+    """
+    Класс дискового кэша http ответов.
+     Индекс хранится в SQLite, тела ответов - в сжатых zlib файлах, названных по sha256 содержимого,
+     поэтому одинаковые тела хранятся один раз. Ключ записи - sha256 от ссылки и заголовков запроса,
+     влияющих на ответ. Вместе с телом сохраняются ETag и Last-Modified для условных запросов.
+     Запись свежая в течение max-age из Cache-Control или ttl секунд, при превышении max_size байт
+     сжатых тел удаляются давно не использованные записи. Безопасен для использования из нескольких потоков.
+    :param path - каталог кэша.
+    :param ttl - время жизни записи по умолчанию в секундах.
+    :param max_size - максимальный размер сжатых тел в байтах.
+    """
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.blobs_path = os.path.join(path, 'blobs')
+        self.connection = None
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> 'ResponseCache':
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def open(self) -> None:
+        """
+        Функция открывает индекс кэша, создавая каталог и таблицу при первом запуске.
+        """
+        os.makedirs(self.blobs_path, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(self.path, 'index.db'), check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        version, = self.connection.execute('PRAGMA user_version').fetchone()
+        if version not in (0, SCHEMA_VERSION):
+            self.connection.execute('DROP TABLE IF EXISTS responses')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, url TEXT NOT NULL, '
+                                'status INTEGER, headers TEXT, blob TEXT NOT NULL, size INTEGER NOT NULL, '
+                                'etag TEXT, last_modified TEXT, expires REAL NOT NULL, accessed REAL NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self.connection.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        self.connection.commit()
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+
+    @staticmethod
+    def key(url: str, headers: Optional[Dict[str, str]] = None) -> str:
+        """
+        Функция вычисляет ключ записи по ссылке и заголовкам запроса.
+        """
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        data = json.dumps([url, sorted(headers.items())], ensure_ascii=False)
+        return hashlib.sha256(data.encode('utf8')).hexdigest()
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> Optional[CachedResponse]:
+        """
+        Функция возвращает запись кэша (в том числе устаревшую, для условного запроса) или None.
+        """
+        key = self.key(url, headers)
+        with self._lock:
+            row = self.connection.execute('SELECT url, status, headers, blob, etag, last_modified, expires '
+                                          'FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (time.time(), key))
+        try:
+            with open(os.path.join(self.blobs_path, row[3]), 'rb') as file:
+                body = zlib.decompress(file.read())
+        except (OSError, zlib.error):
+            return None
+        return CachedResponse(row[0], row[1], json.loads(row[2]), body, row[4], row[5], row[6])
+
+    def put(self, url: str, headers: Optional[Dict[str, str]], status: int, response_headers: Dict[str, str],
+            body: bytes) -> None:
+        """
+        Функция сохраняет ответ и при необходимости удаляет давно не использованные записи.
+        """
+        blob = hashlib.sha256(body).hexdigest()
+        blob_path = os.path.join(self.blobs_path, blob)
+        if not os.path.exists(blob_path):
+            tmp_path = f'{blob_path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as file:
+                file.write(zlib.compress(body))
+            os.replace(tmp_path, blob_path)
+        stored = {name.lower(): value for name, value in response_headers.items() if name.lower() in STORED_HEADERS}
+        now = time.time()
+        with self._lock:
+            self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                    (self.key(url, headers), url, status, json.dumps(stored), blob,
+                                     os.path.getsize(blob_path), stored.get('etag'), stored.get('last-modified'),
+                                     now + self._ttl(stored), now))
+            self.connection.commit()
+            self._evict()
+
+    def refresh(self, url: str, headers: Optional[Dict[str, str]], response_headers: Dict[str, str]) -> None:
+        """
+        Функция продлевает срок жизни записи после ответа 304 Not Modified.
+        """
+        stored = {name.lower(): value for name, value in response_headers.items() if name.lower() in STORED_HEADERS}
+        now = time.time()
+        with self._lock:
+            self.connection.execute('UPDATE responses SET expires = ?, accessed = ? WHERE key = ?',
+                                    (now + self._ttl(stored), now, self.key(url, headers)))
+            self.connection.commit()
+
+    def urls(self, prefix: str = '') -> List[str]:
+        """
+        Функция возвращает ссылки закэшированных ответов, начинающиеся с prefix.
+        """
+        with self._lock:
+            rows = self.connection.execute('SELECT DISTINCT url FROM responses WHERE substr(url, 1, ?) = ?',
+                                           (len(prefix), prefix)).fetchall()
+        return [row[0] for row in rows]
+
+    def _ttl(self, headers: Dict[str, str]) -> float:
+        match = re.search(r'max-age=(\d+)', headers.get('cache-control', ''))
+        if match and 'no-cache' not in headers.get('cache-control', ''):
+            return int(match.group(1))
+        return self.ttl
+
+    def _evict(self) -> None:
+        """
+        Функция удаляет давно не использованные записи, пока размер тел не станет меньше
+         EVICTION_RATIO * max_size. Файл тела удаляется, когда на него не осталось ссылок.
+        """
+        total, = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()
+        if total <= self.max_size:
+            return
+        rows = self.connection.execute('SELECT key, blob, size FROM responses ORDER BY accessed').fetchall()
+        for key, blob, size in rows:
+            if total <= self.max_size * EVICTION_RATIO:
+                break
+            self.connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            references, = self.connection.execute('SELECT COUNT(*) FROM responses WHERE blob = ?', (blob,)).fetchone()
+            if not references:
+                try:
+                    os.remove(os.path.join(self.blobs_path, blob))
+                except OSError:
+                    pass
+        self.connection.commit()
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib import error, request
+
+DEFAULT_ADDRESS = '127.0.0.1:8750'
+DEFAULT_LEASE_TIMEOUT = 60.0
+DEFAULT_HEARTBEAT_INTERVAL = 10.0
+DEFAULT_POLL_INTERVAL = 1.0
+HEARTBEATS_PER_LEASE = 3
+REQUEST_TIMEOUT = 30.0
+REQUEST_RETRIES = 5
+LEASE_PATH = '/lease'
+SUBMIT_PATH = '/submit'
+STATUS_WAIT = 204
+STATUS_FINISHED = 410
+STATUS_LOST = 409
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """
+    Функция разбирает адрес вида host:port.
+    :raise ValueError: если адрес задан неверно.
+    """
+    host, _, port = address.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f'Неверный адрес {address}, ожидается host:port')
+    return host.strip('[]'), int(port)
+
+
+class _LeaseState:
+    __slots__ = ('payload', 'token', 'worker', 'deadline', 'records')
+
+    def __init__(self, payload: Any, token: str, worker: str, deadline: float) -> None:
+        self.payload = payload
+        self.token = token
+        self.worker = worker
+        self.deadline = deadline
+        self.records = list()
+
+
+class Coordinator:
+    """
+    Класс координатора распределенного скана.
+     Пространство целей заранее разбито сканером на аренды (сериализуемые в JSON описания шардов),
+     которые лениво берутся из итератора leases и выдаются воркерам по HTTP: POST /lease выдает аренду,
+     POST /submit принимает пачку результатов аренды и продлевает ее, последняя пачка завершает аренду.
+     Результаты аренды накапливаются и передаются сканеру только после ее завершения, поэтому аренда,
+     не продленная за lease_timeout секунд, выдается другому воркеру без дублирования результатов.
+     Обработчик результатов вызывается в потоке, вызвавшем run, а не в потоках HTTP сервера.
+    :param leases - итератор описаний аренд.
+    :param address - адрес host:port для приема воркеров.
+    :param lease_timeout - время жизни аренды без продления в секундах.
+    """
+
+    def __init__(self, leases: Iterable[Any], address: str = DEFAULT_ADDRESS,
+                 lease_timeout: float = DEFAULT_LEASE_TIMEOUT) -> None:
+        self.address = parse_address(address)
+        self.lease_timeout = lease_timeout
+        self.issued = 0
+        self.completed = 0
+        self.reassigned = 0
+        self.workers = set()
+        self._leases = iter(leases)
+        self._exhausted = False
+        self._active: Dict[int, _LeaseState] = dict()
+        self._expired = deque()
+        self._results = queue.Queue()
+        self._next_id = 0
+        self._cancelled = False
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2] if self._server else self.address
+        if host in ('', '0.0.0.0', '::'):
+            host = '127.0.0.1'
+        return f'http://{host}:{port}'
+
+    @property
+    def finished(self) -> bool:
+        return self._cancelled or (self._exhausted and not self._active and not self._expired)
+
+    def start(self) -> None:
+        """
+        Функция запускает HTTP сервер координатора в фоновом потоке.
+        """
+        self._server = ThreadingHTTPServer(self.address, self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def run(self, on_results: Callable[[List[Any]], None]) -> None:
+        """
+        Функция передает результаты завершенных аренд в on_results, пока все аренды не будут завершены
+         или координатор не будет остановлен.
+        """
+        while True:
+            try:
+                records = self._results.get(timeout=DEFAULT_POLL_INTERVAL)
+            except queue.Empty:
+                with self._lock:
+                    self._reap()
+                    if self.finished and self._results.empty():
+                        return
+                continue
+            on_results(records)
+
+    def cancel(self) -> None:
+        self._cancelled = True
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def acquire(self, worker: str) -> Tuple[int, Optional[dict]]:
+        """
+        Функция выдает воркеру аренду: сначала просроченные, затем новые из итератора.
+        :return: HTTP статус и описание аренды.
+        """
+        with self._lock:
+            self.workers.add(worker)
+            self._reap()
+            if self._cancelled:
+                return STATUS_FINISHED, None
+            if self._expired:
+                lease_id, payload = self._expired.popleft()
+                self.reassigned += 1
+            else:
+                payload = next(self._leases, None) if not self._exhausted else None
+                if payload is None:
+                    self._exhausted = True
+                    return (STATUS_FINISHED if self.finished else STATUS_WAIT), None
+                lease_id = self._next_id
+                self._next_id += 1
+            token = uuid.uuid4().hex
+            self._active[lease_id] = _LeaseState(payload, token, worker, time.monotonic() + self.lease_timeout)
+            self.issued += 1
+            return 200, {'lease': lease_id, 'token': token, 'payload': payload, 'lease_timeout': self.lease_timeout}
+
+    def submit(self, lease_id: int, token: str, records: List[Any], done: bool) -> int:
+        """
+        Функция принимает пачку результатов аренды и продлевает ее.
+        :return: HTTP статус, STATUS_LOST - если аренда просрочена и передана другому воркеру.
+        """
+        with self._lock:
+            state = self._active.get(lease_id)
+            if state is None or state.token != token:
+                return STATUS_LOST
+            state.deadline = time.monotonic() + self.lease_timeout
+            state.records.extend(records)
+            if done:
+                del self._active[lease_id]
+                self.completed += 1
+                self._results.put(state.records)
+            return 200
+
+    def _reap(self) -> None:
+        now = time.monotonic()
+        for lease_id, state in list(self._active.items()):
+            if state.deadline < now:
+                del self._active[lease_id]
+                self._expired.append((lease_id, state.payload))
+
+    def _handler_class(self) -> type:
+        coordinator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                try:
+                    body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                    if self.path == LEASE_PATH:
+                        status, data = coordinator.acquire(str(body.get('worker')))
+                    elif self.path == SUBMIT_PATH:
+                        status = coordinator.submit(int(body['lease']), str(body['token']), list(body['records']),
+                                                    bool(body['done']))
+                        data = None
+                    else:
+                        status, data = 404, None
+                except (ValueError, KeyError, TypeError):
+                    status, data = 400, None
+                payload = json.dumps(data).encode('utf8') if data is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+
+class Lease:
+    """
+    Класс аренды, выданной воркеру. Результаты копятся в буфере и отправляются координатору
+     фоновым потоком клиента (что заодно продлевает аренду) и при завершении аренды.
+     Если координатор передал аренду другому воркеру, lost становится True и обработку можно прервать.
+    """
+
+    def __init__(self, client: 'LeaseClient', lease_id: int, token: str, payload: Any) -> None:
+        self.client = client
+        self.id = lease_id
+        self.token = token
+        self.payload = payload
+        self.lost = False
+        self.done = False
+        self._buffer = list()
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    def emit(self, records: List[Any]) -> None:
+        with self._lock:
+            self._buffer.extend(records)
+
+    def flush(self, done: bool = False) -> None:
+        with self._send_lock:
+            if self.lost or self.done:
+                return
+            with self._lock:
+                records, self._buffer = self._buffer, list()
+            status = self.client.post(SUBMIT_PATH, {'lease': self.id, 'token': self.token, 'records': records,
+                                                    'done': done})[0]
+            if status == STATUS_LOST:
+                self.lost = True
+            self.done = done
+
+
+class LeaseClient:
+    """
+    Класс клиента воркера распределенного скана: получает аренды у координатора, пока они не закончатся,
+     и в фоновом потоке раз в heartbeat_interval секунд отправляет накопленные результаты текущей аренды.
+    :param url - адрес координатора (например http://10.0.0.1:8750).
+    :param worker - идентификатор воркера, по умолчанию имя хоста и pid.
+    :param heartbeat_interval - интервал отправки результатов и продления аренды в секундах,
+     уменьшается до трети времени жизни аренды, заданного координатором.
+    """
+
+    def __init__(self, url: str, worker: Optional[str] = None,
+                 heartbeat_interval: float = DEFAULT_HEARTBEAT_INTERVAL) -> None:
+        self.url = url.rstrip('/')
+        self.worker = worker or f'{socket.gethostname()}-{os.getpid()}'
+        self.heartbeat_interval = heartbeat_interval
+        self.completed = 0
+        self._current: Optional[Lease] = None
+        self._stopped = False
+        self._wakeup = threading.Event()
+
+    def leases(self) -> Iterator[Lease]:
+        """
+        Функция выдает аренды по одной, после обработки аренда завершается отправкой оставшихся результатов.
+        :raise ConnectionError: если координатор недоступен.
+        """
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        try:
+            while True:
+                status, data = self.post(LEASE_PATH, {'worker': self.worker})
+                if status == STATUS_FINISHED:
+                    return
+                if status == STATUS_WAIT or data is None:
+                    time.sleep(DEFAULT_POLL_INTERVAL)
+                    continue
+                self.heartbeat_interval = min(self.heartbeat_interval, data['lease_timeout'] / HEARTBEATS_PER_LEASE)
+                self._current = Lease(self, data['lease'], data['token'], data['payload'])
+                self._wakeup.set()
+                yield self._current
+                self._current.flush(done=True)
+                self.completed += not self._current.lost
+                self._current = None
+        finally:
+            self._stopped = True
+            self._wakeup.set()
+
+    def post(self, path: str, body: dict) -> Tuple[int, Optional[dict]]:
+        """
+        Функция отправляет JSON запрос координатору с повторами при ошибках подключения.
+        :raise ConnectionError: если координатор недоступен после всех повторов.
+        """
+        data = json.dumps(body).encode('utf8')
+        for attempt in range(REQUEST_RETRIES):
+            req = request.Request(self.url + path, data=data, headers={'Content-Type': 'application/json'})
+            try:
+                with request.urlopen(req, timeout=REQUEST_TIMEOUT) as response:
+                    content = response.read()
+                    return response.status, json.loads(content) if content else None
+            except error.HTTPError as err:
+                return err.code, None
+            except (error.URLError, OSError):
+                time.sleep(min(2 ** attempt, DEFAULT_HEARTBEAT_INTERVAL))
+        raise ConnectionError(f'Координатор {self.url} недоступен')
+
+    def _heartbeat(self) -> None:
+        """
+        Функция раз в heartbeat_interval секунд отправляет результаты текущей аренды. Ожидание прерывается
+         при выдаче новой аренды, чтобы интервал, уменьшенный по времени жизни аренды, действовал сразу.
+        """
+        while not self._stopped:
+            if self._wakeup.wait(self.heartbeat_interval):
+                self._wakeup.clear()
+                continue
+            lease = self._current
+            if lease is not None:
+                try:
+                    lease.flush()
+                except ConnectionError:
+                    pass
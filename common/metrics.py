@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+from common.distributed import parse_address
+
+DEFAULT_PREFIX = 'scanner'
+DEFAULT_INTERVAL = 1.0
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_SECONDS = 'stage_duration_seconds'
+PLANNED_SUFFIX = '_planned'
+METRICS_PATH = '/metrics'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+T = TypeVar('T')
+
+
+def _key(name: str, labels: Dict[str, object]) -> Key:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    pairs = ','.join('{}="{}"'.format(label, value.replace('\\', '\\\\').replace('"', '\\"'))
+                     for label, value in labels)
+    return '{' + pairs + '}' if pairs else ''
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f'{hours}:{minutes:02}:{seconds:02}' if hours else f'{minutes}:{seconds:02}'
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def ratio(part: float, whole: float) -> str:
+    """
+    Функция форматирует долю part от whole в процентах для строки прогресса.
+    """
+    return f'{part / whole * 100:.1f}%' if whole else '0.0%'
+
+
+class Metrics:
+    """
+    Класс набора метрик сканера: счетчиков, значений (gauge) и гистограмм длительности этапов
+     (генерация, подключение, баннер, разрешение, загрузка, разбор). Метрика задается именем и метками,
+     обновление потокобезопасно. Метрики воркеров-процессов передаются родителю снимками snapshot(reset=True),
+     которые суммируются в общий набор функцией merge.
+    :param prefix - префикс имен метрик в формате Prometheus.
+    :param buckets - верхние границы корзин гистограмм в секундах.
+    """
+
+    def __init__(self, prefix: str = DEFAULT_PREFIX, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.prefix = prefix
+        self.buckets = buckets
+        self.counters: Dict[Key, float] = dict()
+        self.gauges: Dict[Key, float] = dict()
+        self.histograms: Dict[Key, list] = dict()
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][bisect.bisect_left(self.buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextmanager
+    def timer(self, stage: str, **labels) -> Iterator[None]:
+        """
+        Функция-контекст измеряет длительность этапа stage, в том числе вокруг await.
+        """
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(STAGE_SECONDS, time.monotonic() - started, stage=stage, **labels)
+
+    def iterate(self, items: Iterable[T], stage: str) -> Iterator[T]:
+        """
+        Функция выдает элементы итератора, измеряя длительность получения каждого как этап stage.
+        """
+        items = iter(items)
+        while True:
+            started = time.monotonic()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            self.observe(STAGE_SECONDS, time.monotonic() - started, stage=stage)
+            yield item
+
+    def total(self, name: str) -> float:
+        """
+        Функция возвращает сумму счетчика name по всем меткам.
+        """
+        with self._lock:
+            return sum(value for (counter, _), value in self.counters.items() if counter == name)
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self.counters.get(_key(name, labels), 0)
+
+    def gauge(self, name: str, **labels) -> float:
+        with self._lock:
+            return self.gauges.get(_key(name, labels), 0)
+
+    def snapshot(self, reset: bool = False) -> dict:
+        """
+        Функция возвращает сериализуемый снимок метрик. С reset счетчики и гистограммы обнуляются,
+         поэтому последовательные снимки содержат только приращения.
+        """
+        with self._lock:
+            snapshot = {'counters': dict(self.counters), 'gauges': dict(self.gauges),
+                        'histograms': {key: [list(value[0]), value[1], value[2]]
+                                       for key, value in self.histograms.items()}}
+            if reset:
+                self.counters.clear()
+                self.histograms.clear()
+            return snapshot
+
+    def merge(self, snapshot: dict, **labels) -> None:
+        """
+        Функция добавляет к метрикам приращения из снимка воркера. Значения gauge воркеров различаются
+         метками labels (например номером воркера).
+        """
+        with self._lock:
+            for key, value in snapshot['counters'].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for (name, key_labels), value in snapshot['gauges'].items():
+                self.gauges[_key(name, dict(key_labels, **labels))] = value
+            for key, (counts, total, count) in snapshot['histograms'].items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                histogram[0] = [current + added for current, added in zip(histogram[0], counts)]
+                histogram[1] += total
+                histogram[2] += count
+
+    def render(self) -> str:
+        """
+        Функция возвращает метрики в текстовом формате Prometheus.
+        """
+        snapshot = self.snapshot()
+        lines = list()
+        for kind, suffix, values in (('counter', '_total', snapshot['counters']), ('gauge', '', snapshot['gauges'])):
+            for name in sorted({name for name, _ in values}):
+                full_name = f'{self.prefix}_{name}{suffix}'
+                lines.append(f'# TYPE {full_name} {kind}')
+                lines.extend(f'{full_name}{_format_labels(labels)} {_format_value(value)}'
+                             for (metric, labels), value in sorted(values.items()) if metric == name)
+        histograms = snapshot['histograms']
+        for name in sorted({name for name, _ in histograms}):
+            full_name = f'{self.prefix}_{name}'
+            lines.append(f'# TYPE {full_name} histogram')
+            for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket in zip(self.buckets + (float('inf'), ), counts):
+                    cumulative += bucket
+                    le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                    lines.append(f'{full_name}_bucket{_format_labels(labels + (("le", le), ))} {cumulative}')
+                lines.append(f'{full_name}_sum{_format_labels(labels)} {_format_value(total)}')
+                lines.append(f'{full_name}_count{_format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def stage_summary(self) -> Dict[str, Tuple[int, float]]:
+        """
+        Функция возвращает для каждого этапа количество измерений и среднюю длительность в секундах.
+        """
+        stages = dict()
+        with self._lock:
+            for (name, labels), (_, total, count) in self.histograms.items():
+                if name != STAGE_SECONDS or not count:
+                    continue
+                stage = dict(labels).get('stage', '')
+                previous_count, previous_total = stages.get(stage, (0, 0.0))
+                stages[stage] = (previous_count + count, previous_total + total)
+        return {stage: (count, total / count) for stage, (count, total) in stages.items()}
+
+
+class MetricsReporter:
+    """
+    Класс периодической публикации метрик в фоновом потоке: раз в interval секунд метрики записываются
+     в файл stats_file (формат Prometheus, подходит для textfile коллектора), по адресу listen
+     отдаются по HTTP (GET /metrics), на stderr выводится строка прогресса: прошедшее время,
+     выполнено из запланированного, скорость, оставшееся время, средняя длительность этапов
+     и дополнительные показатели сканера. Выполненное - сумма счетчика unit по всем меткам,
+     запланированное - значение gauge unit_planned (0 - неизвестно, оставшееся время не выводится).
+    :param metrics - набор метрик.
+    :param unit - имя счетчика выполненных единиц работы (цели, домены, аренды).
+    :param stats_file - файл метрик, None - не записывается.
+    :param listen - адрес host:port HTTP сервера метрик, None - не запускается.
+    :param progress - выводить строку прогресса на stderr.
+    :param describe - функция, возвращающая дополнительные показатели для строки прогресса.
+    :param interval - интервал обновления в секундах.
+    """
+
+    def __init__(self, metrics: Metrics, unit: str, stats_file: Optional[str] = None, listen: Optional[str] = None,
+                 progress: bool = False, describe: Optional[Callable[[], str]] = None,
+                 interval: float = DEFAULT_INTERVAL) -> None:
+        self.metrics = metrics
+        self.unit = unit
+        self.stats_file = stats_file
+        self.listen = listen
+        self.progress = progress
+        self.describe = describe
+        self.interval = interval
+        self._started: Optional[float] = None
+        self._stopped = threading.Event()
+        self._thread = None
+        self._server = None
+        self._last = (0.0, 0.0)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.stats_file or self.listen or self.progress)
+
+    def __enter__(self) -> 'MetricsReporter':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """
+        Функция запускает HTTP сервер метрик и поток публикации, если они включены. Повторный вызов
+         (например при входе в контекст уже запущенного объекта) ничего не делает.
+        :raise ValueError: если адрес HTTP сервера задан неверно.
+        :raise OSError: если адрес HTTP сервера занят.
+        """
+        if self._started is not None:
+            return
+        self._started = time.monotonic()
+        self._last = (self._started, 0.0)
+        if self.listen:
+            self._server = ThreadingHTTPServer(parse_address(self.listen), self._handler_class())
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        if self.stats_file or self.progress:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Функция останавливает публикацию, последний раз записывает файл метрик и завершает строку прогресса.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self._publish()
+            if self.progress:
+                print(file=sys.stderr)
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def progress_line(self) -> str:
+        """
+        Функция формирует компактную строку прогресса.
+        """
+        now = time.monotonic()
+        done = self.metrics.total(self.unit)
+        planned = self.metrics.gauge(self.unit + PLANNED_SUFFIX)
+        last_time, last_done = self._last
+        rate = (done - last_done) / (now - last_time) if now > last_time else 0.0
+        self._last = (now, done)
+        parts = [_format_duration(now - self._started), f'{self.unit} {_format_value(done)}']
+        if planned:
+            parts[-1] += f'/{_format_value(planned)} ({ratio(done, planned)})'
+        parts.append(f'{rate:.0f}/s')
+        average = done / (now - self._started) if now > self._started else 0.0
+        if planned and average:
+            parts.append(f'ETA {_format_duration(max(0.0, planned - done) / average)}')
+        stages = self.metrics.stage_summary()
+        if stages:
+            parts.append(' '.join(f'{stage} {mean * 1000:.1f}ms' for stage, (_, mean) in sorted(stages.items())))
+        if self.describe is not None:
+            parts.append(self.describe())
+        return ' | '.join(part for part in parts if part)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self._publish()
+
+    def _publish(self) -> None:
+        if self.stats_file:
+            tmp_path = self.stats_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf8') as file:
+                file.write(self.metrics.render())
+            os.replace(tmp_path, self.stats_file)
+        if self.progress:
+            sys.stderr.write('\r\033[K' + self.progress_line())
+            sys.stderr.flush()
+
+    def _handler_class(self) -> type:
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                if self.path != METRICS_PATH:
+                    self.send_error(404)
+                    return
+                payload = metrics.render().encode('utf8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
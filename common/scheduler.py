@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import signal
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Hashable, Iterable, Iterator, Optional, Tuple
+
+from common.metrics import STAGE_SECONDS, Metrics
+
+EXECUTOR_ASYNCIO = 'asyncio'
+EXECUTOR_THREAD = 'thread'
+EXECUTOR_PROCESS = 'process'
+EXECUTORS = (EXECUTOR_ASYNCIO, EXECUTOR_THREAD, EXECUTOR_PROCESS)
+DEFAULT_CONCURRENCY = 16
+PENDING_PER_WORKER = 2
+DEFAULT_MAX_TARGETS = 65536
+CANCEL_POLL_INTERVAL = 0.5
+_EXHAUSTED = object()
+INTERRUPT_MESSAGE = 'Прерывание: новые задачи не запускаются, ожидается завершение текущих ' \
+                    '(повторное прерывание - немедленный выход)'
+
+
+class RateLimiter:
+    """
+    Класс ограничения частоты запуска задач: общего (rate задач в секунду) и для каждой цели
+     (per_target_rate задач в секунду на ключ цели). Каждой задаче выделяется временной слот,
+     не раньше следующего свободного слота общего ограничения и ограничения ее цели, функция
+     reserve не блокирует и возвращает время ожидания слота, поэтому ограничитель подходит
+     и для потоков, и для корутин. Хранится не более max_targets последних целей.
+    :param rate - максимальное количество задач в секунду, 0 - без ограничения.
+    :param per_target_rate - максимальное количество задач в секунду на одну цель, 0 - без ограничения.
+    :param max_targets - максимальное количество отслеживаемых целей.
+    """
+
+    def __init__(self, rate: float = 0, per_target_rate: float = 0, max_targets: int = DEFAULT_MAX_TARGETS) -> None:
+        self.rate = rate
+        self.per_target_rate = per_target_rate
+        self.max_targets = max_targets
+        self._next_slot = 0.0
+        self._target_slots: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __bool__(self) -> bool:
+        return bool(self.rate or self.per_target_rate)
+
+    def reserve(self, target: Optional[Hashable] = None) -> float:
+        """
+        Функция резервирует слот запуска задачи для цели target и возвращает время ожидания слота в секундах.
+        """
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_slot) if self.rate else now
+            if self.per_target_rate and target is not None:
+                start = max(start, self._target_slots.get(target, now))
+                self._target_slots[target] = start + 1 / self.per_target_rate
+                self._target_slots.move_to_end(target)
+                if len(self._target_slots) > self.max_targets:
+                    self._target_slots.popitem(last=False)
+            if self.rate:
+                self._next_slot = start + 1 / self.rate
+            return start - now
+
+
+def _run_delayed(handler: Callable[[Any], Any], delay: float, item: Any) -> Any:
+    if delay > 0:
+        time.sleep(delay)
+    return handler(item)
+
+
+def _ignore_interrupt() -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+@contextmanager
+def interrupt_handler(callback: Callable[[], None], message: Optional[str] = None) -> Iterator[None]:
+    """
+    Функция-контекст перехватывает SIGINT: первое прерывание вызывает callback (корректное завершение),
+     повторное - восстанавливает обработчик по умолчанию и выбрасывает KeyboardInterrupt.
+     Вне главного потока обработчик не устанавливается.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def handle(signum, frame):
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        if message:
+            print(message, file=sys.stderr)
+        callback()
+
+    previous = signal.signal(signal.SIGINT, handle)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGINT, previous)
+
+
+class Scheduler:
+    """
+    Класс планировщика задач сканирования, общий для всех сканеров.
+     Задачи берутся из ленивого итератора только по мере освобождения исполнителей, поэтому в памяти
+     находится не больше max_pending задач (обратное давление), а количество процессов и потоков
+     ограничено concurrency. Исполнители: asyncio (concurrency корутин в текущем event loop),
+     thread (пул потоков) и process (пул процессов, обработчик должен быть сериализуемым).
+     Запуск задач ограничивается по частоте общим лимитом и лимитом на цель, ключ цели вычисляет target_key.
+     После cancel (в том числе по SIGINT внутри handle_signals) новые задачи не запускаются,
+     ожидающие запуска отменяются, выполняющиеся завершаются.
+    :param executor - тип исполнителя: asyncio, thread или process.
+    :param concurrency - максимальное количество одновременно выполняемых задач.
+    :param rate - максимальное количество задач в секунду, 0 - без ограничения.
+    :param per_target_rate - максимальное количество задач в секунду на одну цель, 0 - без ограничения.
+    :param target_key - функция вычисления ключа цели задачи для лимита на цель.
+    :param max_pending - максимальное количество отправленных исполнителю задач, по умолчанию 2 * concurrency.
+    :param metrics - набор метрик, в который записываются глубина очереди (queue_depth), количество
+     выполняющихся задач (inflight), счетчики задач по состоянию (tasks) и ожидание лимита частоты (rate_limit).
+    """
+
+    def __init__(self, executor: str = EXECUTOR_THREAD, concurrency: int = DEFAULT_CONCURRENCY, rate: float = 0,
+                 per_target_rate: float = 0, target_key: Optional[Callable[[Any], Hashable]] = None,
+                 max_pending: Optional[int] = None, metrics: Optional[Metrics] = None) -> None:
+        if executor not in EXECUTORS:
+            raise ValueError(f'Неизвестный исполнитель {executor}, доступны: {", ".join(EXECUTORS)}')
+        self.executor = executor
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(rate, per_target_rate)
+        self.target_key = target_key
+        self.max_pending = max_pending or self.concurrency * PENDING_PER_WORKER
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.metrics = metrics or Metrics()
+        self._inflight = 0
+        self._cancelled = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> None:
+        self._cancelled = True
+
+    def handle_signals(self, message: Optional[str] = INTERRUPT_MESSAGE):
+        """
+        Функция-контекст, в котором SIGINT корректно останавливает планировщик.
+        """
+        return interrupt_handler(self.cancel, message)
+
+    def run(self, handler: Callable[[Any], Any], items: Iterable[Any]) -> Iterator[Tuple[Any, Any]]:
+        """
+        Функция выполняет задачи пулом потоков или процессов и выдает пары (задача, результат или исключение)
+         по мере завершения.
+        """
+        if self.executor == EXECUTOR_ASYNCIO:
+            raise ValueError('Для исполнителя asyncio используйте run_async')
+        if self.executor == EXECUTOR_PROCESS:
+            pool = ProcessPoolExecutor(max_workers=self.concurrency, initializer=_ignore_interrupt)
+        else:
+            pool = ThreadPoolExecutor(max_workers=self.concurrency)
+        items = iter(items)
+        pending = dict()
+        exhausted = False
+        with pool:
+            while True:
+                while not exhausted and not self._cancelled and len(pending) < self.max_pending:
+                    item = next(items, _EXHAUSTED)
+                    if item is _EXHAUSTED:
+                        exhausted = True
+                        break
+                    pending[pool.submit(_run_delayed, handler, self._delay(item), item)] = item
+                if self._cancelled:
+                    self._drop(pending)
+                self.metrics.set('queue_depth', len(pending))
+                if not pending:
+                    return
+                done, _ = wait(pending, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    if future.cancelled():
+                        self._count('dropped')
+                        continue
+                    error = future.exception()
+                    if error is not None:
+                        self._count('failed')
+                        yield item, error
+                    else:
+                        self._count('completed')
+                        yield item, future.result()
+
+    async def run_async(self, handler: Callable[[Any], Awaitable[Any]], items: Iterable[Any]) -> None:
+        """
+        Функция выполняет задачи concurrency корутинами, которые разбирают общий итератор задач.
+         Исключение обработчика прерывает выполнение.
+        """
+        if self.executor != EXECUTOR_ASYNCIO:
+            raise ValueError(f'Исполнитель {self.executor} не поддерживает run_async')
+        items = iter(items)
+
+        async def worker() -> None:
+            while not self._cancelled:
+                item = next(items, _EXHAUSTED)
+                if item is _EXHAUSTED:
+                    return
+                delay = self._delay(item)
+                if delay > 0:
+                    await self.sleep(delay)
+                    if self._cancelled:
+                        self._count('dropped')
+                        return
+                self._inflight += 1
+                self.metrics.set('inflight', self._inflight)
+                try:
+                    await handler(item)
+                except Exception:
+                    self._count('failed')
+                    raise
+                finally:
+                    self._inflight -= 1
+                    self.metrics.set('inflight', self._inflight)
+                self._count('completed')
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+    async def sleep(self, delay: float) -> None:
+        """
+        Функция ждет delay секунд или до отмены планировщика.
+        """
+        deadline = time.monotonic() + delay
+        while not self._cancelled and time.monotonic() < deadline:
+            await asyncio.sleep(min(CANCEL_POLL_INTERVAL, deadline - time.monotonic()))
+
+    def _delay(self, item: Any) -> float:
+        if not self.limiter:
+            return 0
+        delay = self.limiter.reserve(self.target_key(item) if self.target_key is not None else None)
+        self.metrics.observe(STAGE_SECONDS, max(0.0, delay), stage='rate_limit')
+        return delay
+
+    def _drop(self, pending: dict) -> None:
+        for future in list(pending):
+            if future.cancel():
+                del pending[future]
+                self._count('dropped')
+
+    def _count(self, state: str) -> None:
+        setattr(self, state, getattr(self, state) + 1)
+        self.metrics.inc('tasks', state=state)
+
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import json
+import os
+import struct
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Iterator, Optional, Sequence
+
+DEFAULT_BUFFER_SIZE = 64 * 1024
+DEFAULT_FSYNC_INTERVAL = 5.0
+BINARY_MAGIC = b'SCNR\x01'
+BINARY_NONE, BINARY_STR, BINARY_INT, BINARY_FLOAT = range(4)
+
+
+class ResultSink(ABC):
+    """
+    Базовый класс приемника результатов сканирования.
+     Записывает результаты по мере поступления через буфер ограниченного размера, не чаще
+     fsync_interval секунд сбрасывает буфер в файл и выполняет fsync, поэтому файл можно
+     читать во время скана, а потребление памяти не зависит от количества результатов.
+    :param path - путь к файлу результата.
+    :param fields - упорядоченный список полей записи.
+    :param buffer_size - размер буфера записи в байтах.
+    :param fsync_interval - интервал сброса буфера на диск в секундах.
+    :param append - дописывать результаты в существующий файл, заголовок пишется только в пустой файл.
+    """
+
+    binary = False
+    appendable = True
+
+    def __init__(self, path: str, fields: Sequence[str], buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 fsync_interval: float = DEFAULT_FSYNC_INTERVAL, append: bool = False) -> None:
+        if append and not self.appendable:
+            raise ValueError(f'Формат {type(self).__name__} не поддерживает дозапись в файл')
+        self.path = path
+        self.fields = list(fields)
+        self.buffer_size = buffer_size
+        self.fsync_interval = fsync_interval
+        self.append = append
+        self.file = None
+        self.count = 0
+        self.last_sync = time.monotonic()
+
+    def __enter__(self) -> 'ResultSink':
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def open(self) -> None:
+        mode = 'a' if self.append else 'w'
+        if self.binary:
+            self.file = open(self.path, mode + 'b', buffering=self.buffer_size)
+        else:
+            self.file = open(self.path, mode, encoding='utf8', newline='', buffering=self.buffer_size)
+        if not self.file.tell():
+            self._write_header()
+
+    def write(self, record: dict) -> None:
+        """
+        Функция записывает один результат, поля, отсутствующие в self.fields, не сохраняются.
+        """
+        self._write_record(record)
+        self.count += 1
+        if time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_sync = time.monotonic()
+
+    def close(self) -> None:
+        if self.file is None:
+            return
+        self._write_footer()
+        self.flush()
+        self.file.close()
+        self.file = None
+
+    def _write_header(self) -> None:
+        pass
+
+    def _write_footer(self) -> None:
+        pass
+
+    @abstractmethod
+    def _write_record(self, record: dict) -> None:
+        pass
+
+
+class TextSink(ResultSink):
+    """
+    Класс приемника, записывающего по строке на результат в формате, заданном функцией formatter.
+    """
+
+    def __init__(self, path: str, fields: Sequence[str], formatter: Optional[Callable[[dict], str]] = None,
+                 **kwargs) -> None:
+        super(TextSink, self).__init__(path, fields, **kwargs)
+        self.formatter = formatter or self._default_formatter
+
+    def _write_record(self, record: dict) -> None:
+        self.file.write(self.formatter(record) + '\n')
+
+    def _default_formatter(self, record: dict) -> str:
+        return ' '.join(str(record[field]) for field in self.fields if record.get(field))
+
+
+class JsonArraySink(ResultSink):
+    """
+    Класс приемника, записывающего результаты единым JSON массивом, массив дописывается по мере поступления.
+     Дозапись в существующий файл не поддерживается.
+    """
+
+    appendable = False
+
+    def _write_header(self) -> None:
+        self.file.write('[')
+
+    def _write_record(self, record: dict) -> None:
+        separator = ', ' if self.count else ''
+        self.file.write(separator + json.dumps({field: record.get(field) for field in self.fields}))
+
+    def _write_footer(self) -> None:
+        self.file.write(']')
+
+
+class JsonLinesSink(ResultSink):
+    """
+    Класс приемника формата JSON Lines, по одному JSON объекту на строку.
+    """
+
+    def _write_record(self, record: dict) -> None:
+        self.file.write(json.dumps({field: record.get(field) for field in self.fields}) + '\n')
+
+
+class CsvSink(ResultSink):
+    """
+    Класс приемника формата CSV с заголовком из названий полей.
+    """
+
+    def open(self) -> None:
+        super(CsvSink, self).open()
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fields, extrasaction='ignore')
+
+    def _write_header(self) -> None:
+        csv.DictWriter(self.file, fieldnames=self.fields).writeheader()
+
+    def _write_record(self, record: dict) -> None:
+        self.writer.writerow(record)
+
+
+class BinarySink(ResultSink):
+    """
+    Класс приемника компактного бинарного формата.
+     Заголовок: BINARY_MAGIC, количество полей (uint16) и названия полей (uint16 длина + utf8).
+     Запись: длина записи (uint32), далее для каждого поля байт типа и значение:
+     None - без значения, str - uint32 длина + utf8, int - int64, float - double.
+     Прочитать файл можно функцией read_binary_records.
+    """
+
+    binary = True
+
+    def _write_header(self) -> None:
+        header = [BINARY_MAGIC, struct.pack('!H', len(self.fields))]
+        for field in self.fields:
+            encoded = field.encode('utf8')
+            header.append(struct.pack('!H', len(encoded)) + encoded)
+        self.file.write(b''.join(header))
+
+    def _write_record(self, record: dict) -> None:
+        body = b''.join(self._pack_value(record.get(field)) for field in self.fields)
+        self.file.write(struct.pack('!I', len(body)) + body)
+
+    @staticmethod
+    def _pack_value(value) -> bytes:
+        if value is None:
+            return struct.pack('!B', BINARY_NONE)
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, int) and -2 ** 63 <= value < 2 ** 63:
+            return struct.pack('!Bq', BINARY_INT, value)
+        if isinstance(value, float):
+            return struct.pack('!Bd', BINARY_FLOAT, value)
+        encoded = str(value).encode('utf8')
+        return struct.pack('!BI', BINARY_STR, len(encoded)) + encoded
+
+
+def read_binary_records(path: str) -> Iterator[dict]:
+    """
+    Функция последовательно читает записи файла, созданного BinarySink.
+     Оборванная последняя запись (файл еще дописывается) пропускается.
+    """
+    with open(path, 'rb') as file:
+        if file.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f'{path} не является файлом результатов в бинарном формате')
+        fields_count, = struct.unpack('!H', file.read(2))
+        fields = list()
+        for _ in range(fields_count):
+            length, = struct.unpack('!H', file.read(2))
+            fields.append(file.read(length).decode('utf8'))
+        while True:
+            length_data = file.read(4)
+            if len(length_data) < 4:
+                return
+            length, = struct.unpack('!I', length_data)
+            body = file.read(length)
+            if len(body) < length:
+                return
+            record = dict()
+            offset = 0
+            for field in fields:
+                value_type = body[offset]
+                offset += 1
+                if value_type == BINARY_INT:
+                    record[field], = struct.unpack_from('!q', body, offset)
+                    offset += 8
+                elif value_type == BINARY_FLOAT:
+                    record[field], = struct.unpack_from('!d', body, offset)
+                    offset += 8
+                elif value_type == BINARY_STR:
+                    size, = struct.unpack_from('!I', body, offset)
+                    offset += 4
+                    record[field] = body[offset:offset + size].decode('utf8')
+                    offset += size
+                else:
+                    record[field] = None
+            yield record
+
+
+SINK_FORMATS = {
+    'text': TextSink,
+    'json': JsonArraySink,
+    'jsonl': JsonLinesSink,
+    'csv': CsvSink,
+    'bin': BinarySink,
+}
+
+EXTENSION_FORMATS = {
+    '.json': 'json',
+    '.jsonl': 'jsonl',
+    '.csv': 'csv',
+    '.bin': 'bin',
+}
+
+
+def create_sink(path: str, fields: Sequence[str], sink_format: Optional[str] = None,
+                formatter: Optional[Callable[[dict], str]] = None, **kwargs) -> ResultSink:
+    """
+    Функция создает приемник результатов. Если формат не задан, он определяется по расширению файла,
+     для неизвестных расширений используется текстовый формат с функцией formatter.
+    :raise ValueError: если формат неизвестен.
+    """
+    if sink_format is None:
+        sink_format = EXTENSION_FORMATS.get(os.path.splitext(path)[1].lower(), 'text')
+    if sink_format not in SINK_FORMATS:
+        raise ValueError(f'Неизвестный формат результата {sink_format}, доступные: {", ".join(SINK_FORMATS)}')
+    if sink_format == 'text':
+        return TextSink(path, fields, formatter=formatter, **kwargs)
+    return SINK_FORMATS[sink_format](path, fields, **kwargs)
@@ -0,0 +1,88 @@
+import hashlib
+import math
+from collections import Counter
+from typing import Iterable, Iterator, Tuple
+
+from strategies import Strategy
+
+DEFAULT_CAPACITY = 1000000
+DEFAULT_ERROR_RATE = 0.001
+
+
+class BloomFilter:
+    """
+    Класс фильтра Блума для компактной проверки, встречалась ли строка ранее.
+     Размер битового массива рассчитывается по ожидаемому количеству элементов и допустимой
+     доле ложных срабатываний, при ложном срабатывании новый элемент считается повтором.
+    :param capacity - ожидаемое количество элементов.
+    :param error_rate - допустимая доля ложных срабатываний.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, error_rate: float = DEFAULT_ERROR_RATE) -> None:
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, item: str) -> bool:
+        """
+        Функция добавляет элемент в фильтр.
+        :return: True, если элемента в фильтре не было.
+        """
+        added = False
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                added = True
+        return added
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position // 8] & (1 << position % 8) for position in self._positions(item))
+
+    def _positions(self, item: str) -> Iterator[int]:
+        digest = hashlib.blake2b(item.encode('utf8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes_count):
+            yield (first + i * second) % self.size
+
+
+class CandidatePipeline:
+    """
+    Класс потокового генератора доменов-кандидатов.
+     Последовательно опрашивает генераторы стратегий, отбрасывает повторы через фильтр Блума
+     и лениво соединяет каждое новое имя со всеми доменными зонами, поэтому разрешение доменов
+     начинается сразу, а потребление памяти не зависит от длины бренда.
+     Повтор засчитывается стратегии, первой сгенерировавшей имя, в generated хранится количество
+     доменов, выданных каждой стратегией.
+    :param strategies - список стратегий генерации имен.
+    :param zones - доменные зоны.
+    :param capacity - ожидаемое количество уникальных имен для фильтра Блума.
+    :param error_rate - допустимая доля ложных повторов.
+    """
+
+    def __init__(self, strategies: Iterable[Strategy], zones: Iterable[str], capacity: int = DEFAULT_CAPACITY,
+                 error_rate: float = DEFAULT_ERROR_RATE) -> None:
+        self.strategies = list(strategies)
+        self.zones = list(dict.fromkeys(zones))
+        self.seen = BloomFilter(capacity, error_rate)
+        self.labels_count = 0
+        self.generated = Counter()
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        """
+        Функция выдает пары (домен, имя стратегии).
+        """
+        for label, name in self.labels():
+            for zone in self.zones:
+                self.generated[name] += 1
+                yield f'{label}.{zone}', name
+
+    def labels(self) -> Iterator[Tuple[str, str]]:
+        """
+        Функция выдает пары (уникальное имя без зоны, имя стратегии) от всех стратегий по мере генерации.
+        """
+        for strategy in self.strategies:
+            for label in strategy.generate():
+                if label != strategy.domain_string and self.seen.add(label):
+                    self.labels_count += 1
+                    yield label, strategy.name
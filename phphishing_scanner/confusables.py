@@ -0,0 +1,144 @@
+import os
+import string
+from typing import Dict, List, Optional
+
+TABLE_FORMAT_VERSION = 2
+TABLE_HEADER = 'confusables'
+TABLE_SOURCES = ('homoglyphs', 'chardet')
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'confusables.tab')
+TABLE_CHARS = string.ascii_lowercase + string.digits + '-'
+URL_RESERVED_CHARS = "$|.+!*'(),"
+DEFAULT_SIMILARITY = 0.5
+# Оценка визуальной схожести пар символов в шрифтах адресной строки, остальным парам из таблицы
+# присваивается DEFAULT_SIMILARITY.
+SIMILARITY = {
+    '0o': 0.95, '1l': 0.95, 'il': 0.9, '1i': 0.85, '5s': 0.7, '2z': 0.65, '8b': 0.6, '9g': 0.6, '6b': 0.55,
+    'nu': 0.55, 'mn': 0.55, 'ce': 0.6, 'ao': 0.55, 'vy': 0.55, 'uv': 0.6, 'jl': 0.6, 'ij': 0.65,
+}
+
+_tables = dict()
+
+
+def build_table(chars: str = TABLE_CHARS) -> Dict[str, List[str]]:
+    """
+    Функция вычисляет для каждого символа список похожих по написанию ascii символов.
+     Только здесь используются homoglyphs и chardet, поэтому они импортируются внутри функции.
+    :param chars - символы, для которых строится таблица.
+    """
+    import chardet
+    import homoglyphs as hg
+
+    glyphs_generator = hg.Homoglyphs(languages={'en'}, categories=('COMMON', 'LATIN'))
+    table = dict()
+    for char in chars:
+        possible_glyphs = glyphs_generator.get_combinations(char.lower())
+        possible_glyphs.extend(glyphs_generator.get_combinations(char.upper()))
+        table[char] = list(dict.fromkeys(
+            glyph for glyph in possible_glyphs
+            if glyph not in URL_RESERVED_CHARS and glyph.lower() != char
+            and chardet.detect(str.encode(glyph))['encoding'] == 'ascii'))
+    return table
+
+
+def table_source() -> str:
+    """
+    Функция возвращает установленные версии пакетов, по данным которых строится таблица
+     (например homoglyphs==2.0.4 chardet==4.0.0).
+    """
+    from importlib.metadata import PackageNotFoundError, version
+
+    sources = list()
+    for package in TABLE_SOURCES:
+        try:
+            sources.append(f'{package}=={version(package)}')
+        except PackageNotFoundError:
+            sources.append(f'{package}==unknown')
+    return ' '.join(sources)
+
+
+def cache_table_path() -> str:
+    """
+    Функция возвращает путь к таблице в пользовательском каталоге кэша ($XDG_CACHE_HOME или ~/.cache),
+     который используется, если каталог пакета недоступен для записи.
+    """
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'phphishing_scanner', 'confusables.tab')
+
+
+def save_table(table: Dict[str, List[str]], path: str = DEFAULT_TABLE_PATH) -> None:
+    """
+    Функция атомарно сохраняет таблицу в текстовый файл.
+     Первая строка - заголовок с версией формата и версиями пакетов-источников данных,
+     далее по строке на символ: символ, табуляция и все похожие символы подряд без разделителей,
+     символы без похожих не сохраняются.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf8', newline='\n') as file:
+        file.write(f'{TABLE_HEADER} {TABLE_FORMAT_VERSION} {table_source()}\n')
+        for char, glyphs in sorted(table.items()):
+            if glyphs:
+                file.write(f'{char}\t{"".join(glyphs)}\n')
+    os.replace(tmp_path, path)
+
+
+def read_table(path: str = DEFAULT_TABLE_PATH) -> Optional[Dict[str, List[str]]]:
+    """
+    Функция читает таблицу из файла.
+    :return: таблица или None, если файла нет или он другой версии формата.
+    """
+    try:
+        with open(path, 'r', encoding='utf8') as file:
+            if file.readline().split()[:2] != [TABLE_HEADER, str(TABLE_FORMAT_VERSION)]:
+                return None
+            table = dict()
+            for line in file:
+                char, _, glyphs = line.rstrip('\n').partition('\t')
+                if char:
+                    table[char] = list(glyphs)
+            return table
+    except OSError:
+        return None
+
+
+def load_table(path: str = DEFAULT_TABLE_PATH) -> Dict[str, List[str]]:
+    """
+    Функция лениво загружает таблицу при первом обращении и хранит ее в памяти процесса.
+     Таблица поставляется вместе с пакетом. Если файла нет или его версия устарела, таблица ищется
+     в пользовательском каталоге кэша, иначе строится один раз и сохраняется на место файла, а если каталог
+     недоступен для записи - в каталог кэша. При невозможности записи таблица используется только в памяти.
+    """
+    table = _tables.get(path)
+    if table is None:
+        cache_path = cache_table_path()
+        table = read_table(path) or read_table(cache_path)
+        if table is None:
+            table = build_table()
+            try:
+                save_table(table, path)
+            except OSError:
+                try:
+                    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                    save_table(table, cache_path)
+                except OSError:
+                    pass
+        _tables[path] = table
+    return table
+
+
+def get_glyphs(char: str, path: str = DEFAULT_TABLE_PATH) -> List[str]:
+    """
+    Функция возвращает похожие ascii символы для символа, для символов вне таблицы - пустой список.
+    """
+    return list(load_table(path).get(char.lower(), ()))
+
+
+def similarity(char: str, glyph: str) -> float:
+    """
+    Функция оценивает визуальную схожесть символа и его замены числом от 0 до 1.
+    """
+    return SIMILARITY.get(''.join(sorted((char.lower(), glyph.lower()))), DEFAULT_SIMILARITY)
+
+
+if __name__ == '__main__':
+    save_table(build_table())
+    print(f'Таблица сохранена в {DEFAULT_TABLE_PATH}')
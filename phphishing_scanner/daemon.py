@@ -0,0 +1,191 @@
+import asyncio
+import json
+import sys
+import time
+from functools import partial
+from typing import List, Optional, Tuple
+
+from common.sinks import create_sink
+from dns_cache import DEFAULT_NEGATIVE_TTL, WildcardDetector
+from dns_resolver import AsyncResolver, RCODE_NOERROR, RCODE_NXDOMAIN
+from phishing_scanner import PhishingScanner, DOMAIN_ZONES
+from state import StateIndex
+from strategies import get_strategies
+
+DAEMON_FIELDS = ('time', 'brand', 'domain', 'ip', 'strategy', 'change')
+DEFAULT_MIN_INTERVAL = 60
+DEFAULT_MIN_RECHECK = 300
+DEFAULT_MAX_RECHECK = 24 * 3600
+RETRY_INTERVAL = 300
+
+
+class PhishingDaemon(PhishingScanner):
+    """
+    Класс-процесс непрерывного мониторинга фишинговых доменов для списка брендов.
+     Последнее известное состояние каждого домена-кандидата хранится в локальном индексе SQLite,
+     домен проверяется повторно только после истечения TTL его ответа (в пределах min_recheck..max_recheck).
+     Кандидаты бренда генерируются только при заполнении индекса, а циклы выбирают из индекса истекшие
+     записи, поэтому стоимость цикла зависит от количества истекших записей, а не от размера
+     пространства кандидатов. В файл результата дописываются только новые, измененные и пропавшие
+     связки домен - ip адрес.
+    :param brands - список брендов (строк доменов).
+    :param state_db - путь к базе данных состояния.
+    :param min_interval - минимальная пауза между циклами проверки в секундах.
+    :param min_recheck - минимальный интервал повторной проверки домена в секундах.
+    :param max_recheck - максимальный интервал повторной проверки домена в секундах.
+    Остальные параметры передаются в PhishingScanner.
+    """
+
+    def __init__(self, brands: List[str], state_db: str = 'phishing_state.db',
+                 min_interval: float = DEFAULT_MIN_INTERVAL, min_recheck: float = DEFAULT_MIN_RECHECK,
+                 max_recheck: float = DEFAULT_MAX_RECHECK, **kwargs) -> None:
+        super(PhishingDaemon, self).__init__(brands[0], **kwargs)
+        self.brands = list(dict.fromkeys(brands))
+        self.state = StateIndex(state_db)
+        self.min_interval = min_interval
+        self.min_recheck = min_recheck
+        self.max_recheck = max_recheck
+        self.checked_count = 0
+        self.changes_count = 0
+
+    def run(self) -> None:
+        self._prepare_sink()
+        try:
+            self.state.open()
+        except ValueError as err:
+            sys.exit(err)
+        self._prepare_scheduler()
+        try:
+            with self.sink, self._prepare_reporter('domains'), self.scheduler.handle_signals():
+                asyncio.run(self._monitor())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.state.close()
+        print('Мониторинг остановлен')
+
+    async def _monitor(self) -> None:
+        """
+        Функция выполняет циклы проверки: перед первым циклом индекс заполняется кандидатами брендов,
+         в каждом цикле для каждого бренда резолвятся только домены, у которых истек срок следующей проверки.
+         Пауза между циклами рассчитывается по ближайшему сроку проверки в индексе. После отмены
+         планировщика (SIGINT) текущий цикл завершается без проверки оставшихся доменов
+         и мониторинг останавливается.
+        """
+        self.cache.load()
+        self._seed_brands()
+        async with AsyncResolver(self.resolvers, rate=self.rate, timeout=self.timeout,
+                                 retries=self.retries) as resolver:
+            while not self.scheduler.cancelled:
+                self.checked_count = self.changes_count = 0
+                self.metrics.inc('cycles')
+                self.wildcards = WildcardDetector(resolver, self.cache)
+                await self.wildcards.detect(DOMAIN_ZONES)
+                self.cache.save()
+                now = time.time()
+                for brand in self.brands:
+                    await self.scheduler.run_async(partial(self._monitor_candidate, resolver, brand),
+                                                   self.state.due(brand, now))
+                    self.state.commit()
+                self.sink.flush()
+                delay = self._next_delay()
+                print(f'Цикл окончен: проверено доменов {self.checked_count}, изменений {self.changes_count}, '
+                      f'следующая проверка через {delay:.0f} с')
+                await self.scheduler.sleep(delay)
+
+    def _seed_brands(self) -> None:
+        """
+        Функция удаляет из индекса бренды, которые больше не отслеживаются, и заполняет индекс кандидатами
+         брендов, для которых он еще не заполнен или заполнен с другими параметрами стратегий.
+        """
+        removed = self.state.retain(self.brands)
+        if removed:
+            print(f'Из индекса удалено доменов брендов, которые больше не отслеживаются: {removed}')
+        try:
+            strategies = [strategy.name for strategy in get_strategies(self.enabled_strategies,
+                                                                       self.disabled_strategies)]
+        except ValueError as err:
+            sys.exit(err)
+        options = json.dumps({'strategies': strategies, 'options': self.strategy_options, 'zones': DOMAIN_ZONES},
+                             sort_keys=True)
+        for brand in self.brands:
+            if self.scheduler.cancelled:
+                return
+            if self.state.seeded_options(brand) == options:
+                continue
+            self._prepare_brand(brand)
+            added = self.state.seed(brand, self.metrics.iterate(self.candidates, 'generate'), options)
+            print(f'Индекс бренда {brand} заполнен, добавлено доменов: {added}')
+
+    def _prepare_brand(self, brand: str) -> None:
+        """
+        Функция подготавливает стратегии и генератор кандидатов для бренда.
+        """
+        self.domain_string = brand
+        self._strategies = list()
+        self._prepare_strategies()
+        self._prepare_domains()
+
+    async def _monitor_candidate(self, resolver: AsyncResolver, brand: str, candidate: Tuple[str, str]) -> None:
+        domain, strategy_name = candidate
+        now = time.time()
+        with self.metrics.timer('resolve'):
+            answer = await resolver.resolve(domain)
+        self.checked_count += 1
+        if answer.rcode not in (RCODE_NOERROR, RCODE_NXDOMAIN):
+            self.metrics.inc('domains', result='error')
+            self.state.postpone(domain, brand, strategy_name, now + RETRY_INTERVAL)
+            return
+        ips = answer.ips
+        if self.wildcards.is_wildcard(domain, ips):
+            self.metrics.inc('domains', result='wildcard')
+            ips = list()
+        else:
+            self.metrics.inc('domains', result='resolved' if ips else 'empty')
+        ttl = answer.ttl if answer.ips else answer.negative_ttl or DEFAULT_NEGATIVE_TTL
+        expires = now + min(max(ttl, self.min_recheck), self.max_recheck)
+        change = self.state.update(domain, brand, strategy_name, ips, now, expires)
+        if change is not None:
+            self._report_change(brand, domain, ips, strategy_name, change)
+
+    def _describe_progress(self) -> str:
+        return f'cycle {self.metrics.total("cycles"):.0f} checked {self.checked_count} changes {self.changes_count}'
+
+    def _next_delay(self) -> float:
+        next_expiry = self.state.next_expiry(self.brands)
+        if next_expiry is None:
+            return self.max_recheck
+        return min(max(next_expiry - time.time(), self.min_interval), self.max_recheck)
+
+    def _prepare_sink(self) -> None:
+        """
+        Функция создает приемник, дописывающий изменения в файл результата.
+        """
+        try:
+            self.sink = create_sink(self.ip_log_file, DAEMON_FIELDS, self.log_format, append=True,
+                                    formatter=lambda record: f"{record['time']} {record['change']} "
+                                                             f"{record['domain']} - {record['ip']}")
+        except ValueError as err:
+            sys.exit(err)
+
+    def _report_change(self, brand: str, domain: str, ips: List[str], strategy_name: str, change: str) -> None:
+        """
+        Функция дописывает изменение в файл результата и выводит его на консоль.
+        """
+        record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'brand': brand, 'domain': domain,
+                  'ip': ','.join(sorted(ips)), 'strategy': strategy_name, 'change': change}
+        self.sink.write(record)
+        print(f"{record['change']}: {domain} - {record['ip']}")
+        self.changes_count += 1
+        self.metrics.inc('changes', change=change)
+
+
+def read_brands(domain_string: str, brands_file: Optional[str] = None) -> List[str]:
+    """
+    Функция собирает список брендов из строки через запятую и файла (по бренду на строку).
+    """
+    brands = [brand.strip() for brand in domain_string.split(',') if brand.strip()]
+    if brands_file:
+        with open(brands_file, 'r', encoding='utf8') as file:
+            brands.extend(line.strip() for line in file if line.strip() and not line.startswith('#'))
+    return brands
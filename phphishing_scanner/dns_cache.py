@@ -0,0 +1,138 @@
+import asyncio
+import json
+import os
+import random
+import string
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from dns_resolver import AsyncResolver, DnsAnswer, RCODE_NOERROR, RCODE_NXDOMAIN
+
+DEFAULT_NEGATIVE_TTL = 3600
+MIN_POSITIVE_TTL = 60
+WILDCARD_PROBES = 3
+WILDCARD_LABEL_LENGTH = 16
+WILDCARD_TTL = 24 * 3600
+
+
+class DnsCache:
+    """
+    Класс кэша DNS ответов, сохраняемого между запусками в JSON файл.
+     Положительные записи хранятся TTL из ответа, отрицательные (NXDOMAIN или нет A записей) -
+     TTL из SOA записи ответа или DEFAULT_NEGATIVE_TTL. Таймауты и ошибки не кэшируются.
+     Также хранит отпечатки wildcard ip адресов доменных зон.
+    :param path - путь к файлу кэша, None - кэш только в памяти.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self.entries = dict()
+        self.wildcards = dict()
+
+    def load(self) -> None:
+        """
+        Функция загружает кэш из файла, пропуская устаревшие записи.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        self.entries = {domain: entry for domain, entry in data.get('entries', {}).items() if entry[1] > now}
+        self.wildcards = {zone: entry for zone, entry in data.get('wildcards', {}).items() if entry[1] > now}
+
+    def save(self) -> None:
+        """
+        Функция атомарно сохраняет кэш в файл через временный файл.
+        """
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf8') as file:
+            json.dump({'entries': self.entries, 'wildcards': self.wildcards}, file)
+        os.replace(tmp_path, self.path)
+
+    def get(self, domain: str) -> Optional[List[str]]:
+        """
+        Функция возвращает закэшированный список ip адресов домена (пустой для несуществующего домена)
+         или None, если записи нет или она устарела.
+        """
+        entry = self.entries.get(domain)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def put(self, answer: DnsAnswer) -> None:
+        """
+        Функция кэширует ответ с учетом его TTL.
+        """
+        if answer.ips:
+            ttl = max(answer.ttl, MIN_POSITIVE_TTL)
+        elif answer.rcode in (RCODE_NOERROR, RCODE_NXDOMAIN):
+            ttl = answer.negative_ttl or DEFAULT_NEGATIVE_TTL
+        else:
+            return
+        self.entries[answer.domain] = [answer.ips, time.time() + ttl]
+
+    def get_wildcard(self, zone: str) -> Optional[List[str]]:
+        entry = self.wildcards.get(zone)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def put_wildcard(self, zone: str, ips: Iterable[str]) -> None:
+        self.wildcards[zone] = [sorted(ips), time.time() + WILDCARD_TTL]
+
+
+class WildcardDetector:
+    """
+    Класс определения wildcard DNS доменных зон.
+     Для каждой зоны резолвит несколько случайных несуществующих имен, все полученные ip адреса
+     считаются отпечатком wildcard (парковки регистратора). Ответ, все адреса которого входят
+     в отпечаток своей зоны, считается ложным срабатыванием. Отпечатки кэшируются на WILDCARD_TTL.
+     Если ни на одно имя не получен ответ NOERROR или NXDOMAIN, отпечаток не сохраняется
+     и снимается повторно при следующем запуске.
+    :param resolver - асинхронный резолвер.
+    :param cache - кэш для хранения отпечатков между запусками.
+    :param probes - количество случайных имен на зону.
+    """
+
+    def __init__(self, resolver: AsyncResolver, cache: DnsCache, probes: int = WILDCARD_PROBES) -> None:
+        self.resolver = resolver
+        self.cache = cache
+        self.probes = probes
+        self.wildcards: Dict[str, Set[str]] = dict()
+
+    async def detect(self, zones: Iterable[str]) -> None:
+        """
+        Функция параллельно снимает отпечатки всех зон, которых нет в кэше.
+        """
+        zones = list(dict.fromkeys(zones))
+        for zone in zones:
+            cached = self.cache.get_wildcard(zone)
+            if cached is not None:
+                self.wildcards[zone] = set(cached)
+        await asyncio.gather(*(self._detect_zone(zone) for zone in zones if zone not in self.wildcards))
+
+    async def _detect_zone(self, zone: str) -> None:
+        labels = [''.join(random.choices(string.ascii_lowercase + string.digits, k=WILDCARD_LABEL_LENGTH))
+                  for _ in range(self.probes)]
+        answers = await asyncio.gather(*(self.resolver.resolve(f'{label}.{zone}') for label in labels))
+        answers = [answer for answer in answers if answer.rcode in (RCODE_NOERROR, RCODE_NXDOMAIN)]
+        if not answers:
+            return
+        ips = set()
+        for answer in answers:
+            ips.update(answer.ips)
+        self.wildcards[zone] = ips
+        self.cache.put_wildcard(zone, ips)
+
+    def is_wildcard(self, domain: str, ips: List[str]) -> bool:
+        """
+        Функция проверяет, что все адреса ответа входят в wildcard отпечаток зоны домена.
+        """
+        wildcard_ips = self.wildcards.get(domain.rsplit('.', 1)[-1])
+        return bool(ips) and bool(wildcard_ips) and set(ips) <= wildcard_ips
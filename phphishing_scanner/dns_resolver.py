@@ -0,0 +1,270 @@
+import asyncio
+import ipaddress
+import random
+import socket
+import struct
+from collections import namedtuple
+from typing import List, Optional, Tuple
+
+DNS_PORT = 53
+QTYPE_A = 1
+QTYPE_CNAME = 5
+QTYPE_SOA = 6
+QCLASS_IN = 1
+FLAG_RD = 0x0100
+RCODE_NOERROR = 0
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+RCODE_REFUSED = 5
+RCODE_TIMEOUT = -1
+RCODE_INVALID = -2
+RETRY_RCODES = (RCODE_SERVFAIL, RCODE_REFUSED)
+FALLBACK_RESOLVERS = ('8.8.8.8', '1.1.1.1')
+
+DEFAULT_SOCKETS = 4
+DEFAULT_RATE = 5000
+DEFAULT_TIMEOUT = 2.0
+DEFAULT_RETRIES = 2
+
+answer_fields = ('domain', 'ips', 'ttl', 'rcode', 'negative_ttl')
+DnsAnswer = namedtuple('DnsAnswer', answer_fields, defaults=(None,) * len(answer_fields))
+
+
+def system_resolvers() -> List[str]:
+    """
+    Функция читает IPv4 адреса DNS серверов из /etc/resolv.conf, если их нет - возвращает публичные резолверы.
+    """
+    resolvers = list()
+    try:
+        with open('/etc/resolv.conf', 'r', encoding='utf8') as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == 'nameserver':
+                    try:
+                        if ipaddress.ip_address(parts[1]).version == 4:
+                            resolvers.append(parts[1])
+                    except ValueError:
+                        continue
+    except OSError:
+        pass
+    return resolvers or list(FALLBACK_RESOLVERS)
+
+
+class _ResolverProtocol(asyncio.DatagramProtocol):
+    """
+    Протокол UDP сокета, передающий полученные ответы в AsyncResolver.
+    """
+
+    def __init__(self, resolver: 'AsyncResolver', index: int) -> None:
+        self.resolver = resolver
+        self.index = index
+
+    def datagram_received(self, data: bytes, addr: tuple) -> None:
+        self.resolver._on_response(self.index, data, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        pass
+
+
+class AsyncResolver:
+    """
+    Класс асинхронного DNS резолвера, самостоятельно формирующего UDP запросы типа A.
+     Тысячи запросов одновременно обслуживаются несколькими сокетами, ответ сопоставляется
+     с запросом по номеру сокета, идентификатору запроса и имени в секции вопроса.
+     При таймауте или ответах SERVFAIL/REFUSED запрос повторяется через следующий резолвер из списка,
+     частота отправки запросов ограничена параметром rate.
+    :param resolvers - список DNS серверов в виде 'ip' или 'ip:port'.
+    :param sockets_count - количество UDP сокетов.
+    :param rate - максимальное количество запросов в секунду.
+    :param timeout - время ожидания ответа в секундах.
+    :param retries - количество повторных запросов.
+    """
+
+    def __init__(self, resolvers: Optional[List[str]] = None, sockets_count: int = DEFAULT_SOCKETS,
+                 rate: int = DEFAULT_RATE, timeout: float = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES) -> None:
+        self.resolvers = [self._parse_resolver(resolver) for resolver in (resolvers or system_resolvers())]
+        self.sockets_count = sockets_count
+        self.rate = rate
+        self.timeout = timeout
+        self.retries = retries
+        self.transports = list()
+        self._pending = dict()
+        self._next_send = 0.0
+        self._next_resolver = 0
+
+    async def __aenter__(self) -> 'AsyncResolver':
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    async def open(self) -> None:
+        loop = asyncio.get_event_loop()
+        for index in range(self.sockets_count):
+            transport, _ = await loop.create_datagram_endpoint(lambda i=index: _ResolverProtocol(self, i),
+                                                               local_addr=('0.0.0.0', 0))
+            self.transports.append(transport)
+
+    def close(self) -> None:
+        for transport in self.transports:
+            transport.close()
+        self.transports = list()
+        for future, _ in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+
+    async def resolve(self, domain: str) -> DnsAnswer:
+        """
+        Функция резолвит домен, при неудаче повторяет запрос через следующий резолвер.
+        :return: DnsAnswer со списком ip адресов и кодом ответа, RCODE_TIMEOUT если ответа не было.
+        """
+        try:
+            query_name = domain.encode('idna').lower()
+        except UnicodeError:
+            return DnsAnswer(domain, [], 0, RCODE_INVALID)
+        loop = asyncio.get_event_loop()
+        answer = DnsAnswer(domain, [], 0, RCODE_TIMEOUT)
+        for _ in range(self.retries + 1):
+            await self._wait_rate_limit()
+            resolver = self.resolvers[self._next_resolver % len(self.resolvers)]
+            self._next_resolver += 1
+            index = random.randrange(len(self.transports))
+            query_id = self._allocate_id(index)
+            try:
+                query = self._build_query(query_id, query_name)
+            except ValueError:
+                return DnsAnswer(domain, [], 0, RCODE_INVALID)
+            future = loop.create_future()
+            self._pending[(index, query_id)] = (future, (query_name, resolver))
+            try:
+                self.transports[index].sendto(query, resolver)
+                answer = await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                continue
+            finally:
+                self._pending.pop((index, query_id), None)
+            answer = answer._replace(domain=domain)
+            if answer.rcode not in RETRY_RCODES:
+                return answer
+        return answer
+
+    async def _wait_rate_limit(self) -> None:
+        """
+        Функция выделяет каждому запросу временной слот 1/rate секунды и ждет его наступления.
+        """
+        now = asyncio.get_event_loop().time()
+        self._next_send = max(self._next_send, now)
+        delay = self._next_send - now
+        self._next_send += 1 / self.rate
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _allocate_id(self, index: int) -> int:
+        while True:
+            query_id = random.getrandbits(16)
+            if (index, query_id) not in self._pending:
+                return query_id
+
+    def _on_response(self, index: int, data: bytes, addr: tuple) -> None:
+        """
+        Функция сопоставляет ответ с ожидающим запросом, ответы от других адресов и на другие имена отбрасываются.
+        """
+        if len(data) < 12:
+            return
+        query_id, = struct.unpack_from('!H', data)
+        pending = self._pending.get((index, query_id))
+        if pending is None:
+            return
+        future, (query_name, resolver) = pending
+        if future.done() or addr[:2] != resolver:
+            return
+        try:
+            answer = self._parse_response(data, query_name)
+        except (ValueError, IndexError, struct.error):
+            return
+        if answer is not None:
+            future.set_result(answer)
+
+    @staticmethod
+    def _build_query(query_id: int, query_name: bytes) -> bytes:
+        """
+        Функция формирует DNS запрос типа A с флагом рекурсии.
+        :raise ValueError: если имя домена нельзя закодировать в DNS формате.
+        """
+        labels = [label for label in query_name.split(b'.') if label]
+        if not labels or any(len(label) > 63 for label in labels):
+            raise ValueError(f'Некорректное доменное имя {query_name!r}')
+        qname = b''.join(struct.pack('!B', len(label)) + label for label in labels) + b'\x00'
+        if len(qname) > 255:
+            raise ValueError(f'Некорректное доменное имя {query_name!r}')
+        return struct.pack('!HHHHHH', query_id, FLAG_RD, 1, 0, 0, 0) + qname + struct.pack('!HH', QTYPE_A, QCLASS_IN)
+
+    @classmethod
+    def _parse_response(cls, data: bytes, query_name: bytes) -> Optional[DnsAnswer]:
+        """
+        Функция разбирает DNS ответ: код ответа, A записи (с учетом цепочки CNAME) и минимальный TTL.
+         Для отрицательных ответов TTL отсутствия домена берется из SOA записи секции authority.
+        :return: DnsAnswer или None, если ответ относится к другому имени.
+        """
+        _, flags, questions, answers, authorities, _ = struct.unpack_from('!HHHHHH', data)
+        offset = 12
+        for _ in range(questions):
+            name, offset = cls._read_name(data, offset)
+            if name.lower() != query_name.rstrip(b'.'):
+                return None
+            offset += 4
+        ips = list()
+        ttls = list()
+        for _ in range(answers):
+            _, offset = cls._read_name(data, offset)
+            record_type, _, ttl, length = struct.unpack_from('!HHIH', data, offset)
+            offset += 10
+            if record_type == QTYPE_A and length == 4:
+                ips.append(socket.inet_ntoa(data[offset:offset + 4]))
+                ttls.append(ttl)
+            offset += length
+        negative_ttl = None
+        for _ in range(authorities):
+            _, offset = cls._read_name(data, offset)
+            record_type, _, ttl, length = struct.unpack_from('!HHIH', data, offset)
+            offset += 10
+            if record_type == QTYPE_SOA:
+                _, soa_offset = cls._read_name(data, offset)
+                _, soa_offset = cls._read_name(data, soa_offset)
+                minimum, = struct.unpack_from('!I', data, soa_offset + 16)
+                negative_ttl = min(ttl, minimum)
+            offset += length
+        return DnsAnswer(query_name.decode('ascii'), ips, min(ttls) if ttls else 0, flags & 0x000F, negative_ttl)
+
+    @staticmethod
+    def _read_name(data: bytes, offset: int) -> Tuple[bytes, int]:
+        """
+        Функция читает доменное имя с учетом сжатия (указателей).
+        :return: имя и смещение сразу после имени в исходной позиции.
+        """
+        labels = list()
+        end_offset = None
+        jumps = 0
+        while True:
+            length = data[offset]
+            if length & 0xC0 == 0xC0:
+                if end_offset is None:
+                    end_offset = offset + 2
+                jumps += 1
+                if jumps > 64:
+                    raise ValueError('Цикл указателей в DNS ответе')
+                offset = struct.unpack_from('!H', data, offset)[0] & 0x3FFF
+                continue
+            if length == 0:
+                offset += 1
+                break
+            labels.append(data[offset + 1:offset + 1 + length])
+            offset += length + 1
+        return b'.'.join(labels), end_offset if end_offset is not None else offset
+
+    @staticmethod
+    def _parse_resolver(resolver: str) -> Tuple[str, int]:
+        host, _, port = resolver.strip().partition(':')
+        return str(ipaddress.IPv4Address(host)), int(port) if port else DNS_PORT
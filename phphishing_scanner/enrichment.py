@@ -0,0 +1,365 @@
+import asyncio
+import hashlib
+import re
+import socket
+import ssl
+from collections import defaultdict, namedtuple
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import SplitResult, urljoin, urlsplit
+
+DEFAULT_CONCURRENCY = 50
+DEFAULT_PER_IP_LIMIT = 2
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_MAX_SIZE = 512 * 1024
+DEFAULT_MAX_REDIRECTS = 3
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_HEADERS_SIZE = 16384
+CHUNK_SIZE = 16384
+SIMHASH_BITS = 64
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+SIMILARITY_WEIGHTS = {'dom': 0.5, 'title': 0.3, 'favicon': 0.2}
+
+FETCH_ERRORS = (OSError, EOFError, asyncio.TimeoutError, asyncio.LimitOverrunError, ValueError)
+
+HttpResponse = namedtuple('HttpResponse', ('url', 'status', 'headers', 'body'))
+fingerprint_fields = ('url', 'status', 'title', 'simhash', 'favicon_hash', 'size')
+PageFingerprint = namedtuple('PageFingerprint', fingerprint_fields, defaults=(None,) * len(fingerprint_fields))
+
+
+class _DomParser(HTMLParser):
+    """
+    Парсер HTML страницы: собирает заголовок, ссылку на иконку и признаки структуры DOM
+     (теги с классами и слова текста) для simhash.
+    """
+
+    def __init__(self) -> None:
+        super(_DomParser, self).__init__(convert_charrefs=True)
+        self.features = list()
+        self.title = ''
+        self.icon = None
+        self._in_title = False
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        attrs = dict(attrs)
+        self.features.append(tag)
+        for class_name in (attrs.get('class') or '').split():
+            self.features.append(f'{tag}.{class_name}')
+        if tag == 'title':
+            self._in_title = True
+        elif tag == 'link' and 'icon' in (attrs.get('rel') or '').lower().split() and attrs.get('href'):
+            self.icon = self.icon or attrs['href']
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == 'title':
+            self._in_title = False
+
+    def handle_data(self, data: str) -> None:
+        if self._in_title:
+            self.title += data
+        self.features.extend(word.lower() for word in re.findall(r'\w{3,}', data))
+
+
+def simhash(features: List[str]) -> int:
+    """
+    Функция вычисляет 64 битный simhash набора признаков: похожие страницы дают близкие по расстоянию
+     Хэмминга значения.
+    """
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        value = int.from_bytes(hashlib.blake2b(feature.encode('utf8'), digest_size=8).digest(), 'little')
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+
+def similarity(page: PageFingerprint, reference: PageFingerprint) -> float:
+    """
+    Функция оценивает схожесть страницы с эталонной страницей бренда числом от 0 до 1:
+     взвешенная сумма схожести simhash DOM, совпадения слов заголовка и совпадения иконки.
+    """
+    score = 0.0
+    if page.simhash is not None and reference.simhash is not None:
+        distance = bin(page.simhash ^ reference.simhash).count('1')
+        score += SIMILARITY_WEIGHTS['dom'] * (1 - distance / SIMHASH_BITS)
+    page_words = set(re.findall(r'\w+', (page.title or '').lower()))
+    reference_words = set(re.findall(r'\w+', (reference.title or '').lower()))
+    if page_words and reference_words:
+        score += SIMILARITY_WEIGHTS['title'] * len(page_words & reference_words) / len(page_words | reference_words)
+    if page.favicon_hash and page.favicon_hash == reference.favicon_hash:
+        score += SIMILARITY_WEIGHTS['favicon']
+    return round(score, 4)
+
+
+class HttpFetcher:
+    """
+    Класс асинхронной загрузки страниц по HTTP(S) с пулом keep-alive подключений.
+     Подключение выполняется к уже известному ip адресу с заголовком Host и SNI домена.
+     Общее количество одновременных загрузок ограничено concurrency, к одному ip адресу -
+     per_ip_limit, чтобы не перегружать виртуальный хостинг с множеством доменов на одном адресе.
+     Тело ответа читается не более max_size байт, сертификат сервера не проверяется.
+     Перенаправления в пределах того же домена (например с / на страницу входа) выполняются
+     не более max_redirects раз, поскольку фишинговые наборы часто отдают на главной только перенаправление.
+    :param concurrency - максимальное количество одновременных загрузок.
+    :param per_ip_limit - максимальное количество одновременных подключений к одному ip адресу.
+    :param timeout - время ожидания подключения и ответа в секундах.
+    :param max_size - максимальный размер тела ответа в байтах.
+    :param max_redirects - максимальное количество перенаправлений в пределах домена.
+    """
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, per_ip_limit: int = DEFAULT_PER_IP_LIMIT,
+                 timeout: float = DEFAULT_TIMEOUT, max_size: int = DEFAULT_MAX_SIZE,
+                 max_redirects: int = DEFAULT_MAX_REDIRECTS) -> None:
+        self.timeout = timeout
+        self.max_size = max_size
+        self.max_redirects = max_redirects
+        self.per_ip_limit = per_ip_limit
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._ip_semaphores: Dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(per_ip_limit))
+        self._pool: Dict[Tuple[str, int, str], list] = defaultdict(list)
+        self._ssl_context = self._create_ssl_context()
+
+    async def fetch(self, host: str, ip: str, path: str = '/',
+                    scheme: Optional[str] = None) -> Optional[HttpResponse]:
+        """
+        Функция загружает страницу домена host с адреса ip. Если схема не задана, сначала пробует HTTPS, затем HTTP.
+         Перенаправления на тот же домен выполняются, пока их не больше max_redirects.
+        :return: HttpResponse или None, если страница недоступна.
+        """
+        response = await self._fetch(host, ip, path, scheme)
+        for _ in range(self.max_redirects):
+            location = self._redirect_location(host, response)
+            if location is None:
+                break
+            path = (location.path or '/') + (f'?{location.query}' if location.query else '')
+            redirected = await self._fetch(host, ip, path, location.scheme)
+            if redirected is None:
+                break
+            response = redirected
+        return response
+
+    def release(self, host: str) -> None:
+        """
+        Функция закрывает подключения пула к домену host, когда загрузки с него закончены.
+        """
+        for key in [key for key in self._pool if key[2] == host]:
+            for _, writer in self._pool.pop(key):
+                writer.close()
+
+    def close(self) -> None:
+        for connections in self._pool.values():
+            for _, writer in connections:
+                writer.close()
+        self._pool.clear()
+
+    async def _fetch(self, host: str, ip: str, path: str, scheme: Optional[str]) -> Optional[HttpResponse]:
+        for current_scheme in ((scheme,) if scheme else ('https', 'http')):
+            async with self._ip_semaphores[ip], self._semaphore:
+                try:
+                    return await asyncio.wait_for(self._request(current_scheme, host, ip, path), self.timeout)
+                except FETCH_ERRORS:
+                    continue
+        return None
+
+    @staticmethod
+    def _redirect_location(host: str, response: Optional[HttpResponse]) -> Optional[SplitResult]:
+        """
+        Функция возвращает разобранный адрес перенаправления, если оно ведет на тот же домен и порт по умолчанию.
+        """
+        if response is None or response.status not in REDIRECT_STATUSES or not response.headers.get('location'):
+            return None
+        try:
+            location = urlsplit(urljoin(response.url, response.headers['location']))
+            port = location.port
+        except ValueError:
+            return None
+        if location.scheme not in ('http', 'https') or port is not None or location.hostname != host.lower():
+            return None
+        return location
+
+    async def _request(self, scheme: str, host: str, ip: str, path: str) -> HttpResponse:
+        """
+        Функция выполняет запрос через подключение из пула, если сервер успел закрыть его - через новое подключение.
+        """
+        port = 443 if scheme == 'https' else 80
+        key = (ip, port, host)
+        while self._pool[key]:
+            reader, writer = self._pool[key].pop()
+            try:
+                return await self._exchange(scheme, host, path, key, reader, writer)
+            except FETCH_ERRORS:
+                continue
+        reader, writer = await self._connect(scheme, host, ip, port)
+        return await self._exchange(scheme, host, path, key, reader, writer)
+
+    async def _connect(self, scheme: str, host: str, ip: str,
+                       port: int) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        if scheme == 'https':
+            return await asyncio.open_connection(ip, port, ssl=self._ssl_context, server_hostname=host)
+        return await asyncio.open_connection(ip, port)
+
+    async def _exchange(self, scheme: str, host: str, path: str, key: Tuple[str, int, str],
+                        reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> HttpResponse:
+        """
+        Функция отправляет запрос и читает ответ, после полного ответа подключение возвращается в пул.
+        """
+        try:
+            request = (f'GET {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: {USER_AGENT}\r\n'
+                       f'Accept: */*\r\nAccept-Encoding: identity\r\nConnection: keep-alive\r\n\r\n')
+            writer.write(request.encode('ascii', errors='ignore'))
+            status, headers = await self._read_headers(reader)
+            body, reusable = await self._read_body(reader, headers)
+        except BaseException:
+            writer.close()
+            raise
+        if reusable and headers.get('connection', '').lower() != 'close':
+            self._pool[key].append((reader, writer))
+        else:
+            writer.close()
+        return HttpResponse(f'{scheme}://{host}{path}', status, headers, body)
+
+    @staticmethod
+    async def _read_headers(reader: asyncio.StreamReader) -> Tuple[int, Dict[str, str]]:
+        """
+        Функция читает строку статуса и заголовки ответа.
+        :raise ValueError: если ответ не является HTTP ответом.
+        """
+        data = await reader.readuntil(b'\r\n\r\n')
+        if len(data) > MAX_HEADERS_SIZE:
+            raise ValueError('Слишком большие заголовки ответа')
+        lines = data.decode('latin-1').split('\r\n')
+        parts = lines[0].split(' ', 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise ValueError(f'Некорректная строка статуса {lines[0]!r}')
+        headers = dict()
+        for line in lines[1:]:
+            name, separator, value = line.partition(':')
+            if separator:
+                headers[name.strip().lower()] = value.strip()
+        return int(parts[1]), headers
+
+    async def _read_body(self, reader: asyncio.StreamReader, headers: Dict[str, str]) -> Tuple[bytes, bool]:
+        """
+        Функция читает тело ответа с учетом Content-Length и chunked кодирования, но не более max_size байт.
+        :return: тело и признак того, что подключение можно использовать повторно.
+        """
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = b''
+            while True:
+                size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+                if not size:
+                    await reader.readline()
+                    return body, True
+                if len(body) + size > self.max_size:
+                    return body + await reader.read(self.max_size - len(body)), False
+                body += await reader.readexactly(size)
+                await reader.readline()
+        if 'content-length' in headers:
+            length = int(headers['content-length'])
+            if length > self.max_size:
+                return await reader.read(self.max_size), False
+            return await reader.readexactly(length), True
+        body = b''
+        while len(body) < self.max_size:
+            chunk = await reader.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            body += chunk
+        return body[:self.max_size], False
+
+    @staticmethod
+    def _create_ssl_context() -> ssl.SSLContext:
+        """
+        Функция создает TLS контекст без проверки сертификата: у фишинговых сайтов он часто недействителен.
+        """
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+
+
+class Enricher:
+    """
+    Класс этапа обогащения найденных доменов: загружает главную страницу и иконку сайта,
+     снимает отпечаток (заголовок, simhash DOM, хэш иконки) и сравнивает его с отпечатком
+     легитимного сайта бренда. Результаты ранжируются по убыванию схожести.
+    :param reference_host - домен легитимного сайта бренда (например group-ib.com).
+    :param fetcher - загрузчик страниц.
+    """
+
+    def __init__(self, reference_host: str, fetcher: HttpFetcher) -> None:
+        self.reference_host = reference_host
+        self.fetcher = fetcher
+        self.reference = None
+        self.results = list()
+
+    async def prepare(self) -> None:
+        """
+        Функция снимает отпечаток легитимного сайта бренда, ip адрес которого определяется системным резолвером.
+        """
+        loop = asyncio.get_event_loop()
+        try:
+            addresses = await loop.getaddrinfo(self.reference_host, None, family=socket.AF_INET,
+                                               type=socket.SOCK_STREAM)
+        except OSError:
+            addresses = list()
+        fingerprint = None
+        if addresses:
+            fingerprint = await self.fingerprint(self.reference_host, addresses[0][4][0])
+        self.reference = fingerprint or PageFingerprint()
+
+    async def enrich(self, domain: str, ip: str) -> Optional[dict]:
+        """
+        Функция снимает отпечаток домена, сравнивает его с эталоном и сохраняет результат.
+        """
+        page = await self.fingerprint(domain, ip)
+        if page is None:
+            return None
+        result = dict(page._asdict(), domain=domain, ip=ip, similarity=similarity(page, self.reference))
+        if page.simhash is not None:
+            result['simhash'] = f'{page.simhash:016x}'
+        self.results.append(result)
+        return result
+
+    def ranked(self) -> List[dict]:
+        """
+        Функция возвращает результаты по убыванию схожести с сайтом бренда.
+        """
+        return sorted(self.results, key=lambda result: -result['similarity'])
+
+    async def fingerprint(self, host: str, ip: str) -> Optional[PageFingerprint]:
+        response = await self.fetcher.fetch(host, ip)
+        if response is None:
+            return None
+        parser = _DomParser()
+        try:
+            parser.feed(response.body.decode(self._charset(response.headers), errors='replace'))
+            parser.close()
+        except (AssertionError, LookupError):
+            pass
+        favicon_hash = await self._favicon_hash(host, ip, response, parser.icon)
+        self.fetcher.release(host)
+        return PageFingerprint(response.url, response.status, ' '.join(parser.title.split()),
+                               simhash(parser.features) if parser.features else None, favicon_hash,
+                               len(response.body))
+
+    async def _favicon_hash(self, host: str, ip: str, page: HttpResponse, icon: Optional[str]) -> Optional[str]:
+        """
+        Функция загружает иконку сайта (из link rel=icon, если она на том же домене, иначе /favicon.ico).
+         Относительная ссылка на иконку разрешается от адреса страницы, а не от корня сайта.
+        """
+        scheme = urlsplit(page.url).scheme
+        path = '/favicon.ico'
+        if icon:
+            parts = urlsplit(urljoin(page.url, icon))
+            if parts.netloc.lower() == host.lower():
+                path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        response = await self.fetcher.fetch(host, ip, path, scheme)
+        if response is None or response.status != 200 or not response.body:
+            return None
+        return hashlib.md5(response.body).hexdigest()
+
+    @staticmethod
+    def _charset(headers: Dict[str, str]) -> str:
+        match = re.search(r'charset=([\w-]+)', headers.get('content-type', ''), re.IGNORECASE)
+        return match.group(1) if match else 'utf8'
@@ -1,5 +1,18 @@
 # -*- coding: utf-8 -*-
-from phishing_scanner import PhishingScanner
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.distributed import DEFAULT_LEASE_TIMEOUT
+from common.scheduler import interrupt_handler
+from common.sinks import SINK_FORMATS
+from daemon import PhishingDaemon, DEFAULT_MAX_RECHECK, DEFAULT_MIN_INTERVAL, DEFAULT_MIN_RECHECK, read_brands
+from dns_resolver import DEFAULT_RATE, DEFAULT_RETRIES, DEFAULT_TIMEOUT
+from enrichment import DEFAULT_PER_IP_LIMIT
+from permutations import DEFAULT_MAX_DISTANCE
+from phishing_scanner import PhishingScanner, DEFAULT_CONCURRENCY, DEFAULT_LEASE_SIZE
+from strategies import HOMOGLYPH_ORDERS, ORDER_PRIORITY, STRATEGY_REGISTRY
 import argparse
 
 
@@ -7,15 +20,108 @@ def main():
     parser = argparse.ArgumentParser(prog='',
                                      description='Консольное приложение для поиска фишинговых ресурсов.',
                                      usage='%(prog)s [options]')
-    parser.add_argument('domain_string', type=str, help='входное значение(например group-ib)')
+    parser.add_argument('domain_string', type=str, nargs='?', default='', help='входное значение(например group-ib)')
 
     parser.add_argument('--ip_log_file', type=str, default='ip_log_file.log', help="Файл для сохранения результата."
                                                                              "По умолчанию ip_log_file.log")
+    parser.add_argument('--log_format', type=str, default=None, choices=list(SINK_FORMATS),
+                        help="Формат файла результата. По умолчанию определяется по расширению файла")
+    parser.add_argument('--resolvers', type=str, default=None,
+                        help="DNS серверы через запятую (например 8.8.8.8,1.1.1.1:53). "
+                             "По умолчанию из /etc/resolv.conf")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Максимальное количество одновременных DNS запросов. По умолчанию {DEFAULT_CONCURRENCY}")
+    parser.add_argument('--rate', type=int, default=DEFAULT_RATE,
+                        help=f"Максимальное количество DNS запросов в секунду. По умолчанию {DEFAULT_RATE}")
+    parser.add_argument('--per_target_rate', type=float, default=0,
+                        help="Максимальное количество DNS запросов в секунду к доменам одной зоны. "
+                             "По умолчанию без ограничения")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help=f"Время ожидания DNS ответа в секундах. По умолчанию {DEFAULT_TIMEOUT}")
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help=f"Количество повторных DNS запросов. По умолчанию {DEFAULT_RETRIES}")
+    parser.add_argument('--cache_file', type=str, default='dns_cache.json',
+                        help="Файл кэша DNS ответов между запусками. По умолчанию dns_cache.json")
+    parser.add_argument('--max_distance', type=int, default=DEFAULT_MAX_DISTANCE,
+                        help=f"Максимальное количество символов, заменяемых на homoglyph. "
+                             f"По умолчанию {DEFAULT_MAX_DISTANCE}")
+    parser.add_argument('--homoglyph_order', type=str, default=ORDER_PRIORITY, choices=HOMOGLYPH_ORDERS,
+                        help=f"Порядок обхода замен homoglyph: {ORDER_PRIORITY} - сначала самые похожие домены. "
+                             f"По умолчанию {ORDER_PRIORITY}")
+    parser.add_argument('--homoglyph_sample', type=int, default=None,
+                        help="Проверить только указанное количество случайных замен homoglyph")
+    parser.add_argument('--strategies', dest='enabled_strategies', type=str, default=None,
+                        help=f"Стратегии через запятую, доступные: {', '.join(STRATEGY_REGISTRY)}. По умолчанию все")
+    parser.add_argument('--disable_strategies', dest='disabled_strategies', type=str, default=None,
+                        help="Отключенные стратегии через запятую")
+    parser.add_argument('--enrich_host', type=str, default=None,
+                        help="Домен легитимного сайта бренда (например group-ib.com): найденные домены загружаются "
+                             "по HTTP(S) и ранжируются по схожести заголовка, DOM и иконки с ним")
+    parser.add_argument('--enrich_file', type=str, default='enrichment.jsonl',
+                        help="Файл результата обогащения. По умолчанию enrichment.jsonl")
+    parser.add_argument('--per_ip_limit', type=int, default=DEFAULT_PER_IP_LIMIT,
+                        help=f"Максимальное количество одновременных HTTP подключений к одному ip адресу. "
+                             f"По умолчанию {DEFAULT_PER_IP_LIMIT}")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Режим непрерывного мониторинга: домены перепроверяются по истечении TTL, "
+                             "в файл результата дописываются только изменения")
+    parser.add_argument('--brands_file', type=str, default=None,
+                        help="Файл со списком брендов для режима мониторинга, по бренду на строку")
+    parser.add_argument('--state_db', type=str, default='phishing_state.db',
+                        help="База данных состояния доменов для режима мониторинга. По умолчанию phishing_state.db")
+    parser.add_argument('--min_interval', type=float, default=DEFAULT_MIN_INTERVAL,
+                        help=f"Минимальная пауза между циклами мониторинга в секундах. "
+                             f"По умолчанию {DEFAULT_MIN_INTERVAL}")
+    parser.add_argument('--min_recheck', type=float, default=DEFAULT_MIN_RECHECK,
+                        help=f"Минимальный интервал перепроверки домена в секундах. По умолчанию {DEFAULT_MIN_RECHECK}")
+    parser.add_argument('--max_recheck', type=float, default=DEFAULT_MAX_RECHECK,
+                        help=f"Максимальный интервал перепроверки домена в секундах. "
+                             f"По умолчанию {DEFAULT_MAX_RECHECK}")
+    parser.add_argument('--serve', type=str, default=None,
+                        help="Запустить координатор распределенного скана на адресе host:port (например 0.0.0.0:8750)")
+    parser.add_argument('--join', type=str, default=None,
+                        help="Работать воркером распределенного скана координатора по адресу "
+                             "(например http://10.0.0.1:8750), domain_string не указывается")
+    parser.add_argument('--lease_size', type=int, default=DEFAULT_LEASE_SIZE,
+                        help=f"Количество доменов в одной аренде распределенного скана. "
+                             f"По умолчанию {DEFAULT_LEASE_SIZE}")
+    parser.add_argument('--lease_timeout', type=float, default=DEFAULT_LEASE_TIMEOUT,
+                        help=f"Время в секундах, после которого аренда без ответа воркера передается другому воркеру. "
+                             f"По умолчанию {DEFAULT_LEASE_TIMEOUT}")
+    parser.add_argument('--local_workers', type=int, default=0,
+                        help="Количество воркеров, запускаемых координатором на этой машине. По умолчанию 0")
+    parser.add_argument('--metrics_file', type=str, default=None,
+                        help="Файл, в который раз в секунду записываются метрики скана в формате Prometheus")
+    parser.add_argument('--metrics_listen', type=str, default=None,
+                        help="Адрес host:port, по которому метрики отдаются по HTTP на пути /metrics "
+                             "(например 127.0.0.1:9100)")
+    parser.add_argument('--progress', action='store_true',
+                        help="Выводить строку прогресса (скорость, длительность этапов, найденные домены) на stderr")
     args = parser.parse_args()
     args_dict = vars(args)
-    scanner = PhishingScanner(**args_dict)
+    if args_dict['daemon'] and (args_dict['serve'] or args_dict['join']):
+        parser.error('режим мониторинга не поддерживает распределенный скан')
+    if not args_dict['domain_string'] and not args_dict['join'] and not args_dict['daemon']:
+        parser.error('необходимо указать domain_string')
+    if args_dict['resolvers']:
+        args_dict['resolvers'] = args_dict['resolvers'].split(',')
+    for key in ('enabled_strategies', 'disabled_strategies'):
+        if args_dict[key]:
+            args_dict[key] = args_dict[key].split(',')
+    daemon_keys = ('daemon', 'brands_file', 'state_db', 'min_interval', 'min_recheck', 'max_recheck')
+    daemon_args = {key: args_dict.pop(key) for key in daemon_keys}
+    if daemon_args.pop('daemon'):
+        for key in ('serve', 'join', 'lease_size', 'lease_timeout', 'local_workers'):
+            args_dict.pop(key)
+        brands = read_brands(args_dict.pop('domain_string'), daemon_args.pop('brands_file'))
+        if not brands:
+            parser.error('необходимо указать domain_string или brands_file')
+        scanner = PhishingDaemon(brands, **daemon_args, **args_dict)
+    else:
+        scanner = PhishingScanner(**args_dict)
     scanner.start()
-    scanner.join()
+    with interrupt_handler(lambda: None):
+        scanner.join()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,147 @@
+import heapq
+import itertools
+import math
+import random
+from collections import namedtuple
+from typing import Iterator, List, Optional, Tuple
+
+from confusables import DEFAULT_TABLE_PATH, get_glyphs, similarity
+
+DEFAULT_MAX_DISTANCE = 2
+
+Substitution = namedtuple('Substitution', ('cost', 'position', 'glyph'))
+
+
+class HomoglyphPermutations:
+    """
+    Класс пространства замен символов слова на похожие по написанию.
+     Кандидат - набор от 1 до max_distance позиций слова, в каждой из которых символ заменен
+     на один из его homoglyph. Все кандидаты пронумерованы (сначала по количеству замен, затем
+     по позициям и вариантам замен), по номеру кандидат вычисляется без перебора предыдущих,
+     поэтому точное количество известно заранее, а пространство можно делить на шарды и
+     выбирать случайные кандидаты. Отдельно поддерживается обход от самых похожих на исходное
+     слово кандидатов к наименее похожим.
+    :param word - исходное слово.
+    :param max_distance - максимальное количество замененных символов.
+    :param table_path - путь к таблице confusables.
+    """
+
+    def __init__(self, word: str, max_distance: int = DEFAULT_MAX_DISTANCE,
+                 table_path: str = DEFAULT_TABLE_PATH) -> None:
+        self.word = word.lower()
+        self.max_distance = max_distance
+        self.options = [self._prepare_options(char, table_path) for char in self.word]
+        self._ways = self._prepare_ways()
+        self.counts = [self._ways[0][distance] for distance in range(1, max_distance + 1)]
+        self.count = sum(self.counts)
+        self._substitutions = sorted(Substitution(-math.log(similarity(self.word[position], glyph)), position, glyph)
+                                     for position, glyphs in enumerate(self.options) for glyph in glyphs)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[str]:
+        return self.shard(0, 1)
+
+    def shard(self, index: int, count: int) -> Iterator[str]:
+        """
+        Функция лениво генерирует кандидатов шарда index из count. Шарды не пересекаются и вместе покрывают
+         все пространство.
+        """
+        for rank in range(index, self.count, count):
+            yield self.unrank(rank)
+
+    def sample(self, size: int, seed: Optional[int] = None) -> Iterator[str]:
+        """
+        Функция генерирует size случайных неповторяющихся кандидатов.
+        """
+        for rank in random.Random(seed).sample(range(self.count), min(size, self.count)):
+            yield self.unrank(rank)
+
+    def unrank(self, rank: int) -> str:
+        """
+        Функция вычисляет кандидата по его порядковому номеру.
+        :raise IndexError: если номер вне пространства кандидатов.
+        """
+        if not 0 <= rank < self.count:
+            raise IndexError(f'Номер кандидата {rank} вне диапазона 0..{self.count - 1}')
+        distance = 1
+        while rank >= self._ways[0][distance]:
+            rank -= self._ways[0][distance]
+            distance += 1
+        word = list(self.word)
+        for position, glyphs in enumerate(self.options):
+            if not distance:
+                break
+            skipped = self._ways[position + 1][distance]
+            if rank < skipped:
+                continue
+            rank -= skipped
+            glyph_index, rank = divmod(rank, self._ways[position + 1][distance - 1])
+            word[position] = glyphs[glyph_index]
+            distance -= 1
+        return ''.join(word)
+
+    def by_priority(self) -> Iterator[str]:
+        """
+        Функция генерирует кандидатов по убыванию визуальной схожести с исходным словом.
+         Схожесть кандидата - произведение схожестей его замен, замены отсортированы по стоимости
+         (минус логарифм схожести), и наборы замен обходятся через кучу по возрастанию суммарной стоимости:
+         у каждого набора есть не более двух последователей - добавление следующей замены и
+         сдвиг последней замены, поэтому каждый набор выдается ровно один раз.
+        """
+        counter = itertools.count()
+        heap = list()
+
+        def push(indices: Tuple[int, ...]) -> None:
+            cost = sum(self._substitutions[index].cost for index in indices)
+            heapq.heappush(heap, (cost, next(counter), indices))
+
+        first = self._next_substitution(0, ())
+        if first is not None:
+            push((first,))
+        while heap:
+            _, _, indices = heapq.heappop(heap)
+            word = list(self.word)
+            for index in indices:
+                word[self._substitutions[index].position] = self._substitutions[index].glyph
+            yield ''.join(word)
+            if len(indices) < self.max_distance:
+                following = self._next_substitution(indices[-1] + 1, indices)
+                if following is not None:
+                    push(indices + (following,))
+            following = self._next_substitution(indices[-1] + 1, indices[:-1])
+            if following is not None:
+                push(indices[:-1] + (following,))
+
+    def _next_substitution(self, start: int, indices: Tuple[int, ...]) -> Optional[int]:
+        """
+        Функция ищет первую замену начиная с start, позиция которой не занята заменами indices.
+        """
+        positions = {self._substitutions[index].position for index in indices}
+        for index in range(start, len(self._substitutions)):
+            if self._substitutions[index].position not in positions:
+                return index
+        return None
+
+    def _prepare_ways(self) -> List[List[int]]:
+        """
+        Функция считает ways[i][k] - количество способов выполнить ровно k замен в позициях от i до конца слова.
+        """
+        ways = [[0] * (self.max_distance + 1) for _ in range(len(self.word) + 1)]
+        ways[len(self.word)][0] = 1
+        for position in range(len(self.word) - 1, -1, -1):
+            ways[position][0] = 1
+            for distance in range(1, self.max_distance + 1):
+                ways[position][distance] = (ways[position + 1][distance] +
+                                            len(self.options[position]) * ways[position + 1][distance - 1])
+        return ways
+
+    @staticmethod
+    def _prepare_options(char: str, table_path: str) -> List[str]:
+        """
+        Функция возвращает уникальные замены символа в нижнем регистре, от самых похожих к наименее похожим.
+        """
+        glyphs = [glyph for glyph in dict.fromkeys(glyph.lower() for glyph in get_glyphs(char, table_path))
+                  if glyph != char]
+        return sorted(glyphs, key=lambda glyph: -similarity(char, glyph))
@@ -1,33 +1,120 @@
+import asyncio
 import os
-from multiprocessing import Process, Queue
-import socket
-from queue import Empty
+import sys
+from collections import Counter
+from functools import partial
+from itertools import islice
+from multiprocessing import Process
+from typing import Iterator, List, Optional, Tuple
 
-from strategies import HomoglyphGeneratorStrategy, AdditionalSymbolStrategy, AddSubDomainStrategy, \
-    RemoveSymbolStrategy
-
-STRATEGIES = [HomoglyphGeneratorStrategy, AdditionalSymbolStrategy,
-              AddSubDomainStrategy, RemoveSymbolStrategy]
+from candidates import CandidatePipeline
+from common.distributed import DEFAULT_LEASE_TIMEOUT, Coordinator, Lease, LeaseClient
+from common.metrics import Metrics, MetricsReporter, ratio
+from common.scheduler import EXECUTOR_ASYNCIO, INTERRUPT_MESSAGE, Scheduler, interrupt_handler
+from common.sinks import create_sink
+from dns_cache import DnsCache, WildcardDetector
+from dns_resolver import AsyncResolver, DEFAULT_RATE, DEFAULT_RETRIES, DEFAULT_TIMEOUT
+from enrichment import Enricher, HttpFetcher, DEFAULT_PER_IP_LIMIT
+from permutations import DEFAULT_MAX_DISTANCE
+from strategies import HomoglyphGeneratorStrategy, ORDER_PRIORITY, get_strategies
 
 DOMAIN_ZONES = ('com', 'ru', 'net', 'org', 'info', 'cn', 'es', 'top', 'au', 'pl', 'it', 'uk', 'tk', 'ml', 'ga', 'cf',
                 'us', 'xyz', 'top', 'site', 'win', 'bid')
 
+RESULT_FIELDS = ('domain', 'ip', 'strategy')
+ENRICH_FIELDS = ('similarity', 'domain', 'ip', 'url', 'status', 'title', 'simhash', 'favicon_hash', 'size')
+ENRICH_TOP = 10
+DEFAULT_CONCURRENCY = 1000
+DEFAULT_LEASE_SIZE = 5000
+
 
 class PhishingScanner(Process):
     """
-    Главный класс-процесс, отвечает за подготовку начальных данных, генерацию и запуск под-процессов.
+    Главный класс-процесс, отвечает за подготовку начальных данных и асинхронное разрешение доменов.
+    Найденные домены записываются в файл результата и выводятся на консоль по мере поступления.
+    :param resolvers - список DNS серверов, по умолчанию из /etc/resolv.conf.
+    :param concurrency - максимальное количество одновременных DNS запросов.
+    :param rate - максимальное количество DNS запросов в секунду.
+    :param timeout - время ожидания DNS ответа в секундах.
+    :param retries - количество повторных DNS запросов.
+    :param cache_file - файл кэша DNS ответов между запусками, пустая строка отключает сохранение кэша.
+    :param max_distance - максимальное количество символов, заменяемых на homoglyph.
+    :param homoglyph_order - порядок обхода замен homoglyph.
+    :param homoglyph_sample - количество случайных замен homoglyph, None - все замены.
+    :param enabled_strategies - имена включенных стратегий, None - все зарегистрированные.
+    :param disabled_strategies - имена отключенных стратегий.
+    :param enrich_host - домен легитимного сайта бренда, если задан - найденные домены загружаются по HTTP(S)
+     и ранжируются по схожести с ним.
+    :param enrich_file - файл результата обогащения.
+    :param per_ip_limit - максимальное количество одновременных HTTP подключений к одному ip адресу.
+    :param per_target_rate - максимальное количество DNS запросов в секунду к доменам одной зоны,
+     0 - без ограничения. По SIGINT новые домены не резолвятся, найденные сохраняются.
+    :param serve - адрес host:port координатора распределенного скана: сгенерированные домены делятся на аренды
+     по lease_size доменов, которые резолвят подключившиеся воркеры. Обогащение в этом режиме не выполняется.
+    :param join - адрес координатора (например http://10.0.0.1:8750), в этом режиме процесс работает воркером
+     и резолвит домены аренд координатора, domain_string и стратегии не используются.
+    :param lease_size - количество доменов в одной аренде.
+    :param lease_timeout - время в секундах, после которого аренда без ответа воркера передается другому воркеру.
+    :param local_workers - количество локальных воркеров, запускаемых координатором.
+    :param metrics_file - файл, в который раз в секунду записываются метрики скана в формате Prometheus.
+    :param metrics_listen - адрес host:port, по которому метрики отдаются по HTTP (GET /metrics).
+    :param progress - выводить строку прогресса на stderr.
     """
 
-    def __init__(self, domain_string: str, ip_log_file: str = 'ip_log_file.log') -> None:
+    def __init__(self, domain_string: str, ip_log_file: str = 'ip_log_file.log',
+                 log_format: Optional[str] = None, resolvers: Optional[List[str]] = None,
+                 concurrency: int = DEFAULT_CONCURRENCY, rate: int = DEFAULT_RATE,
+                 timeout: float = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 cache_file: str = 'dns_cache.json', max_distance: int = DEFAULT_MAX_DISTANCE,
+                 homoglyph_order: str = ORDER_PRIORITY, homoglyph_sample: Optional[int] = None,
+                 enabled_strategies: Optional[List[str]] = None, disabled_strategies: Optional[List[str]] = None,
+                 enrich_host: Optional[str] = None, enrich_file: str = 'enrichment.jsonl',
+                 per_ip_limit: int = DEFAULT_PER_IP_LIMIT, per_target_rate: float = 0, serve: Optional[str] = None,
+                 join: Optional[str] = None, lease_size: int = DEFAULT_LEASE_SIZE,
+                 lease_timeout: float = DEFAULT_LEASE_TIMEOUT, local_workers: int = 0,
+                 metrics_file: Optional[str] = None, metrics_listen: Optional[str] = None,
+                 progress: bool = False) -> None:
         super(PhishingScanner, self).__init__()
         self.domain_string = domain_string
-        self.phishing_domains = list()
-        self.domains_ip_queue = Queue()
-        self.domains = list()
-        self.scanners = list()
-        self.results = dict()
+        self.candidates = None
+        self.resolvers = resolvers
+        self.concurrency = concurrency
+        self.rate = rate
+        self.per_target_rate = per_target_rate
+        self.scheduler = None
+        self.timeout = timeout
+        self.retries = retries
+        self.cache = DnsCache(cache_file or None)
+        self.wildcards = None
+        self.results_count = 0
+        self.wildcard_count = 0
         self._strategies = list()
+        self.enabled_strategies = enabled_strategies
+        self.disabled_strategies = disabled_strategies or list()
+        self.resolved = Counter()
+        self.strategy_options = {
+            HomoglyphGeneratorStrategy.name: {'max_distance': max_distance, 'order': homoglyph_order,
+                                              'sample': homoglyph_sample},
+        }
+        self.enrich_host = enrich_host
+        self.enrich_file = enrich_file
+        self.per_ip_limit = per_ip_limit
+        self.enricher = None
+        self._enrich_tasks = list()
         self.ip_log_file = ip_log_file
+        self.log_format = log_format
+        self.sink = None
+        self.serve = serve
+        self.join_url = join
+        self.lease_size = lease_size
+        self.lease_timeout = lease_timeout
+        self.local_workers = local_workers
+        self.coordinator = None
+        self.lease = None
+        self.metrics = Metrics()
+        self.metrics_file = metrics_file
+        self.metrics_listen = metrics_listen
+        self.progress = progress
 
     @property
     def strategies(self) -> list:
@@ -37,88 +124,267 @@ class PhishingScanner(Process):
         return self._strategies
 
     def run(self) -> None:
+        if self.join_url:
+            with self._prepare_reporter('domains'):
+                self._run_lease_worker()
+            return
         self._prepare_strategies()
-        for strategy in self.strategies:
-            strategy.perform_strategy()
         self._prepare_domains()
-        self._generate_scanners()
-        for scanner in self.scanners:
-            scanner.start()
-        while True:
-            try:
-                ip_addr = self.domains_ip_queue.get(timeout=0.001)
-                self.results.update(ip_addr)
-            except Empty:
-                if not any(scanner.is_alive() for scanner in self.scanners):
-                    break
-        for scanner in self.scanners:
-            scanner.join()
-        self._write_log_file()
+        self._prepare_sink()
+        self._prepare_scheduler()
+        with self.sink, self._prepare_reporter('leases' if self.serve else 'domains'), \
+                interrupt_handler(self._interrupt, INTERRUPT_MESSAGE):
+            if self.serve:
+                self._run_coordinator()
+            else:
+                asyncio.run(self._resolve_domains())
         self._print_finishing_msg()
+        if self.enricher is not None:
+            self._save_enrichment()
+
+    def _interrupt(self) -> None:
+        self.scheduler.cancel()
+        if self.coordinator is not None:
+            self.coordinator.cancel()
 
     def _prepare_strategies(self) -> None:
         """
-        Функция запускает необходимые стратегии для генерации данных.
+        Функция создает включенные стратегии из реестра для генерации данных.
         """
-        for strategy in STRATEGIES:
-            self._strategies.append(strategy(self.domain_string, self.phishing_domains))
+        try:
+            strategies = get_strategies(self.enabled_strategies, self.disabled_strategies)
+        except ValueError as err:
+            sys.exit(err)
+        for strategy in strategies:
+            self._strategies.append(strategy(self.domain_string, **self.strategy_options.get(strategy.name, {})))
+            if isinstance(self._strategies[-1], HomoglyphGeneratorStrategy):
+                print(f'Вариантов замены homoglyph: {self._strategies[-1].count}')
+
+    def _prepare_scheduler(self) -> None:
+        """
+        Функция создает планировщик разрешения доменов: concurrency корутин с ограничением частоты
+         запросов к доменам одной зоны.
+        """
+        self.scheduler = Scheduler(EXECUTOR_ASYNCIO, self.concurrency, per_target_rate=self.per_target_rate,
+                                   target_key=lambda candidate: candidate[0].rsplit('.', 1)[-1],
+                                   metrics=self.metrics)
+
+    def _prepare_reporter(self, unit: str) -> MetricsReporter:
+        """
+        Функция запускает публикацию метрик: файл, HTTP сервер и строку прогресса, если они включены.
+         Домены и аренды генерируются лениво, их общее количество заранее неизвестно,
+         поэтому выводится только скорость без оставшегося времени.
+        """
+        reporter = MetricsReporter(self.metrics, unit, self.metrics_file, self.metrics_listen, self.progress,
+                                   describe=self._describe_progress)
+        try:
+            reporter.start()
+        except (ValueError, OSError) as err:
+            sys.exit(err)
+        return reporter
+
+    def _describe_progress(self) -> str:
+        lookups = self.metrics.total('dns_cache')
+        hits = self.metrics.counter('dns_cache', result='hit')
+        return f'found {self.results_count} wildcard {self.wildcard_count} cache {ratio(hits, lookups)}'
 
     def _prepare_domains(self) -> None:
         """
-        Функция генерирует список доменов.
+        Функция создает ленивый генератор уникальных доменов по всем стратегиям и доменным зонам.
         """
-        for domain_zone in DOMAIN_ZONES:
-            for domain in self.phishing_domains:
-                tmp_domain = domain + '.' + domain_zone
-                self.domains.append(tmp_domain)
+        self.candidates = CandidatePipeline(self.strategies, DOMAIN_ZONES)
 
-    def _generate_scanners(self) -> None:
+    async def _resolve_domains(self) -> None:
         """
-        Функция генерирует классы под-процессы для обработки доменов.
+        Функция снимает wildcard отпечатки доменных зон, затем запускает планировщик, корутины которого
+         разбирают общий генератор доменов и резолвят их через общий асинхронный резолвер по мере генерации.
+         Кэш DNS ответов загружается перед сканом и сохраняется после него.
+         Если включено обогащение, найденные домены загружаются по HTTP(S) параллельно с разрешением остальных.
         """
-        self.scanners = [Scanner(domain, self.domains_ip_queue) for domain in self.domains]
+        self.cache.load()
+        preparations = list()
+        if self.enrich_host:
+            self.enricher = Enricher(self.enrich_host, HttpFetcher(per_ip_limit=self.per_ip_limit))
+            preparations.append(self.enricher.prepare())
+        try:
+            async with AsyncResolver(self.resolvers, rate=self.rate, timeout=self.timeout,
+                                     retries=self.retries) as resolver:
+                self.wildcards = WildcardDetector(resolver, self.cache)
+                await asyncio.gather(self.wildcards.detect(DOMAIN_ZONES), *preparations)
+                await self.scheduler.run_async(partial(self._resolve_candidate, resolver),
+                                               self.metrics.iterate(self.candidates, 'generate'))
+            await asyncio.gather(*self._enrich_tasks)
+        finally:
+            self.cache.save()
+            if self.enricher is not None:
+                self.enricher.fetcher.close()
 
-    def _write_log_file(self) -> None:
+    def _run_coordinator(self) -> None:
         """
-        Функция записывает результат в файл.
+        Функция делит генератор доменов на аренды, запускает координатор и локальных воркеров
+         и сохраняет найденные домены по мере завершения аренд.
         """
-        with open(self.ip_log_file, 'w', encoding='utf8') as file:
-            for domain, ip in self.results.items():
-                str_msg = f'{domain} - {ip}'
-                file.write(str_msg + '\n')
+        if self.enrich_host:
+            print('Обогащение в распределенном режиме не выполняется')
+        try:
+            self.coordinator = Coordinator(({'domains': batch} for batch in self._batches()), self.serve,
+                                           self.lease_timeout)
+            self.coordinator.start()
+        except (ValueError, OSError) as err:
+            sys.exit(err)
+        print(f'Координатор запущен на {self.coordinator.url}')
+        local_workers = [PhishingScanner(self.domain_string, resolvers=self.resolvers, concurrency=self.concurrency,
+                                         rate=self.rate, timeout=self.timeout, retries=self.retries, cache_file='',
+                                         per_target_rate=self.per_target_rate, join=self.coordinator.url)
+                         for _ in range(self.local_workers)]
+        for worker in local_workers:
+            worker.start()
+        try:
+            self.coordinator.run(self._add_lease_results)
+        finally:
+            self.coordinator.close()
+            for worker in local_workers:
+                worker.join()
+        print(f'Аренд выполнено: {self.coordinator.completed}, передано другим воркерам: '
+              f'{self.coordinator.reassigned}, воркеров: {len(self.coordinator.workers)}')
 
-    def _print_finishing_msg(self) -> None:
+    def _batches(self) -> Iterator[List[Tuple[str, str]]]:
+        candidates = self.metrics.iterate(self.candidates, 'generate')
+        while True:
+            batch = list(islice(candidates, self.lease_size))
+            if not batch:
+                return
+            self.metrics.inc('leases_issued')
+            yield batch
+
+    def _add_lease_results(self, records: list) -> None:
+        self.metrics.inc('leases')
+        for domain, ip, strategy_name in records:
+            self.resolved[strategy_name] += 1
+            self._report_result(domain, ip, strategy_name)
+
+    def _run_lease_worker(self) -> None:
         """
-        Функция выводит результат на консоль.
+        Функция резолвит домены аренд координатора, пока они не закончатся.
         """
-        if self.results:
-            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), self.ip_log_file)
-            print(f'Скан окончен, результат сохранен в {path}, результат скана ниже')
-            [print(f'{ip} - {domain}') for ip, domain in self.results.items()]
-        else:
-            print('Скан не показал результатов')
+        self._prepare_scheduler()
+        client = LeaseClient(self.join_url)
+        try:
+            with self.scheduler.handle_signals():
+                asyncio.run(self._resolve_leases(client))
+        except ConnectionError as err:
+            sys.exit(err)
+        print(f'Воркер {client.worker} завершил, выполнено аренд: {client.completed}')
 
+    async def _resolve_leases(self, client: LeaseClient) -> None:
+        """
+        Функция снимает wildcard отпечатки доменных зон и резолвит домены каждой аренды планировщиком,
+         найденные домены передаются координатору. Аренда, прерванная по SIGINT, не завершается
+         и после истечения передается другому воркеру. Домены потерянной аренды (переданной координатором
+         другому воркеру) больше не выдаются планировщику.
+        """
+        self.cache.load()
+        try:
+            async with AsyncResolver(self.resolvers, rate=self.rate, timeout=self.timeout,
+                                     retries=self.retries) as resolver:
+                self.wildcards = WildcardDetector(resolver, self.cache)
+                await self.wildcards.detect(DOMAIN_ZONES)
+                for self.lease in client.leases():
+                    await self.scheduler.run_async(partial(self._resolve_candidate, resolver),
+                                                   self._lease_domains(self.lease))
+                    if self.scheduler.cancelled:
+                        break
+        finally:
+            self.lease = None
+            self.cache.save()
 
-class Scanner(Process):
-    """
-    Класс под-процесс, подключение к переданному домену.
-    """
+    @staticmethod
+    def _lease_domains(lease: Lease) -> Iterator[Tuple[str, str]]:
+        for candidate in lease.payload['domains']:
+            if lease.lost:
+                print(f'Аренда {lease.id} передана другому воркеру, разрешение ее доменов прекращено')
+                return
+            yield tuple(candidate)
 
-    def __init__(self, domain, domains_ip_queue) -> None:
-        super(Scanner, self).__init__()
-        self.domain = domain
-        self.domains_ip_queue = domains_ip_queue
+    async def _resolve_candidate(self, resolver: AsyncResolver, candidate: Tuple[str, str]) -> None:
+        domain, strategy_name = candidate
+        ips = self.cache.get(domain)
+        self.metrics.inc('dns_cache', result='miss' if ips is None else 'hit')
+        if ips is None:
+            with self.metrics.timer('resolve'):
+                answer = await resolver.resolve(domain)
+            self.cache.put(answer)
+            ips = answer.ips
+        if not ips:
+            self.metrics.inc('domains', result='empty')
+            return
+        if self.wildcards.is_wildcard(domain, ips):
+            self.wildcard_count += 1
+            self.metrics.inc('domains', result='wildcard')
+            return
+        self.metrics.inc('domains', result='resolved')
+        self.resolved[strategy_name] += 1
+        self._report_result(domain, ips[0], strategy_name)
 
-    def run(self) -> None:
-        self._process_request()
+    def _prepare_sink(self) -> None:
+        """
+        Функция создает приемник, записывающий результат в файл по мере поступления.
+        """
+        try:
+            self.sink = create_sink(self.ip_log_file, RESULT_FIELDS, self.log_format,
+                                    formatter=lambda record: f"{record['domain']} - {record['ip']}")
+        except ValueError as err:
+            sys.exit(err)
 
-    def _process_request(self) -> None:
+    def _report_result(self, domain: str, ip: str, strategy_name: str) -> None:
+        """
+        Функция записывает найденный домен в файл результата и выводит его на консоль.
+         В режиме воркера домен передается координатору в рамках текущей аренды.
         """
-        Функция создает подключение к домену, если оно успешно, передает в очередь название домена и ip адрес.
+        if self.lease is not None:
+            self.lease.emit([[domain, ip, strategy_name]])
+            return
+        self.sink.write({'domain': domain, 'ip': ip, 'strategy': strategy_name})
+        print(f'{domain} - {ip}')
+        self.results_count += 1
+        if self.enricher is not None:
+            self._enrich_tasks.append(asyncio.ensure_future(self.enricher.enrich(domain, ip)))
+
+    def _save_enrichment(self) -> None:
         """
+        Функция сохраняет результаты обогащения по убыванию схожести с сайтом бренда и выводит самые похожие.
+        """
+        ranked = self.enricher.ranked()
         try:
-            ip_address = socket.gethostbyname(self.domain)
-            self.domains_ip_queue.put({self.domain: ip_address})
-        except (ConnectionRefusedError, socket.error):
-            pass
+            with create_sink(self.enrich_file, ENRICH_FIELDS) as sink:
+                for result in ranked:
+                    sink.write(result)
+        except ValueError as err:
+            sys.exit(err)
+        if not ranked:
+            print('Ни один из найденных доменов не ответил по HTTP(S)')
+            return
+        print(f'Самые похожие на {self.enrich_host} сайты:')
+        for result in ranked[:ENRICH_TOP]:
+            print(f"{result['similarity']:.2f} {result['url']} {result['title']}")
+        print(f'Результат обогащения сохранен в {os.path.abspath(self.enrich_file)}')
 
+    def _print_finishing_msg(self) -> None:
+        """
+        Функция выводит итоговое сообщение на консоль со статистикой по стратегиям:
+         сколько доменов сгенерировано и сколько из них разрешилось.
+        """
+        for strategy in self.strategies:
+            generated = self.candidates.generated[strategy.name]
+            resolved = self.resolved[strategy.name]
+            share = resolved / generated * 100 if generated else 0
+            print(f'Стратегия {strategy.name}: сгенерировано {generated}, разрешилось {resolved} ({share:.2f}%)')
+        if self.wildcard_count:
+            print(f'Отброшено ответов wildcard DNS: {self.wildcard_count}')
+        if self.scheduler.cancelled:
+            print('Скан прерван, проверена только часть доменов')
+        if self.results_count:
+            path = os.path.abspath(self.ip_log_file)
+            print(f'Скан окончен, найдено доменов: {self.results_count}, результат сохранен в {path}')
+        else:
+            print('Скан не показал результатов')
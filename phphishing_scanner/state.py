@@ -0,0 +1,204 @@
+import sqlite3
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+SCHEMA_VERSION = 3
+DOMAINS_SCHEMA = ('domains (domain TEXT NOT NULL, brand TEXT NOT NULL, strategy TEXT, ips TEXT NOT NULL, '
+                  'checked REAL NOT NULL, expires REAL NOT NULL, PRIMARY KEY (brand, domain))')
+COMMIT_EVERY = 1000
+SEED_BATCH = 10000
+DUE_BATCH = 1000
+
+CHANGE_NEW = 'new'
+CHANGE_CHANGED = 'changed'
+CHANGE_REMOVED = 'removed'
+
+
+class StateIndex:
+    """
+    Класс локального индекса последнего известного состояния доменов-кандидатов в SQLite.
+     Для каждой пары бренд - домен (один домен может быть кандидатом нескольких брендов) хранится стратегия,
+     отсортированный список ip адресов (пустой - домен не разрешается) и время следующей проверки,
+     рассчитанное по TTL ответа. Индекс заполняется кандидатами
+     бренда один раз и повторно только при изменении параметров стратегий (они хранятся в таблице brands),
+     далее выбираются только записи с истекшим сроком проверки по индексу (brand, expires). Изменения
+     фиксируются пачками по COMMIT_EVERY записей, журнал WAL позволяет читать индекс во время работы демона.
+    :param path - путь к файлу базы данных.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.connection = None
+        self._uncommitted = 0
+
+    def __enter__(self) -> 'StateIndex':
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def open(self) -> None:
+        """
+        Функция открывает базу данных и создает таблицы при первом запуске. В базе версии 1 и 2 домен
+         принадлежал одному бренду: таблица domains перестраивается с ключом (brand, domain) с сохранением
+         состояния доменов, кандидаты всех брендов повторно добавляются в индекс при следующем запуске демона.
+        :raise ValueError: если база создана другой версией схемы.
+        """
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        version, = self.connection.execute('PRAGMA user_version').fetchone()
+        if version not in (0, 1, 2, SCHEMA_VERSION):
+            self.connection.close()
+            raise ValueError(f'База {self.path} создана для версии схемы {version}, ожидается {SCHEMA_VERSION}')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS brands (brand TEXT PRIMARY KEY, options TEXT NOT NULL)')
+        if version in (1, 2):
+            self.connection.execute('DROP INDEX IF EXISTS domains_brand_expires')
+            self.connection.execute('ALTER TABLE domains RENAME TO domains_previous')
+            self.connection.execute(f'CREATE TABLE {DOMAINS_SCHEMA}')
+            self.connection.execute('INSERT INTO domains SELECT domain, brand, strategy, ips, checked, expires '
+                                    'FROM domains_previous')
+            self.connection.execute('DROP TABLE domains_previous')
+            self.connection.execute('DELETE FROM brands')
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS {DOMAINS_SCHEMA}')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS domains_brand_expires ON domains (brand, expires)')
+        self.connection.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        self.connection.commit()
+
+    def get(self, domain: str, brand: str) -> Optional[Tuple[List[str], float]]:
+        """
+        Функция возвращает сохраненные ip адреса домена бренда и время его следующей проверки или None.
+        """
+        row = self.connection.execute('SELECT ips, expires FROM domains WHERE brand = ? AND domain = ?',
+                                      (brand, domain)).fetchone()
+        if row is None:
+            return None
+        return self._split_ips(row[0]), row[1]
+
+    def seeded_options(self, brand: str) -> Optional[str]:
+        """
+        Функция возвращает параметры стратегий, с которыми индекс заполнен кандидатами бренда, или None.
+        """
+        row = self.connection.execute('SELECT options FROM brands WHERE brand = ?', (brand,)).fetchone()
+        return row[0] if row is not None else None
+
+    def seed(self, brand: str, candidates: Iterable[Tuple[str, str]], options: str) -> int:
+        """
+        Функция заполняет индекс кандидатами бренда. Новые домены добавляются со сроком проверки 0
+         (проверяются в ближайшем цикле), состояние уже известных доменов сохраняется, домены бренда,
+         которые больше не генерируются, удаляются. Кандидаты собираются во временной таблице,
+         поэтому пространство кандидатов не загружается в память целиком.
+        :param brand - бренд.
+        :param candidates - пары (домен, имя стратегии).
+        :param options - параметры стратегий, с которыми сгенерированы кандидаты.
+        :return: количество добавленных доменов.
+        """
+        self.commit()
+        self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS seed (domain TEXT PRIMARY KEY, strategy TEXT)')
+        self.connection.execute('DELETE FROM seed')
+        candidates = iter(candidates)
+        batch = list(islice(candidates, SEED_BATCH))
+        while batch:
+            self.connection.executemany('INSERT OR IGNORE INTO seed VALUES (?, ?)', batch)
+            batch = list(islice(candidates, SEED_BATCH))
+        cursor = self.connection.execute("INSERT OR IGNORE INTO domains SELECT domain, ?, strategy, '', 0, 0 FROM seed",
+                                         (brand,))
+        added = cursor.rowcount
+        self.connection.execute('DELETE FROM domains WHERE brand = ? AND domain NOT IN (SELECT domain FROM seed)',
+                                (brand,))
+        self.connection.execute('INSERT OR REPLACE INTO brands VALUES (?, ?)', (brand, options))
+        self.connection.execute('DELETE FROM seed')
+        self.commit()
+        return added
+
+    def due(self, brand: str, now: float) -> Iterator[Tuple[str, str]]:
+        """
+        Функция выбирает домены бренда, срок проверки которых истек к моменту now, пачками по DUE_BATCH записей
+         по индексу (brand, expires). Пачки продолжаются с последней выбранной записи, поэтому домены,
+         проверка которых еще не записана, повторно не выбираются.
+        :return: пары (домен, имя стратегии).
+        """
+        last_expires, last_rowid = -1.0, 0
+        while True:
+            rows = self.connection.execute('SELECT domain, strategy, expires, rowid FROM domains '
+                                           'WHERE brand = ? AND expires <= ? AND (expires, rowid) > (?, ?) '
+                                           'ORDER BY expires, rowid LIMIT ?',
+                                           (brand, now, last_expires, last_rowid, DUE_BATCH)).fetchall()
+            if not rows:
+                return
+            for domain, strategy, _, _ in rows:
+                yield domain, strategy
+            _, _, last_expires, last_rowid = rows[-1]
+
+    def update(self, domain: str, brand: str, strategy: str, ips: List[str], checked: float,
+               expires: float) -> Optional[str]:
+        """
+        Функция сохраняет результат проверки домена и сравнивает его с предыдущим.
+        :return: CHANGE_NEW, CHANGE_CHANGED, CHANGE_REMOVED или None, если ip адреса не изменились.
+        """
+        previous = self.get(domain, brand)
+        previous_ips = previous[0] if previous is not None else []
+        ips = sorted(ips)
+        self.connection.execute('INSERT OR REPLACE INTO domains VALUES (?, ?, ?, ?, ?, ?)',
+                                (domain, brand, strategy, ','.join(ips), checked, expires))
+        self._count_write()
+        if ips == previous_ips:
+            return None
+        if not previous_ips:
+            return CHANGE_NEW
+        return CHANGE_CHANGED if ips else CHANGE_REMOVED
+
+    def postpone(self, domain: str, brand: str, strategy: str, expires: float) -> None:
+        """
+        Функция переносит следующую проверку домена без изменения сохраненных ip адресов
+         (например, если DNS сервер не ответил).
+        """
+        cursor = self.connection.execute('UPDATE domains SET expires = ? WHERE brand = ? AND domain = ?',
+                                         (expires, brand, domain))
+        if not cursor.rowcount:
+            self.connection.execute('INSERT INTO domains VALUES (?, ?, ?, ?, ?, ?)',
+                                    (domain, brand, strategy, '', 0, expires))
+        self._count_write()
+
+    def retain(self, brands: Iterable[str]) -> int:
+        """
+        Функция удаляет из индекса домены и параметры брендов, которые больше не отслеживаются.
+        :return: количество удаленных доменов.
+        """
+        brands = list(brands)
+        placeholders = ', '.join('?' * len(brands))
+        cursor = self.connection.execute(f'DELETE FROM domains WHERE brand NOT IN ({placeholders})', brands)
+        removed = cursor.rowcount
+        self.connection.execute(f'DELETE FROM brands WHERE brand NOT IN ({placeholders})', brands)
+        self.commit()
+        return removed
+
+    def next_expiry(self, brands: Iterable[str]) -> Optional[float]:
+        """
+        Функция возвращает ближайшее время следующей проверки среди доменов брендов.
+        """
+        brands = list(brands)
+        placeholders = ', '.join('?' * len(brands))
+        row = self.connection.execute(f'SELECT MIN(expires) FROM domains WHERE brand IN ({placeholders})',
+                                      brands).fetchone()
+        return row[0]
+
+    def commit(self) -> None:
+        self.connection.commit()
+        self._uncommitted = 0
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+
+    def _count_write(self) -> None:
+        self._uncommitted += 1
+        if self._uncommitted >= COMMIT_EVERY:
+            self.commit()
+
+    @staticmethod
+    def _split_ips(ips: str) -> List[str]:
+        return ips.split(',') if ips else []
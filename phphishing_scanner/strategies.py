@@ -1,123 +1,140 @@
 from abc import ABC, abstractmethod
-import homoglyphs as hg
-import chardet
+from typing import Dict, Iterable, Iterator, List, Optional, Type
+
 import string
 
-URL_RESERVED_CHARS = "$|.+!*'(),"
+from permutations import DEFAULT_MAX_DISTANCE, HomoglyphPermutations
+
+ORDER_PRIORITY = 'priority'
+ORDER_RANK = 'rank'
+HOMOGLYPH_ORDERS = (ORDER_PRIORITY, ORDER_RANK)
+LABEL_CHARS = set(string.ascii_lowercase + string.digits + '-')
+VOWELS = 'aeiouy'
+KEYBOARD_ROWS = ('1234567890-', 'qwertyuiop', 'asdfghjkl', 'zxcvbnm')
+# Символы кириллицы и греческого алфавита, неотличимые от латинских в большинстве шрифтов.
+IDN_HOMOGLYPHS = {
+    'a': 'аα', 'c': 'с', 'e': 'е', 'h': 'һ', 'i': 'іι', 'j': 'ј', 'k': 'κ', 'o': 'оο', 'p': 'рρ', 's': 'ѕ',
+    'x': 'х', 'y': 'уγ', 'v': 'ν', 'n': 'η', 'u': 'υ', 'w': 'ԝ', 'd': 'ԁ', 'q': 'ԛ', 'b': 'ь',
+}
+
+STRATEGY_REGISTRY: Dict[str, Type['Strategy']] = dict()
+
+
+def register_strategy(name: str):
+    """
+    Декоратор регистрирует класс стратегии в STRATEGY_REGISTRY под именем name.
+     Стратегии выполняются в порядке регистрации.
+    """
+    def decorator(cls: Type['Strategy']) -> Type['Strategy']:
+        if name in STRATEGY_REGISTRY:
+            raise ValueError(f'Стратегия {name} уже зарегистрирована')
+        cls.name = name
+        STRATEGY_REGISTRY[name] = cls
+        return cls
+    return decorator
+
+
+def get_strategies(enabled: Optional[Iterable[str]] = None, disabled: Iterable[str] = ()) -> List[Type['Strategy']]:
+    """
+    Функция выбирает классы стратегий из реестра.
+    :param enabled - имена включенных стратегий, None - все зарегистрированные стратегии.
+    :param disabled - имена отключенных стратегий.
+    :raise ValueError: если имя стратегии не зарегистрировано.
+    """
+    enabled = list(enabled) if enabled is not None else list(STRATEGY_REGISTRY)
+    disabled = list(disabled)
+    unknown = [name for name in enabled + disabled if name not in STRATEGY_REGISTRY]
+    if unknown:
+        raise ValueError(f'Неизвестные стратегии {", ".join(unknown)}, доступные: {", ".join(STRATEGY_REGISTRY)}')
+    return [STRATEGY_REGISTRY[name] for name in STRATEGY_REGISTRY if name in enabled and name not in disabled]
 
 
 class Strategy(ABC):
     """
     Базовый класс стратегии определяющий общий интерфейс.
+    Стратегия - генератор доменных имен без зоны, имена выдаются по мере вычисления.
+    Стратегии регистрируются декоратором register_strategy, имя стратегии хранится в атрибуте name.
     """
 
-    def __init__(self, domain_string: str, phishing_domains: list) -> None:
+    name = None
+
+    def __init__(self, domain_string: str) -> None:
         self.domain_string = domain_string.lower()
-        self.phishing_domains = phishing_domains
 
     @abstractmethod
-    def perform_strategy(self) -> None:
+    def generate(self) -> Iterator[str]:
         pass
 
 
+@register_strategy('homoglyph')
 class HomoglyphGeneratorStrategy(Strategy):
     """
-    Класс-стратегия отвечает за подстановку символа, схожего по написанию и
-    генерацию доменов, на основе этой подстановки.
+    Класс-стратегия отвечает за подстановку символов, схожих по написанию, и
+    генерацию доменов на основе этих подстановок.
+    :param max_distance - максимальное количество замененных символов.
+    :param order - порядок обхода: ORDER_PRIORITY - от самых похожих доменов, ORDER_RANK - по номерам кандидатов.
+    :param sample - количество случайных кандидатов, None - все кандидаты.
     """
 
-    def __init__(self, domain_string: str, phishing_domains: list) -> None:
-        super(HomoglyphGeneratorStrategy, self).__init__(domain_string, phishing_domains)
-        self.glyphs_generator = hg.Homoglyphs(languages={'en'}, categories=('COMMON', 'LATIN'))
-        self.glyphs_dict = dict()
+    def __init__(self, domain_string: str, max_distance: int = DEFAULT_MAX_DISTANCE, order: str = ORDER_PRIORITY,
+                 sample: Optional[int] = None) -> None:
+        super(HomoglyphGeneratorStrategy, self).__init__(domain_string)
+        self.permutations = HomoglyphPermutations(self.domain_string, max_distance)
+        self.order = order
+        self.sample = sample
 
-    def perform_strategy(self) -> None:
-        possible_glyphs = list()
-        for char in self.domain_string:
-            possible_glyphs.extend(self._generate_glyphs(char))
-        self._generate_strings_with_homoglyphs(possible_glyphs)
-
-    def _generate_glyphs(self, char: str) -> list:
-        """
-        Функция получает на вход букву и генерирует возможные ascii символы homoglyph
-        :param char: str буква
-        :return ascii_glyphs: список возможных homoglyph ascii.
-        """
-        possible_glyphs = self.glyphs_generator.get_combinations(char.lower())
-        possible_glyphs.extend(self.glyphs_generator.get_combinations(char.upper()))
-        filtered_glyphs = list(filter(lambda gl: gl not in URL_RESERVED_CHARS, possible_glyphs))
-        ascii_glyphs = list(
-            filter(lambda gl: chardet.detect(str.encode(gl))['encoding'] == 'ascii' and gl.lower() != char,
-                   filtered_glyphs))
-
-        for gl in ascii_glyphs:
-            self.glyphs_dict[gl] = char
-        return ascii_glyphs
-
-    def _generate_strings_with_homoglyphs(self, possible_glyphs: list, words=None) -> None:
+    @property
+    def count(self) -> int:
         """
-        Функция принимает на вход возможные символы homoglyph и
-         слова для генерации новых слов с подстановкой этих символов
-         и последующим сохранением в переменную self.phishing_domains.
-         :param possible_glyphs: список возможных символов homoglyph
+        Точное количество кандидатов, которые выдаст стратегия.
         """
-        if not words:
-            words = [self.domain_string]
-        replaced_words = []
-        chars_to_replace = [value for value in self.glyphs_dict.values()]
-        if not self._any_char_to_replace(words, chars_to_replace):
-            return
-        for word in words:
-            for glyph in possible_glyphs:
-                char = self.glyphs_dict[glyph]
-                if char in word:
-                    index = word.index(char)
-                    new_word = list(word)
-                    new_word[index] = glyph
-                    replaced_words.append(''.join(new_word).lower())
-        self.phishing_domains.extend(replaced_words)
-        self._generate_strings_with_homoglyphs(possible_glyphs, replaced_words)
-
-    def _any_char_to_replace(self, words: list, chars: list) -> bool:
-        """
-        Функция проверяет, есть ли в слове переданные в параметре символы.
-        """
-        for word in words:
-            return any(char in word for char in chars)
+        if self.sample is not None:
+            return min(self.sample, self.permutations.count)
+        return self.permutations.count
 
+    def generate(self) -> Iterator[str]:
+        if self.sample is not None:
+            yield from self.permutations.sample(self.sample)
+        elif self.order == ORDER_PRIORITY:
+            yield from self.permutations.by_priority()
+        else:
+            yield from self.permutations
 
+
+@register_strategy('addition')
 class AdditionalSymbolStrategy(Strategy):
     """
     Класс-стратегия отвечает за генерацию доменов путем подстановки символа в конце доменной строки.
     """
 
-    def __init__(self, domain_string: str, phishing_domains: list) -> None:
-        super(AdditionalSymbolStrategy, self).__init__(domain_string, phishing_domains)
+    def __init__(self, domain_string: str) -> None:
+        super(AdditionalSymbolStrategy, self).__init__(domain_string)
 
-    def perform_strategy(self) -> None:
-        self.add_symbol_to_end()
+    def generate(self) -> Iterator[str]:
+        yield from self.add_symbol_to_end()
 
-    def add_symbol_to_end(self) -> None:
+    def add_symbol_to_end(self) -> Iterator[str]:
         alphabet = list(string.ascii_lowercase)
         for letter in alphabet:
-            self.phishing_domains.append(self.domain_string + letter)
+            yield self.domain_string + letter
 
 
+@register_strategy('subdomain')
 class AddSubDomainStrategy(Strategy):
     """
     Класс-стратегия отвечает за генерацию под доменов в строке домена путем подстановки символа точка.
     """
 
-    def __init__(self, domain_string: str, phishing_domains: list) -> None:
-        super(AddSubDomainStrategy, self).__init__(domain_string, phishing_domains)
+    def __init__(self, domain_string: str) -> None:
+        super(AddSubDomainStrategy, self).__init__(domain_string)
 
-    def perform_strategy(self) -> None:
-        self.add_sub_domain()
+    def generate(self) -> Iterator[str]:
+        yield from self.add_sub_domain()
 
-    def add_sub_domain(self) -> None:
+    def add_sub_domain(self) -> Iterator[str]:
         """
         Функция поочередно подставляет точку между символами в строке для генерации под доменов
-         и добавляет результат в переменную self.phishing_domains
+         и выдает результат.
         """
         for i in range(1, len(self.domain_string)):
             first_part = self.domain_string[:i]
@@ -126,24 +143,152 @@ class AddSubDomainStrategy(Strategy):
                 continue
             else:
                 word = self.domain_string[:i] + '.' + self.domain_string[i:]
-            self.phishing_domains.append(word)
+            yield word
 
 
+@register_strategy('omission')
 class RemoveSymbolStrategy(Strategy):
     """
     Класс-стратегия отвечает за удаление одного символа в конце доменного имени.
     """
 
-    def __init__(self, domain_string, phishing_domains) -> None:
-        super(RemoveSymbolStrategy, self).__init__(domain_string, phishing_domains)
+    def __init__(self, domain_string) -> None:
+        super(RemoveSymbolStrategy, self).__init__(domain_string)
 
-    def perform_strategy(self) -> None:
-        self.remove_one_symbol()
+    def generate(self) -> Iterator[str]:
+        yield from self.remove_one_symbol()
 
-    def remove_one_symbol(self) -> None:
+    def remove_one_symbol(self) -> Iterator[str]:
         """
-        Функция поочередно удаляет по одному символу в строке и добавляет результат в переменную self.phishing_domains
+        Функция поочередно удаляет по одному символу в строке и выдает результат.
         """
         for i in range(len(self.domain_string)):
             word = self.domain_string[:i] + self.domain_string[i + 1:]
-            self.phishing_domains.append(word)
+            yield word
+
+
+@register_strategy('bitflip')
+class BitFlipStrategy(Strategy):
+    """
+    Класс-стратегия отвечает за генерацию доменов, отличающихся от исходного одним измененным битом
+     в одном символе (ошибки памяти и передачи данных у клиентов).
+    """
+
+    def generate(self) -> Iterator[str]:
+        for i, char in enumerate(self.domain_string):
+            for bit in range(8):
+                flipped = chr(ord(char) ^ 1 << bit).lower()
+                if flipped == char or flipped not in LABEL_CHARS:
+                    continue
+                if flipped == '-' and i in (0, len(self.domain_string) - 1):
+                    continue
+                yield self.domain_string[:i] + flipped + self.domain_string[i + 1:]
+
+
+@register_strategy('keyboard')
+class KeyboardStrategy(Strategy):
+    """
+    Класс-стратегия отвечает за генерацию доменов с опечатками соседними клавишами раскладки QWERTY:
+     замена символа соседним и вставка соседнего символа до или после исходного.
+    """
+
+    def __init__(self, domain_string: str) -> None:
+        super(KeyboardStrategy, self).__init__(domain_string)
+        self.neighbours = self._prepare_neighbours()
+
+    def generate(self) -> Iterator[str]:
+        for i, char in enumerate(self.domain_string):
+            for neighbour in self.neighbours.get(char, ''):
+                yield self.domain_string[:i] + neighbour + self.domain_string[i + 1:]
+                yield self.domain_string[:i] + neighbour + self.domain_string[i:]
+                yield self.domain_string[:i + 1] + neighbour + self.domain_string[i + 1:]
+
+    @staticmethod
+    def _prepare_neighbours() -> Dict[str, str]:
+        """
+        Функция строит словарь соседних клавиш по горизонтали и вертикали.
+        """
+        neighbours = dict()
+        for row_index, row in enumerate(KEYBOARD_ROWS):
+            for column, char in enumerate(row):
+                near = list()
+                for near_row in range(max(row_index - 1, 0), min(row_index + 2, len(KEYBOARD_ROWS))):
+                    for near_column in (column - 1, column, column + 1):
+                        if 0 <= near_column < len(KEYBOARD_ROWS[near_row]) and (near_row, near_column) != \
+                                (row_index, column):
+                            near.append(KEYBOARD_ROWS[near_row][near_column])
+                neighbours[char] = ''.join(near).replace('-', '')
+        return neighbours
+
+
+@register_strategy('transposition')
+class TranspositionStrategy(Strategy):
+    """
+    Класс-стратегия отвечает за перестановку двух соседних различных символов,
+     имена с дефисом в начале или в конце пропускаются.
+    """
+
+    def generate(self) -> Iterator[str]:
+        for i in range(len(self.domain_string) - 1):
+            if self.domain_string[i] == self.domain_string[i + 1]:
+                continue
+            word = (self.domain_string[:i] + self.domain_string[i + 1] + self.domain_string[i] +
+                    self.domain_string[i + 2:])
+            if not word.startswith('-') and not word.endswith('-'):
+                yield word
+
+
+@register_strategy('vowel_swap')
+class VowelSwapStrategy(Strategy):
+    """
+    Класс-стратегия отвечает за замену гласной буквы другой гласной.
+    """
+
+    def generate(self) -> Iterator[str]:
+        for i, char in enumerate(self.domain_string):
+            if char not in VOWELS:
+                continue
+            for vowel in VOWELS:
+                if vowel != char:
+                    yield self.domain_string[:i] + vowel + self.domain_string[i + 1:]
+
+
+@register_strategy('hyphenation')
+class HyphenationStrategy(Strategy):
+    """
+    Класс-стратегия отвечает за вставку дефиса между символами доменной строки.
+    """
+
+    def generate(self) -> Iterator[str]:
+        for i in range(1, len(self.domain_string)):
+            if '-' in (self.domain_string[i - 1], self.domain_string[i]):
+                continue
+            yield self.domain_string[:i] + '-' + self.domain_string[i:]
+
+
+@register_strategy('idn')
+class IdnHomoglyphStrategy(Strategy):
+    """
+    Класс-стратегия отвечает за генерацию интернационализированных доменов (IDN): замену одного символа
+     похожим символом кириллицы или греческого алфавита, а также замену всех символов, если это возможно.
+     Домены выдаются в punycode (xn--), как они регистрируются и резолвятся.
+    """
+
+    def generate(self) -> Iterator[str]:
+        for i, char in enumerate(self.domain_string):
+            for glyph in IDN_HOMOGLYPHS.get(char, ''):
+                punycode = self._to_punycode(self.domain_string[:i] + glyph + self.domain_string[i + 1:])
+                if punycode:
+                    yield punycode
+        if all(char in IDN_HOMOGLYPHS or char == '-' for char in self.domain_string):
+            punycode = self._to_punycode(''.join(IDN_HOMOGLYPHS[char][0] if char != '-' else char
+                                                 for char in self.domain_string))
+            if punycode:
+                yield punycode
+
+    @staticmethod
+    def _to_punycode(word: str) -> Optional[str]:
+        try:
+            return word.encode('idna').decode('ascii')
+        except UnicodeError:
+            return None
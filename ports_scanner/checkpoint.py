@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+import ipaddress
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from targets import IPAddress
+
+FSYNC_INTERVAL = 5.0
+LAYOUT_KEYS = ('seed', 'shards')
+
+
+class Checkpoint:
+    """
+    Класс append-only журнала прогресса сканирования.
+     Первая строка файла - JSON заголовок с параметрами скана, зерном перестановки целей и количеством шардов,
+     далее JSON строки двух видов: [ip, порт, статус, server, cert_cn] для каждого открытого порта
+     и {"shard": номер шарда, "done": шаг} - отметка о том, что все шаги шарда до done завершены.
+     Поэтому размер журнала и память при продолжении зависят от количества открытых портов и шардов,
+     а не от количества целей. Записи добавляются пачками, после каждой пачки буфер сбрасывается в файл,
+     fsync выполняется не чаще FSYNC_INTERVAL секунд. Запись потокобезопасна.
+     Оборванная последняя строка (скан был прерван во время записи) при загрузке пропускается.
+    :param path - путь к файлу журнала.
+    :param scan_params - параметры скана, при продолжении они должны совпадать с сохраненными.
+    """
+
+    def __init__(self, path: str, scan_params: dict) -> None:
+        self.path = path
+        self.scan_params = scan_params
+        self.file = None
+        self.last_fsync = time.monotonic()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(ip: Union[str, IPAddress], port: int) -> int:
+        """
+        Функция упаковывает ip адрес и порт в одно число для компактного хранения в множестве.
+        """
+        address = ip if isinstance(ip, (ipaddress.IPv4Address, ipaddress.IPv6Address)) else ipaddress.ip_address(ip)
+        return int(address) << 16 | port
+
+    def load(self) -> Tuple[Optional[dict], Dict[int, int], List[tuple]]:
+        """
+        Функция читает журнал прерванного скана.
+        :return: разбиение скана (зерно перестановки и количество шардов) или None, если журнала нет,
+         завершенные шаги по шардам и список записей с открытыми портами.
+        :raise ValueError: если журнал создан для скана с другими параметрами.
+        """
+        progress = dict()
+        opened = list()
+        if not os.path.exists(self.path):
+            return None, progress, opened
+        with open(self.path, 'r', encoding='utf8') as file:
+            header = self._parse_line(file.readline())
+            if not isinstance(header, dict) or any(key not in header for key in LAYOUT_KEYS) \
+                    or {key: value for key, value in header.items() if key not in LAYOUT_KEYS} != self.scan_params:
+                raise ValueError(f'Журнал {self.path} создан для скана с другими параметрами: {header}')
+            for line in file:
+                record = self._parse_line(line)
+                if isinstance(record, dict) and 'shard' in record and 'done' in record:
+                    progress[record['shard']] = max(progress.get(record['shard'], 0), record['done'])
+                elif isinstance(record, list) and len(record) >= 3:
+                    opened.append(tuple(record))
+        return {key: header[key] for key in LAYOUT_KEYS}, progress, opened
+
+    def open(self, resume: bool, seed: int, shards: int) -> None:
+        """
+        Функция открывает журнал на дозапись при продолжении скана, иначе создает новый журнал с заголовком.
+        """
+        if resume and os.path.exists(self.path):
+            with open(self.path, 'rb') as file:
+                file.seek(0, os.SEEK_END)
+                torn = False
+                if file.tell():
+                    file.seek(-1, os.SEEK_END)
+                    torn = file.read(1) != b'\n'
+            self.file = open(self.path, 'a', encoding='utf8')
+            if torn:
+                self.file.write('\n')
+        else:
+            self.file = open(self.path, 'w', encoding='utf8')
+            self.file.write(json.dumps(dict(self.scan_params, seed=seed, shards=shards)) + '\n')
+            self.file.flush()
+
+    def write(self, hosts: Iterable[tuple]) -> None:
+        """
+        Функция дописывает пачку открытых портов в журнал.
+        """
+        self._append(''.join(json.dumps(list(host)) + '\n' for host in hosts))
+
+    def mark(self, shard: int, done: int) -> None:
+        """
+        Функция отмечает, что все шаги шарда shard до done завершены.
+        """
+        self._append(json.dumps({'shard': shard, 'done': done}) + '\n')
+
+    def close(self) -> None:
+        with self._lock:
+            if self.file is not None:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+                self.file = None
+
+    def _append(self, data: str) -> None:
+        if not data:
+            return
+        with self._lock:
+            self.file.write(data)
+            self.file.flush()
+            if time.monotonic() - self.last_fsync >= FSYNC_INTERVAL:
+                os.fsync(self.file.fileno())
+                self.last_fsync = time.monotonic()
+
+    @staticmethod
+    def _parse_line(line: str) -> Optional[object]:
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
@@ -1,7 +1,16 @@
 # -*- coding: utf-8 -*-
 import multiprocessing
+import os
 import sys
-from port_scanner import PortScanner
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.distributed import DEFAULT_LEASE_TIMEOUT
+from common.scheduler import interrupt_handler
+from common.sinks import SINK_FORMATS
+from port_scanner import PortScanner, DEFAULT_CONCURRENCY, DEFAULT_LEASE_SIZE, DEFAULT_TIMEOUT, DEFAULT_RETRIES
+from rtt import DEFAULT_MAX_TIMEOUT
+from syn_scanner import DEFAULT_RATE
 import argparse
 
 
@@ -12,24 +21,85 @@ def main():
                                                  ' и список портов (например 80, 443, 22, 21, 25).'
                                                  ' Результатом - список открытых портов с указанием удаленного хоста.',
                                      usage='%(prog)s [options]')
-    parser.add_argument('ip_range', type=str, help='диапазон ip-адресов(например 192.168.1.0/24)')
+    parser.add_argument('ip_range', type=str, nargs='?', default='',
+                        help='диапазоны ip-адресов через запятую(например 192.168.1.0/24,10.0.0.0/16)')
 
-    parser.add_argument('ports', type=str, help="список портов (например 80, 443, 22, 21, 25).")
+    parser.add_argument('ports', type=str, nargs='?', default='',
+                        help="список портов (например 80, 443, 22, 21, 25).")
 
     parser.add_argument('--log_file', type=str, default='hosts.log', help="Файл для сохранения результата."
                                                                           "По умолчанию hosts.log")
+    parser.add_argument('--log_format', type=str, default=None, choices=list(SINK_FORMATS),
+                        help="Формат файла результата. По умолчанию определяется по расширению файла")
+    parser.add_argument('--exclude', type=str, default='',
+                        help="Диапазоны ip-адресов через запятую, которые нужно пропустить.")
+    parser.add_argument('--shuffle', action='store_true',
+                        help="Сканировать адреса в перемешанном порядке, чтобы не нагружать одну подсеть.")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Максимальное количество одновременных подключений на все воркеры. "
+                             f"По умолчанию {DEFAULT_CONCURRENCY}")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help=f"Начальное время ожидания подключения в секундах, далее подстраивается "
+                             f"под задержку подсети. По умолчанию {DEFAULT_TIMEOUT}")
+    parser.add_argument('--max_timeout', type=float, default=DEFAULT_MAX_TIMEOUT,
+                        help=f"Верхняя граница времени ожидания подключения. По умолчанию {DEFAULT_MAX_TIMEOUT}")
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help=f"Количество повторных попыток после таймаута. По умолчанию {DEFAULT_RETRIES}")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Количество процессов-воркеров. По умолчанию по числу ядер")
+    parser.add_argument('--syn', action='store_true',
+                        help="Полуоткрытое (SYN) сканирование через raw сокеты, требует права root или CAP_NET_RAW")
+    parser.add_argument('--rate', type=int, default=DEFAULT_RATE,
+                        help=f"Количество SYN пакетов в секунду. По умолчанию {DEFAULT_RATE}")
+    parser.add_argument('--checkpoint_file', type=str, default='scan.checkpoint',
+                        help="Журнал прогресса (завершенные шаги шардов и открытые порты) для продолжения "
+                             "прерванного скана. По умолчанию scan.checkpoint")
+    parser.add_argument('--resume', action='store_true',
+                        help="Продолжить прерванный скан с места остановки, сохраненного в журнале")
+    parser.add_argument('--max_rate', type=float, default=0,
+                        help="Максимальное количество подключений в секунду на все воркеры. "
+                             "По умолчанию без ограничения")
+    parser.add_argument('--per_target_rate', type=float, default=0,
+                        help="Максимальное количество подключений в секунду к одному ip адресу. "
+                             "По умолчанию без ограничения")
+    parser.add_argument('--serve', type=str, default=None,
+                        help="Запустить координатор распределенного скана на адресе host:port (например 0.0.0.0:8750)")
+    parser.add_argument('--join', type=str, default=None,
+                        help="Работать воркером распределенного скана координатора по адресу "
+                             "(например http://10.0.0.1:8750), ip_range и ports не указываются")
+    parser.add_argument('--lease_size', type=int, default=DEFAULT_LEASE_SIZE,
+                        help=f"Количество целей в одной аренде распределенного скана. "
+                             f"По умолчанию {DEFAULT_LEASE_SIZE}")
+    parser.add_argument('--lease_timeout', type=float, default=DEFAULT_LEASE_TIMEOUT,
+                        help=f"Время в секундах, после которого аренда без ответа воркера передается другому воркеру. "
+                             f"По умолчанию {DEFAULT_LEASE_TIMEOUT}")
+    parser.add_argument('--local_workers', type=int, default=0,
+                        help="Количество воркеров, запускаемых координатором на этой машине. По умолчанию 0")
+    parser.add_argument('--metrics_file', type=str, default=None,
+                        help="Файл, в который раз в секунду записываются метрики скана в формате Prometheus")
+    parser.add_argument('--metrics_listen', type=str, default=None,
+                        help="Адрес host:port, по которому метрики отдаются по HTTP на пути /metrics "
+                             "(например 127.0.0.1:9100)")
+    parser.add_argument('--progress', action='store_true',
+                        help="Выводить строку прогресса (скорость, оставшееся время, длительность этапов) на stderr")
     args = parser.parse_args()
     args_dict = vars(args)
-    try:
-        ports = list(map(int, args_dict['ports'].split(',')))
-    except ValueError:
-        sys.exit('Ошибка ввода портов, пример ввода - 80, 443')
-    args_dict.update({'ports': ports})
+    if args_dict['join']:
+        args_dict['ports'] = []
+    else:
+        if not args_dict['ip_range'] or not args_dict['ports']:
+            parser.error('необходимо указать ip_range и ports')
+        try:
+            ports = list(map(int, args_dict['ports'].split(',')))
+        except ValueError:
+            sys.exit('Ошибка ввода портов, пример ввода - 80, 443')
+        args_dict.update({'ports': ports})
     multiprocessing.freeze_support()
     scanner = PortScanner(**args_dict)
 
     scanner.start()
-    scanner.join()
+    with interrupt_handler(lambda: None):
+        scanner.join()
 
 
 if __name__ == '__main__':
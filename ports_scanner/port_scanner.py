@@ -1,107 +1,440 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
 import ipaddress
+import math
 import os
 import socket
+import ssl
 import sys
-from collections import namedtuple
-from multiprocessing import Process, Queue
-from queue import Empty
-from typing import Union
+import time
+from collections import deque, namedtuple
+from multiprocessing import Event, Lock, Pipe, Process
+from multiprocessing.connection import Connection
+from typing import Callable, Iterable, Iterator, Optional, Tuple, Union
 
-host_fields = ('ip', 'port', 'status', 'server')
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+
+from checkpoint import Checkpoint
+from common.distributed import DEFAULT_LEASE_TIMEOUT, Coordinator, LeaseClient
+from common.metrics import Metrics, MetricsReporter, ratio
+from common.scheduler import EXECUTOR_ASYNCIO, INTERRUPT_MESSAGE, Scheduler, interrupt_handler
+from common.sinks import ResultSink, create_sink
+from rtt import DEFAULT_MAX_TIMEOUT, RttEstimator
+from syn_scanner import DEFAULT_RATE, DEFAULT_WAIT, SynScanner
+from targets import TargetGenerator
+
+host_fields = ('ip', 'port', 'status', 'server', 'cert_cn')
 Host = namedtuple('Host', host_fields, defaults=(None,) * len(host_fields))
 
 WEB_PORTS = [80, 443]
+TLS_PORTS = [443]
+DEFAULT_TIMEOUT = 0.3
+DEFAULT_CONCURRENCY = 500
+DEFAULT_RETRIES = 1
+RETRY_BACKOFF = 2
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_LEASE_SIZE = 65536
+FLUSH_INTERVAL = 1.0
+CHECKPOINT_STEPS = 4096
+DEFAULT_BANNER_CONCURRENCY = 100
+BANNER_TIMEOUT = 3.0
+BANNER_CHUNK_SIZE = 4096
+MAX_HEADERS_SIZE = 16384
+STATUS_OPEN = 'OPEN'
+STATUS_CLOSED = 'CLOSED'
+STATUS_FILTERED = 'FILTERED'
 
 
 class PortScanner(Process):
     """
-    Класс процесс, отвечает за подготовку начальных данных, порождение подпроцессов, сохранение и вывод результата.
-    :param ip_range - диапазон ip адресов в виде строки 192.168.1.0/24
+    Класс процесс, отвечает за подготовку начальных данных, запуск пула воркеров, сохранение и вывод результата.
+     Открытые порты записываются в файл результата и выводятся на консоль по мере поступления.
+    :param ip_range - диапазоны ip адресов через запятую в виде строки 192.168.1.0/24,10.0.0.0/8
     :param ports - список портов для сканирования.
     :param log_file - файл для сохранения результата.
+    :param log_format - формат файла результата (text, json, jsonl, csv, bin), по умолчанию по расширению файла.
+    :param exclude - диапазоны ip адресов через запятую, которые нужно пропустить.
+    :param shuffle - сканировать цели в перемешанном порядке.
+    :param concurrency - максимальное количество одновременных подключений на все воркеры.
+    :param timeout - начальное время ожидания подключения к порту в секундах,
+     далее время ожидания подстраивается под задержку подсети.
+    :param max_timeout - верхняя граница времени ожидания подключения в секундах.
+    :param retries - количество повторных попыток для подключений, завершившихся по таймауту.
+    :param workers - количество процессов-воркеров, по умолчанию по числу ядер.
+    :param batch_size - максимальный размер пачки результатов, передаваемой воркером.
+    :param syn - полуоткрытое (SYN) сканирование через raw сокеты вместо пула воркеров, требует CAP_NET_RAW.
+    :param rate - максимальное количество SYN пакетов в секунду.
+    :param checkpoint_file - журнал прогресса для продолжения прерванного скана: завершенные шаги шардов
+     и открытые порты, пустая строка отключает журнал.
+    :param resume - продолжить прерванный скан с завершенных шагов шардов из журнала.
+    :param max_rate - максимальное количество подключений в секунду на все воркеры, 0 - без ограничения.
+    :param per_target_rate - максимальное количество подключений в секунду к одному ip адресу, 0 - без ограничения.
+     По SIGINT воркеры перестают брать новые цели, дожидаются текущих подключений и сохраняют результат
+     и журнал, после чего скан можно продолжить с resume.
+    :param serve - адрес host:port координатора распределенного скана: цели делятся на аренды по lease_size целей,
+     которые выполняют подключившиеся воркеры, журнал в этом режиме не ведется.
+    :param join - адрес координатора (например http://10.0.0.1:8750), в этом режиме процесс работает воркером:
+     получает аренды у координатора и сканирует их пулом из workers процессов, ip_range и ports не используются.
+    :param lease_size - количество целей в одной аренде.
+    :param lease_timeout - время в секундах, после которого аренда без ответа воркера передается другому воркеру.
+    :param local_workers - количество локальных воркеров, запускаемых координатором.
+    :param metrics_file - файл, в который раз в секунду записываются метрики скана в формате Prometheus.
+    :param metrics_listen - адрес host:port, по которому метрики отдаются по HTTP (GET /metrics).
+    :param progress - выводить строку прогресса на stderr.
     """
 
-    def __init__(self, ip_range: str, ports: list, log_file='hosts.log', *args, **kwargs) -> None:
+    def __init__(self, ip_range: str, ports: list, log_file='hosts.log', concurrency: int = DEFAULT_CONCURRENCY,
+                 timeout: float = DEFAULT_TIMEOUT, exclude: str = '', shuffle: bool = False,
+                 workers: Optional[int] = None, batch_size: int = DEFAULT_BATCH_SIZE, syn: bool = False,
+                 rate: int = DEFAULT_RATE, max_timeout: float = DEFAULT_MAX_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 checkpoint_file: str = 'scan.checkpoint', resume: bool = False, log_format: Optional[str] = None,
+                 max_rate: float = 0, per_target_rate: float = 0, serve: Optional[str] = None,
+                 join: Optional[str] = None, lease_size: int = DEFAULT_LEASE_SIZE,
+                 lease_timeout: float = DEFAULT_LEASE_TIMEOUT, local_workers: int = 0,
+                 metrics_file: Optional[str] = None, metrics_listen: Optional[str] = None, progress: bool = False,
+                 *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
         self.ports = ports
         self.ip_range = ip_range
-        self.ip_list = list()
-        self.scanners = list()
-        self.hosts_queue = Queue(maxsize=10)
-        self.opened_hosts = list()
+        self.exclude = exclude
+        self.shuffle = shuffle
+        self.targets = None
+        self.opened_count = 0
         self.hosts_file = log_file
+        self.log_format = log_format
+        self.sink = None
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_timeout = max_timeout
+        self.retries = retries
+        self.workers_count = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.workers = list()
+        self.syn = syn
+        self.rate = rate
+        self.checkpoint_file = checkpoint_file
+        self.resume = resume
+        self.checkpoint = None
+        self.completed_steps = dict()
+        self.reported = set()
+        self.max_rate = max_rate
+        self.per_target_rate = per_target_rate
+        self.interrupted = False
+        self.serve = serve
+        self.join_url = join
+        self.lease_size = lease_size
+        self.lease_timeout = lease_timeout
+        self.local_workers = local_workers
+        self.coordinator = None
+        self.lease = None
+        self.stopped = None
+        self.syn_step = 0
+        self.metrics = Metrics()
+        self.metrics_file = metrics_file
+        self.metrics_listen = metrics_listen
+        self.progress = progress
 
     def run(self) -> None:
         """
         Главная функция класса, готовит начальные данные,
-        порождает процессы, завершает процессы, сохраняет результат
+        запускает сканирование, сохраняет результат
         выводит на консоль сообщение с результатом.
         """
-        self._prepare_ip_v4_objects()
-        self._generate_scanners()
-        for scanner in self.scanners:
-            scanner.start()
-        while True:
+        if self.join_url:
+            with self._prepare_reporter('targets'):
+                self._run_lease_worker()
+            return
+        self._prepare_targets()
+        self.sink = self._prepare_sink()
+        with self.sink, self._prepare_reporter('leases' if self.serve else 'probes' if self.syn else 'targets'):
+            if not self.serve:
+                self._prepare_checkpoint()
+                self.metrics.set('probes_planned' if self.syn else 'targets_planned',
+                                 len(self.targets) - self._skipped_count())
             try:
-                host = self.hosts_queue.get(timeout=0.001)
-                self.opened_hosts.append(host)
-            except Empty:
-                if not any(scanner.is_alive() for scanner in self.scanners):
-                    break
-        for scanner in self.scanners:
-            scanner.join()
-
-        if self.opened_hosts:
-            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), self.hosts_file)
-            print('Скан закончен, результат ниже:')
-            print(f'Результат сохранен в {path}')
-            self._print_hosts_msg()
-            self._write_log_file()
+                with interrupt_handler(self._interrupt, INTERRUPT_MESSAGE):
+                    if self.serve:
+                        self._run_coordinator()
+                    elif self.syn:
+                        self._run_syn_scan()
+                    else:
+                        self._run_workers()
+            finally:
+                if self.checkpoint is not None:
+                    self.checkpoint.close()
+
+        if self.interrupted and self.checkpoint is not None:
+            print('Скан прерван, для продолжения запустите его повторно с параметром --resume')
+        if self.opened_count:
+            print(f'Скан закончен, найдено открытых портов: {self.opened_count}')
+            print(f'Результат сохранен в {os.path.abspath(self.hosts_file)}')
         else:
             print('Открытые хосты не обнаружены.')
 
-    def _prepare_ip_v4_objects(self) -> None:
+    def _interrupt(self) -> None:
+        self.interrupted = True
+        if self.coordinator is not None:
+            self.coordinator.cancel()
+
+    def _prepare_targets(self, seed: Optional[int] = None) -> None:
+        """
+        Функция создает ленивый генератор целей и присваивает его переменной self.targets.
+        """
+        try:
+            self.targets = TargetGenerator(self.ip_range.split(','), self.ports,
+                                           exclude=self.exclude.split(','), shuffle=self.shuffle, seed=seed)
+        except ValueError as err:
+            sys.exit(err)
+
+    def _prepare_sink(self) -> ResultSink:
         """
-        Функция создает список ip адресов и присваивает его переменной self.ip_list.
+        Функция создает приемник, записывающий результат в файл по мере поступления.
         """
         try:
-            self.ip_list = list(ipaddress.ip_network(self.ip_range))
+            return create_sink(self.hosts_file, host_fields, self.log_format, formatter=self._generate_msg_string)
         except ValueError as err:
             sys.exit(err)
 
-    def _generate_scanners(self) -> None:
+    def _prepare_reporter(self, unit: str) -> MetricsReporter:
+        """
+        Функция запускает публикацию метрик: файл, HTTP сервер и строку прогресса, если они включены.
+         Выполненной работой считается счетчик unit: цели, SYN пакеты или аренды координатора.
+        """
+        reporter = MetricsReporter(self.metrics, unit, self.metrics_file, self.metrics_listen, self.progress,
+                                   describe=self._describe_progress)
+        try:
+            reporter.start()
+        except (ValueError, OSError) as err:
+            sys.exit(err)
+        return reporter
+
+    def _describe_progress(self) -> str:
+        attempts = self.metrics.total('connects')
+        timeouts = self.metrics.counter('connects', result='timeout')
+        return f'open {self.opened_count} timeouts {ratio(timeouts, attempts)}'
+
+    def _prepare_checkpoint(self) -> None:
+        """
+        Функция открывает журнал прогресса. При продолжении скана восстанавливает из журнала зерно перестановки
+         и разбиение на шарды, загружает завершенные шаги шардов в self.completed_steps и заново сохраняет
+         найденные ранее открытые порты.
+        """
+        if not self.checkpoint_file:
+            return
+        scan_params = {'ip_range': self.ip_range, 'exclude': self.exclude, 'ports': self.ports,
+                       'shuffle': self.shuffle, 'syn': self.syn}
+        self.checkpoint = Checkpoint(self.checkpoint_file, scan_params)
+        shards = 1 if self.syn else self._pool_size()
+        if self.resume:
+            try:
+                layout, self.completed_steps, opened = self.checkpoint.load()
+            except ValueError as err:
+                sys.exit(err)
+            if layout is not None:
+                self._prepare_targets(layout['seed'])
+                shards = self.workers_count = layout['shards']
+            for record in opened:
+                host = Host(*record)
+                self.reported.add(Checkpoint.key(host.ip, host.port))
+                self._report_host(host)
+            if self.completed_steps:
+                print(f'Продолжение скана, пропущено завершенных целей: {self._skipped_count()}')
+        self.checkpoint.open(self.resume, self.targets.seed, shards)
+
+    def _skipped_count(self) -> int:
+        """
+        Функция оценивает количество целей в завершенных шагах шардов, в перемешанном порядке - приближенно.
+        """
+        return round(sum(self.completed_steps.values()) * len(self.targets) / max(self.targets.steps_count, 1))
+
+    def _add_results(self, hosts: list) -> None:
+        """
+        Функция сохраняет пачку результатов в журнал и отбирает открытые порты.
+         В режиме воркера открытые порты передаются координатору в рамках текущей аренды.
+        """
+        if self.lease is not None:
+            opened = [host for host in hosts if host.status == STATUS_OPEN]
+            self.opened_count += len(opened)
+            self.lease.emit([list(host) for host in opened])
+            return
+        opened = [host for host in hosts if host.status == STATUS_OPEN
+                  and (not self.reported or Checkpoint.key(host.ip, host.port) not in self.reported)]
+        if self.checkpoint is not None:
+            self.checkpoint.write(opened)
+        for host in opened:
+            self._report_host(host)
+
+    def _report_host(self, host: Host) -> None:
+        """
+        Функция записывает открытый порт в файл результата и выводит его на консоль.
+        """
+        record = host._asdict()
+        self.sink.write(record)
+        print(self._generate_msg_string(record))
+        self.opened_count += 1
+
+    def _run_coordinator(self) -> None:
+        """
+        Функция делит цели на аренды (шарды общего генератора с одним зерном перестановки), запускает координатор
+         и локальных воркеров и сохраняет результаты аренд по мере их завершения.
+        """
+        shards = max(1, math.ceil(len(self.targets) / self.lease_size))
+        leases = ({'ip_range': self.ip_range, 'exclude': self.exclude, 'ports': self.ports, 'shuffle': self.shuffle,
+                   'seed': self.targets.seed, 'shard': index, 'shards': shards} for index in range(shards))
+        try:
+            self.coordinator = Coordinator(leases, self.serve, self.lease_timeout)
+            self.coordinator.start()
+        except (ValueError, OSError) as err:
+            sys.exit(err)
+        print(f'Координатор запущен на {self.coordinator.url}, аренд: {shards}')
+        self.metrics.set('leases_planned', shards)
+        local_workers = [PortScanner('', [], join=self.coordinator.url, concurrency=self.concurrency,
+                                     timeout=self.timeout, max_timeout=self.max_timeout, retries=self.retries,
+                                     workers=self.workers_count, batch_size=self.batch_size, max_rate=self.max_rate,
+                                     per_target_rate=self.per_target_rate)
+                         for _ in range(self.local_workers)]
+        for worker in local_workers:
+            worker.start()
+        try:
+            self.coordinator.run(self._add_lease_results)
+        finally:
+            self.coordinator.close()
+            for worker in local_workers:
+                worker.join()
+        print(f'Аренд выполнено: {self.coordinator.completed} из {shards}, '
+              f'передано другим воркерам: {self.coordinator.reassigned}, воркеров: {len(self.coordinator.workers)}')
+
+    def _add_lease_results(self, records: list) -> None:
+        self.metrics.inc('leases')
+        for record in records:
+            self._report_host(Host(*record))
+
+    def _run_lease_worker(self) -> None:
         """
-        Функция порождает процесс на каждый объект в переменной self.ip_list.
+        Функция получает аренды у координатора и сканирует шард каждой аренды пулом воркеров.
+         Аренда, прерванная по SIGINT, не завершается и после истечения передается другому воркеру.
+         Если аренда потеряна (передана координатором другому воркеру), скан ее шарда прекращается.
         """
-        self.scanners = [Scanner(ip_v4, self.ports, self.hosts_queue) for ip_v4 in self.ip_list]
+        client = LeaseClient(self.join_url)
+        try:
+            with interrupt_handler(self._interrupt, INTERRUPT_MESSAGE):
+                for self.lease in client.leases():
+                    payload = self.lease.payload
+                    self.targets = TargetGenerator(payload['ip_range'].split(','), payload['ports'],
+                                                   exclude=payload['exclude'].split(','), shuffle=payload['shuffle'],
+                                                   seed=payload['seed'])
+                    self.metrics.set('targets_planned', self.metrics.gauge('targets_planned')
+                                     + math.ceil(len(self.targets) / payload['shards']))
+                    self._run_workers(payload['shard'], payload['shards'])
+                    if self.interrupted:
+                        break
+        except ConnectionError as err:
+            sys.exit(err)
+        finally:
+            self.lease = None
+        print(f'Воркер {client.worker} завершил, выполнено аренд: {client.completed}')
 
-    def _write_log_file(self) -> None:
+    def _run_workers(self, shard_index: int = 0, shard_count: int = 1) -> None:
         """
-        Функция записывает результат в файл.
+        Функция запускает пул воркеров и собирает результат из общего pipe.
         """
-        with open(self.hosts_file, 'w', encoding='utf8') as file:
-            for host in self.opened_hosts:
-                str_msg = self._generate_msg_string(host)
-                file.write(str_msg + '\n')
+        results_reader, results_writer = Pipe(duplex=False)
+        self.stopped = Event()
+        self._generate_workers(results_writer, shard_index, shard_count)
+        for worker in self.workers:
+            worker.start()
+        results_writer.close()
+        self._collect_results(results_reader)
+        for worker in self.workers:
+            worker.join()
 
-    def _print_hosts_msg(self) -> None:
+    def _run_syn_scan(self) -> None:
         """
-        Функция выводит результат на консоль.
+        Функция запускает полуоткрытое сканирование, если процессу доступны raw сокеты.
         """
-        msg_strings = list()
-        for host in self.opened_hosts:
-            str_msg = self._generate_msg_string(host)
-            msg_strings.append(str_msg)
-        [print(msg) for msg in msg_strings]
+        if not SynScanner.is_available():
+            sys.exit('Для SYN сканирования необходимы права root или CAP_NET_RAW')
+        self.syn_step = self.completed_steps.get(0, 0)
+        scanner = SynScanner(self._syn_targets(), self._add_syn_host, rate=self.rate, wait=DEFAULT_WAIT)
+        scanner.scan()
+        if self.checkpoint is not None:
+            self.checkpoint.mark(0, self.syn_step)
 
-    def _generate_msg_string(self, host) -> str:
+    def _syn_targets(self) -> Iterator[Tuple[ipaddress.IPv4Address, int]]:
+        """
+        Функция выдает цели отправителю SYN пакетов, начиная с завершенного шага журнала. Шаг отмечается
+         в журнале завершенным, когда после отправки его пакета прошло время ожидания ответов.
+        """
+        sent = deque()
+        marked = self.syn_step
+        for step, target in self.metrics.iterate(self.targets.steps(0, 1, self.syn_step), 'generate'):
+            if self.interrupted:
+                return
+            self.metrics.inc('probes')
+            yield target
+            self.syn_step = step + 1
+            if self.checkpoint is None:
+                continue
+            if self.syn_step - (sent[-1][1] if sent else marked) >= CHECKPOINT_STEPS:
+                sent.append((time.monotonic(), self.syn_step))
+            while sent and time.monotonic() - sent[0][0] > DEFAULT_WAIT:
+                marked = sent.popleft()[1]
+                self.checkpoint.mark(0, marked)
+
+    def _add_syn_host(self, ip: str, port: int) -> None:
+        self._add_results([Host(ip=ip, port=port, status=STATUS_OPEN)])
+
+    def _generate_workers(self, results_writer: Connection, shard_index: int = 0, shard_count: int = 1) -> None:
+        """
+        Функция создает фиксированный пул воркеров, каждый воркер получает свой шард целей.
+         Шард shard_index из shard_count (аренда распределенного скана) делится между воркерами
+         вложенными шардами с шагом shard_count * workers_count.
+        """
+        workers_count = self._pool_size(shard_count)
+        concurrency = max(1, self.concurrency // workers_count)
+        pipe_lock = Lock()
+        self.workers = [ScanWorker(self.targets, shard_index + shard_count * index, shard_count * workers_count,
+                                   results_writer, pipe_lock, self.completed_steps.get(index, 0), self.stopped,
+                                   batch_size=self.batch_size, concurrency=concurrency, timeout=self.timeout,
+                                   max_timeout=self.max_timeout, retries=self.retries,
+                                   rate=self.max_rate / workers_count,
+                                   per_target_rate=self.per_target_rate / workers_count)
+                        for index in range(workers_count)]
+
+    def _pool_size(self, shard_count: int = 1) -> int:
+        return max(1, min(self.workers_count, len(self.targets) // shard_count))
+
+    def _collect_results(self, results_reader: Connection) -> None:
+        """
+        Функция блокирующе читает пачки результатов из pipe, пока все воркеры не пришлют признак завершения.
+         Если воркер завершился аварийно, чтение закончится по EOF после закрытия всех пишущих концов pipe.
+         Если аренда воркера потеряна, воркерам пула передается сигнал остановки.
+        """
+        finished = 0
+        while finished < len(self.workers):
+            try:
+                batch = results_reader.recv()
+            except EOFError:
+                break
+            if self.lease is not None and self.lease.lost and not self.stopped.is_set():
+                print(f'Аренда {self.lease.id} передана другому воркеру, скан ее шарда прекращен')
+                self.stopped.set()
+            if batch is None:
+                finished += 1
+            elif isinstance(batch, dict):
+                self.metrics.merge(batch['metrics'], worker=batch['worker'])
+                if batch.get('done') is not None and self.checkpoint is not None:
+                    self.checkpoint.mark(batch['worker'], batch['done'])
+            else:
+                self._add_results(batch)
+
+    def _generate_msg_string(self, host_dict: dict) -> str:
         """
         Функция подготавливает и возвращает текстовую строку для вывода на консоль и записи в файл.
         """
         tms_list = list()
-        host_dict = host._asdict()
         for value in host_dict.values():
             if value:
                 tms_list.append(str(value))
@@ -109,71 +442,324 @@ class PortScanner(Process):
         return str_msg
 
 
-class Scanner(Process):
+class ScanWorker(Process):
     """
-    Класс под-процесс, порожденный классом PortScanner.
-     Получает на вход объект IPv4Address, порты и 'очередь' для передачи результата выполнения.
-     Создает подключения по переданному адресу и портам, проверяет, удачно ли подключение,
-     генерирует информацию о подключении и передает в главный процесс PortScanner.
+    Класс процесс-воркер пула PortScanner.
+     Сканирует свой шард целей асинхронным движком Scanner и передает результаты пачками через общий pipe,
+     по завершении работы передает None. Цели выдаются движку общим планировщиком с долей лимитов
+     частоты подключений, по SIGINT или событию stopped планировщик перестает выдавать цели.
+     Вместе с пачками результатов воркер раз в FLUSH_INTERVAL секунд передает приращения своих метрик
+     и завершенный шаг шарда: все цели до него проверены, отметка передается после продвижения
+     на CHECKPOINT_STEPS шагов и при завершении воркера.
+    :param targets - генератор целей сканирования.
+    :param shard_index - номер шарда воркера.
+    :param shard_count - общее количество шардов.
+    :param results_writer - пишущий конец общего pipe.
+    :param pipe_lock - блокировка записи в pipe, общая для всех воркеров.
+    :param start - количество шагов шарда, завершенных в прерванном скане, они пропускаются.
+    :param stopped - событие остановки пула, например при потере аренды распределенного скана.
+    :param rate - максимальное количество подключений воркера в секунду, 0 - без ограничения.
+    :param per_target_rate - максимальное количество подключений воркера в секунду к одному ip адресу.
     """
 
-    def __init__(self, ip_v4: ipaddress.IPv4Address, ports: list, hosts_queue: Queue, *args, **kwargs) -> None:
-        super().__init__(*args, **kwargs)
-        self.ip_v4 = ip_v4
-        self.ports = ports
-        self.hosts_queue = hosts_queue
-        self.timeout = 0.3
+    def __init__(self, targets: TargetGenerator, shard_index: int, shard_count: int, results_writer: Connection,
+                 pipe_lock: Lock, start: int, stopped: Event, batch_size: int = DEFAULT_BATCH_SIZE,
+                 concurrency: int = DEFAULT_CONCURRENCY, timeout: float = DEFAULT_TIMEOUT,
+                 max_timeout: float = DEFAULT_MAX_TIMEOUT, retries: int = DEFAULT_RETRIES, rate: float = 0,
+                 per_target_rate: float = 0) -> None:
+        super().__init__(daemon=True)
+        self.targets = targets
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.results_writer = results_writer
+        self.pipe_lock = pipe_lock
+        self.start_step = start
+        self.stopped = stopped
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_timeout = max_timeout
+        self.retries = retries
+        self.rate = rate
+        self.per_target_rate = per_target_rate
+        self.batch = list()
+        self.metrics = Metrics()
+        self.pending = dict()
+        self.next_step = start
+        self.marked = start
 
     def run(self) -> None:
-        self.check_ports()
+        scheduler = Scheduler(EXECUTOR_ASYNCIO, self.concurrency, rate=self.rate,
+                              per_target_rate=self.per_target_rate, target_key=lambda target: target[0],
+                              metrics=self.metrics)
+        try:
+            with scheduler.handle_signals(message=None):
+                asyncio.run(self._scan(scheduler))
+        finally:
+            self._flush()
+            self._send_metrics(final=True)
+            self._send(None)
 
-    def check_ports(self) -> None:
+    async def _scan(self, scheduler: Scheduler) -> None:
         """
-        Функция запускает итерирует по всем портам и, в зависимости от порта, запускает функцию сканирования.
+        Функция сканирует шард и параллельно раз в FLUSH_INTERVAL секунд отправляет накопленную пачку.
         """
-        for port in self.ports:
-            if port in WEB_PORTS:
-                self.scan_port_with_header(port)
-            else:
-                self.scan_port(port)
+        scanner = Scanner(self.metrics.iterate(self._targets(), 'generate'), self._add_result,
+                          concurrency=self.concurrency, timeout=self.timeout, max_timeout=self.max_timeout,
+                          retries=self.retries, scheduler=scheduler, metrics=self.metrics)
+        flusher = asyncio.ensure_future(self._flush_periodically(scheduler))
+        try:
+            await scanner.scan()
+        finally:
+            flusher.cancel()
 
-    def scan_port_with_header(self, port) -> None:
+    def _targets(self) -> Iterator[Tuple[ipaddress.IPv4Address, int]]:
         """
-        Функция сканирует хост по 80 и 443 порту.
-         Передает успешный результат сканирования в очередь главного процесса.
+        Функция выдает цели шарда, начиная с шага start, и запоминает шаги выданных, но еще не проверенных целей.
         """
+        for step, (ip, port) in self.targets.steps(self.shard_index, self.shard_count, self.start_step):
+            self.pending[(str(ip), port)] = step
+            self.next_step = step + 1
+            yield ip, port
+
+    def _done_step(self) -> int:
+        """
+        Функция возвращает шаг, до которого все цели шарда проверены: шаг самой ранней непроверенной цели.
+        """
+        return next(iter(self.pending.values()), self.next_step)
+
+    def _add_result(self, host: Host) -> None:
+        self.pending.pop((host.ip, host.port), None)
+        self.batch.append(host)
+        if len(self.batch) >= self.batch_size:
+            self._flush()
+
+    async def _flush_periodically(self, scheduler: Scheduler) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            if self.stopped.is_set():
+                scheduler.cancel()
+            self._flush()
+            self._send_metrics()
+
+    def _flush(self) -> None:
+        if self.batch:
+            self._send(self.batch)
+            self.batch = list()
+
+    def _send_metrics(self, final: bool = False) -> None:
+        done = self._done_step()
+        if final or done - self.marked >= CHECKPOINT_STEPS:
+            self.marked = done
+        else:
+            done = None
+        self._send({'worker': self.shard_index, 'metrics': self.metrics.snapshot(reset=True), 'done': done})
+
+    def _send(self, message: Union[list, dict, None]) -> None:
+        with self.pipe_lock:
+            self.results_writer.send(message)
+
+
+class Scanner:
+    """
+    Асинхронный движок сканирования, запускаемый воркером ScanWorker в своем event loop.
+     Получает на вход итератор пар (IPv4Address, порт) и функцию для передачи результата выполнения.
+     Создает неблокирующие подключения по переданным адресам и портам, цели выдает планировщик,
+     количество одновременных подключений ограничено параметром concurrency, поэтому потребление
+     памяти не зависит от размера диапазона.
+     Время ожидания подключения вычисляется по задержкам подсети (RttEstimator), повторно
+     с увеличенным временем ожидания проверяются только подключения, завершившиеся по таймауту.
+     Подключения к открытым web портам передаются в ограниченную очередь, из которой баннеры
+     получают отдельные корутины параллельно с проверкой остальных портов.
+    :param targets - итератор пар (ip адрес, порт).
+    :param on_result - функция, получающая объект Host со статусом OPEN, CLOSED или FILTERED для каждой цели.
+    :param concurrency - максимальное количество одновременных подключений.
+    :param timeout - начальное время ожидания подключения и время ожидания ответа в секундах.
+    :param max_timeout - верхняя граница времени ожидания подключения в секундах.
+    :param retries - количество повторных попыток после таймаута.
+    :param scheduler - планировщик выдачи целей (asyncio), по умолчанию без ограничения частоты.
+    :param metrics - набор метрик: длительность подключений и получения баннеров, исходы подключений
+     (connects) и статусы целей (targets).
+    """
+
+    def __init__(self, targets: Iterable[Tuple[ipaddress.IPv4Address, int]], on_result: Callable[[Host], None],
+                 concurrency: int = DEFAULT_CONCURRENCY, timeout: float = DEFAULT_TIMEOUT,
+                 max_timeout: float = DEFAULT_MAX_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 scheduler: Optional[Scheduler] = None, metrics: Optional[Metrics] = None) -> None:
+        self.targets = iter(targets)
+        self.on_result = on_result
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_timeout = max_timeout
+        self.retries = retries
+        self.rtt = RttEstimator(timeout, max_timeout=max_timeout)
+        self.metrics = metrics or Metrics()
+        self.scheduler = scheduler or Scheduler(EXECUTOR_ASYNCIO, concurrency, metrics=self.metrics)
+
+    async def scan(self) -> None:
+        """
+        Функция запускает планировщик, корутины которого разбирают общий итератор целей,
+         и параллельно с ними корутины получения баннеров с открытых web портов.
+        """
+        self.banners = asyncio.Queue(maxsize=self.concurrency)
+        grabbers = [asyncio.ensure_future(self._grab_banners())
+                    for _ in range(min(self.concurrency, DEFAULT_BANNER_CONCURRENCY))]
         try:
-            request_string = f"GET / HTTP/1.1\nHost: {str(self.ip_v4)}\n\n"
-            bytes_request_string = str.encode(request_string)
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sct:
-                sct.settimeout(self.timeout)
-                sct.connect((str(self.ip_v4), port))
-                sct.sendall(bytes_request_string)
-                response_data = sct.recv(1024)
+            await self.scheduler.run_async(lambda target: self.check_port(*target), self.targets)
+            await self.banners.join()
+        finally:
+            for grabber in grabbers:
+                grabber.cancel()
 
-            try:
-                decoded_string = response_data.decode("UTF-8")
-            except UnicodeDecodeError:
-                decoded_string = response_data.decode("cp1252")
+    async def check_port(self, ip_v4: ipaddress.IPv4Address, port: int) -> None:
+        """
+        Функция, в зависимости от порта, запускает функцию сканирования.
+        """
+        if port in WEB_PORTS:
+            await self.scan_port_with_header(ip_v4, port)
+        else:
+            await self.scan_port(ip_v4, port)
 
-            response_data_list = decoded_string.split('\r\n')
-            http_server = self._check_server_info(response_data_list)
-            host = Host(ip=str(self.ip_v4), port=port, status='OPEN', server=http_server)
-            self.hosts_queue.put(host)
-        except (ConnectionRefusedError, socket.error):
-            pass
+    async def scan_port_with_header(self, ip_v4: ipaddress.IPv4Address, port: int) -> None:
+        """
+        Функция сканирует хост по web портам.
+         Открытое подключение не закрывается, а передается в очередь получения баннеров.
+        """
+        sct, status = await self._connect(ip_v4, port)
+        if sct is not None:
+            await self.banners.put((ip_v4, port, sct))
+            self.metrics.set('banner_queue', self.banners.qsize())
+        else:
+            self._report(Host(ip=str(ip_v4), port=port, status=status))
 
-    def scan_port(self, port) -> None:
+    async def scan_port(self, ip_v4: ipaddress.IPv4Address, port: int) -> None:
         """
         Функция сканирует хост по остальным портам.
-         Передает успешный результат сканирования в очередь главного процесса.
+         Передает результат сканирования.
+        """
+        sct, status = await self._connect(ip_v4, port)
+        if sct is not None:
+            sct.close()
+        self._report(Host(ip=str(ip_v4), port=port, status=status))
+
+    async def _grab_banners(self) -> None:
+        while True:
+            ip_v4, port, sct = await self.banners.get()
+            try:
+                with self.metrics.timer('banner'):
+                    server, cert_cn = await asyncio.wait_for(self.grab_banner(ip_v4, port, sct), BANNER_TIMEOUT)
+                self.metrics.inc('banners', result='ok')
+            except (asyncio.TimeoutError, OSError, ssl.SSLError):
+                server = cert_cn = None
+                self.metrics.inc('banners', result='error')
+            finally:
+                sct.close()
+                self.banners.task_done()
+            self._report(Host(ip=str(ip_v4), port=port, status=STATUS_OPEN, server=server, cert_cn=cert_cn))
+
+    def _report(self, host: Host) -> None:
+        self.metrics.inc('targets', status=host.status)
+        self.on_result(host)
+
+    async def grab_banner(self, ip_v4: ipaddress.IPv4Address, port: int,
+                          sct: socket.socket) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Функция получает баннер по уже установленному при проверке порта подключению.
+         На TLS портах выполняет TLS рукопожатие и получает CN сертификата сервера.
+         Заголовки ответа читаются частями до конца блока заголовков, тело ответа не читается.
+        :return: пара (ПО сервера, CN сертификата).
+        """
+        cert_cn = None
+        if port in TLS_PORTS:
+            reader, writer = await asyncio.open_connection(sock=sct, ssl=self._ssl_context(), server_hostname='')
+            cert_cn = self._check_certificate_cn(writer.get_extra_info('ssl_object'))
+        else:
+            reader, writer = await asyncio.open_connection(sock=sct)
+        try:
+            request_string = f"GET / HTTP/1.1\r\nHost: {str(ip_v4)}\r\nConnection: close\r\n\r\n"
+            writer.write(str.encode(request_string))
+            response_data = await self._read_headers(reader)
+        finally:
+            writer.close()
+
+        try:
+            decoded_string = response_data.decode("UTF-8")
+        except UnicodeDecodeError:
+            decoded_string = response_data.decode("cp1252", errors='replace')
+        return self._check_server_info(decoded_string.split('\r\n')), cert_cn
+
+    async def _read_headers(self, reader: asyncio.StreamReader) -> bytes:
+        """
+        Функция читает ответ частями, пока не встретит границу заголовков и тела или не превысит MAX_HEADERS_SIZE.
+        """
+        response_data = b''
+        while b'\r\n\r\n' not in response_data and len(response_data) < MAX_HEADERS_SIZE:
+            chunk = await reader.read(BANNER_CHUNK_SIZE)
+            if not chunk:
+                break
+            response_data += chunk
+        return response_data.split(b'\r\n\r\n', 1)[0]
+
+    async def _connect(self, ip_v4: ipaddress.IPv4Address, port: int) -> Tuple[Optional[socket.socket], str]:
         """
-        sct = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sct.settimeout(self.timeout)
-        connected = sct.connect_ex((str(self.ip_v4), port)) == 1
-        if connected:
-            tmp_host = Host(ip=str(self.ip_v4), port=port, status='OPEN', server=None)
-            self.hosts_queue.put(tmp_host)
+        Функция подключается к порту с адаптивным временем ожидания и учитывает задержку ответа.
+         Отклоненное подключение (RST) тоже дает измерение задержки. По таймауту подключение
+         повторяется до self.retries раз, каждый раз время ожидания увеличивается в RETRY_BACKOFF раз.
+        :return: пара (подключенный неблокирующий сокет или None, статус порта).
+        """
+        loop = asyncio.get_event_loop()
+        family = socket.AF_INET if ip_v4.version == 4 else socket.AF_INET6
+        for attempt in range(self.retries + 1):
+            timeout = min(self.max_timeout, self.rtt.timeout(ip_v4) * RETRY_BACKOFF ** attempt)
+            sct = socket.socket(family, socket.SOCK_STREAM)
+            sct.setblocking(False)
+            started = time.monotonic()
+            try:
+                with self.metrics.timer('connect'):
+                    await asyncio.wait_for(loop.sock_connect(sct, (str(ip_v4), port)), timeout)
+            except asyncio.TimeoutError:
+                sct.close()
+                self.metrics.inc('connects', result='timeout')
+                continue
+            except ConnectionRefusedError:
+                sct.close()
+                self.rtt.update(ip_v4, time.monotonic() - started)
+                self.metrics.inc('connects', result='refused')
+                return None, STATUS_CLOSED
+            except OSError:
+                sct.close()
+                self.metrics.inc('connects', result='error')
+                return None, STATUS_FILTERED
+            self.rtt.update(ip_v4, time.monotonic() - started)
+            self.metrics.inc('connects', result='open')
+            return sct, STATUS_OPEN
+        return None, STATUS_FILTERED
+
+    @staticmethod
+    def _ssl_context() -> ssl.SSLContext:
+        """
+        Функция создает TLS контекст без проверки сертификата, сертификат нужен только для чтения CN.
+        """
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+
+    def _check_certificate_cn(self, ssl_object: Optional[ssl.SSLObject]) -> Union[str, None]:
+        """
+        Функция извлекает CN из сертификата сервера.
+        """
+        if ssl_object is None:
+            return None
+        der_certificate = ssl_object.getpeercert(binary_form=True)
+        if not der_certificate:
+            return None
+        try:
+            certificate = x509.load_der_x509_certificate(der_certificate)
+        except ValueError:
+            return None
+        common_names = certificate.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
+        return str(common_names[0].value) if common_names else None
 
     def _check_server_info(self, response_data: list) -> Union[str, None]:
         """
@@ -182,8 +768,8 @@ class Scanner(Process):
         :return http_server: строка с ПО сервера.
         """
         for header_data in response_data:
-            if 'server' in header_data.lower():
-                http_server = header_data.split(':')[-1]
-                return http_server
+            name, _, value = header_data.partition(':')
+            if name.strip().lower() == 'server':
+                return value.strip()
 
         return None
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+from targets import IPAddress
+
+DEFAULT_MIN_TIMEOUT = 0.05
+DEFAULT_MAX_TIMEOUT = 3.0
+SUBNET_PREFIX_V4 = 24
+SUBNET_PREFIX_V6 = 64
+RTT_ALPHA = 0.125
+RTT_BETA = 0.25
+RTT_VARIANCE_FACTOR = 4
+
+
+class RttEstimator:
+    """
+    Класс оценки времени ожидания подключения по измеренным задержкам (аналог RTO из RFC 6298).
+     Задержки группируются по подсетям /24 (/64 для IPv6), для каждой подсети хранится
+     сглаженное время ответа и его отклонение, время ожидания = srtt + 4 * rttvar.
+     Пока по подсети нет измерений, используется начальное время ожидания.
+    :param initial_timeout - время ожидания для подсети без измерений в секундах.
+    :param min_timeout - нижняя граница времени ожидания в секундах.
+    :param max_timeout - верхняя граница времени ожидания в секундах.
+    """
+
+    def __init__(self, initial_timeout: float, min_timeout: float = DEFAULT_MIN_TIMEOUT,
+                 max_timeout: float = DEFAULT_MAX_TIMEOUT) -> None:
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.subnets = dict()
+
+    def timeout(self, ip_address: IPAddress) -> float:
+        """
+        Функция возвращает текущее время ожидания для подсети адреса.
+        """
+        estimate = self.subnets.get(self._subnet(ip_address))
+        if estimate is None:
+            return self.initial_timeout
+        srtt, rttvar = estimate
+        return min(self.max_timeout, max(self.min_timeout, srtt + RTT_VARIANCE_FACTOR * rttvar))
+
+    def update(self, ip_address: IPAddress, rtt: float) -> None:
+        """
+        Функция учитывает измеренную задержку подключения (успешного или отклоненного) к адресу.
+        """
+        subnet = self._subnet(ip_address)
+        estimate = self.subnets.get(subnet)
+        if estimate is None:
+            self.subnets[subnet] = (rtt, rtt / 2)
+            return
+        srtt, rttvar = estimate
+        rttvar = (1 - RTT_BETA) * rttvar + RTT_BETA * abs(srtt - rtt)
+        srtt = (1 - RTT_ALPHA) * srtt + RTT_ALPHA * rtt
+        self.subnets[subnet] = (srtt, rttvar)
+
+    @staticmethod
+    def _subnet(ip_address: IPAddress) -> int:
+        prefix = SUBNET_PREFIX_V4 if ip_address.version == 4 else SUBNET_PREFIX_V6
+        return int(ip_address) >> (ip_address.max_prefixlen - prefix)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+import errno
+import ipaddress
+import random
+import socket
+import struct
+import threading
+import time
+from typing import Callable, Iterable, Tuple
+
+from targets import IPAddress
+
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+TCP_HEADER_LENGTH = 20
+TCP_WINDOW = 1024
+
+DEFAULT_RATE = 10000
+DEFAULT_WAIT = 2.0
+RATE_CHECK_EVERY = 64
+RECEIVE_TIMEOUT = 0.2
+
+
+class SynScanner:
+    """
+    Класс полуоткрытого (SYN) сканирования через raw сокеты, требует права CAP_NET_RAW.
+     Поток-отправитель формирует TCP SYN пакеты и отправляет их с заданной частотой,
+     поток-получатель слушает ответы SYN-ACK/RST и сопоставляет их с целями.
+     Соединение не устанавливается, ответ на SYN-ACK (RST) отправляет ядро.
+     Номер последовательности каждого пакета вычисляется из адреса и порта цели (cookie),
+     поэтому состояние отправленных пакетов не хранится. IPv6 адреса пропускаются.
+    :param targets - итератор пар (ip адрес, порт).
+    :param on_host - функция, получающая (ip адрес, порт) каждого открытого порта, вызывается из потока-получателя.
+    :param rate - максимальное количество отправляемых пакетов в секунду.
+    :param wait - время ожидания ответов после отправки последнего пакета в секундах.
+    """
+
+    def __init__(self, targets: Iterable[Tuple[IPAddress, int]], on_host: Callable[[str, int], None],
+                 rate: int = DEFAULT_RATE, wait: float = DEFAULT_WAIT) -> None:
+        self.targets = targets
+        self.on_host = on_host
+        self.rate = rate
+        self.wait = wait
+        self.source_port = random.randint(40000, 60999)
+        self.secret = random.getrandbits(64)
+        self.opened = set()
+        self._sources = dict()
+        self.sent_count = 0
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def is_available() -> bool:
+        """
+        Функция проверяет, можно ли создать raw сокет (root или CAP_NET_RAW).
+        """
+        try:
+            socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP).close()
+        except PermissionError:
+            return False
+        return True
+
+    def scan(self) -> None:
+        """
+        Функция запускает потоки отправки и приема и дожидается ответов после отправки последнего пакета.
+        """
+        send_socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+        receive_socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+        receive_socket.settimeout(RECEIVE_TIMEOUT)
+        receiver = threading.Thread(target=self._receive, args=(receive_socket,), daemon=True)
+        sender = threading.Thread(target=self._send, args=(send_socket,), daemon=True)
+        try:
+            receiver.start()
+            sender.start()
+            sender.join()
+            time.sleep(self.wait)
+        finally:
+            self._stopped.set()
+            receiver.join()
+            send_socket.close()
+            receive_socket.close()
+
+    def _send(self, send_socket: socket.socket) -> None:
+        """
+        Функция отправляет SYN пакет каждой цели, выдерживая частоту self.rate пакетов в секунду.
+         При переполнении буфера отправки пакет отправляется повторно, цели с недоступным маршрутом пропускаются.
+        """
+        started = time.monotonic()
+        for ip_address, port in self.targets:
+            if self._stopped.is_set():
+                return
+            if ip_address.version != 4:
+                continue
+            destination = int(ip_address)
+            packet = self._build_syn(self._source_address(destination), destination, port)
+            while True:
+                try:
+                    send_socket.sendto(packet, (str(ip_address), 0))
+                    self.sent_count += 1
+                    break
+                except OSError as err:
+                    if err.errno not in (errno.ENOBUFS, errno.EAGAIN):
+                        break
+                    time.sleep(0.001)
+            if self.sent_count % RATE_CHECK_EVERY == 0:
+                ahead = self.sent_count / self.rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    def _receive(self, receive_socket: socket.socket) -> None:
+        """
+        Функция разбирает входящие TCP пакеты и отбирает ответы SYN-ACK на отправленные пакеты.
+        """
+        while not self._stopped.is_set():
+            try:
+                packet = receive_socket.recv(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            header_length = (packet[0] & 0x0F) * 4
+            if len(packet) < header_length + 14:
+                continue
+            source_port, destination_port, _, ack, _, flags = struct.unpack_from('!HHIIBB', packet, header_length)
+            if destination_port != self.source_port or flags & TCP_RST or flags & TCP_SYN == 0:
+                continue
+            source = int.from_bytes(packet[12:16], 'big')
+            if flags & TCP_ACK == 0 or (ack - 1) & 0xFFFFFFFF != self._cookie(source, source_port):
+                continue
+            if (source, source_port) in self.opened:
+                continue
+            self.opened.add((source, source_port))
+            self.on_host(str(ipaddress.IPv4Address(source)), source_port)
+
+    def _build_syn(self, source: bytes, destination: int, port: int) -> bytes:
+        """
+        Функция формирует TCP заголовок SYN пакета с контрольной суммой по псевдо-заголовку.
+        """
+        sequence = self._cookie(destination, port)
+        header = struct.pack('!HHIIBBHHH', self.source_port, port, sequence, 0, (TCP_HEADER_LENGTH // 4) << 4,
+                             TCP_SYN, TCP_WINDOW, 0, 0)
+        pseudo_header = struct.pack('!4sIBBH', source, destination, 0, socket.IPPROTO_TCP, TCP_HEADER_LENGTH)
+        checksum = self._checksum(pseudo_header + header)
+        return header[:16] + struct.pack('!H', checksum) + header[18:]
+
+    def _cookie(self, address: int, port: int) -> int:
+        return hash((self.secret, address, port)) & 0xFFFFFFFF
+
+    @staticmethod
+    def _checksum(data: bytes) -> int:
+        total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+        total = (total >> 16) + (total & 0xFFFF)
+        total += total >> 16
+        return ~total & 0xFFFF
+
+    def _source_address(self, destination: int) -> bytes:
+        """
+        Функция определяет локальный адрес, с которого ядро отправит пакет в подсеть /24 получателя.
+         Результат кэшируется по подсети, маршрут ищется через connect UDP сокета без отправки данных.
+        """
+        subnet = destination >> 8
+        source = self._sources.get(subnet)
+        if source is None:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sct:
+                sct.connect((str(ipaddress.IPv4Address(destination)), 9))
+                source = self._sources[subnet] = socket.inet_aton(sct.getsockname()[0])
+        return source
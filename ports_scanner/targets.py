@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import ipaddress
+import random
+from bisect import bisect_right
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+IPAddress = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+Target = Tuple[IPAddress, int]
+
+PERMUTATION_ROUNDS = 3
+
+
+class TargetGenerator:
+    """
+    Класс ленивого генератора целей сканирования.
+     Хранит только список диапазонов (с учетом исключений) и вычисляет пару (ip адрес, порт) по ее номеру,
+     поэтому потребление памяти не зависит от размера диапазона.
+     Поддерживает разбиение на шарды для воркеров, выдачу пачками ограниченного размера и
+     перемешанный порядок обхода, чтобы не нагружать одну подсеть.
+    :param networks - список диапазонов ip адресов (например ['192.168.1.0/24', '10.0.0.0/8']).
+    :param ports - список портов для сканирования.
+    :param exclude - список диапазонов ip адресов, которые нужно пропустить.
+    :param shuffle - обходить цели в перемешанном порядке.
+    :param seed - зерно перестановки, одинаковое зерно дает одинаковый порядок.
+    """
+
+    def __init__(self, networks: Iterable[str], ports: Iterable[int], exclude: Iterable[str] = (),
+                 shuffle: bool = False, seed: Optional[int] = None) -> None:
+        self.networks = self._prepare_networks(networks, exclude)
+        self.ports = list(ports)
+        self.shuffle = shuffle
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self._offsets = list()
+        self.addresses_count = 0
+        for network in self.networks:
+            self._offsets.append(self.addresses_count)
+            self.addresses_count += network.num_addresses
+        self.targets_count = self.addresses_count * len(self.ports)
+        self._bits = max(self.targets_count - 1, 1).bit_length()
+        self._rounds = self._prepare_rounds()
+
+    def __len__(self) -> int:
+        return self.targets_count
+
+    def __iter__(self) -> Iterator[Target]:
+        return self.shard(0, 1)
+
+    @property
+    def steps_count(self) -> int:
+        """
+        Количество шагов обхода: в перемешанном порядке часть шагов выпадает за пределы целей и пропускается.
+        """
+        return 1 << self._bits if self.shuffle else self.targets_count
+
+    def shard(self, index: int, count: int, start: int = 0) -> Iterator[Target]:
+        """
+        Функция лениво генерирует цели шарда index из count. Шарды не пересекаются и вместе покрывают все цели.
+        """
+        for _, target in self.steps(index, count, start):
+            yield target
+
+    def steps(self, index: int, count: int, start: int = 0) -> Iterator[Tuple[int, Target]]:
+        """
+        Функция лениво генерирует пары (номер шага в шарде, цель) шарда index из count, начиная с шага start.
+         Пропуск start шагов не требует их перебора, поэтому прерванный шард продолжается с любого места.
+        """
+        if not self.shuffle:
+            for step, position in enumerate(range(index + start * count, self.targets_count, count), start):
+                yield step, self.target(position)
+            return
+        for step, value in enumerate(range(index + start * count, self.steps_count, count), start):
+            position = self._permute(value)
+            if position < self.targets_count:
+                yield step, self.target(position)
+
+    def batches(self, batch_size: int, index: int = 0, count: int = 1) -> Iterator[List[Target]]:
+        """
+        Функция разбивает цели шарда index из count на пачки размером не более batch_size.
+        """
+        targets = self.shard(index, count)
+        while True:
+            batch = list(islice(targets, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def target(self, position: int) -> Target:
+        """
+        Функция возвращает пару (ip адрес, порт) по ее порядковому номеру.
+        """
+        address_index, port_index = divmod(position, len(self.ports))
+        network_index = bisect_right(self._offsets, address_index) - 1
+        network = self.networks[network_index]
+        return network[address_index - self._offsets[network_index]], self.ports[port_index]
+
+    def _permute(self, value: int) -> int:
+        """
+        Функция биективно отображает число на отрезок [0, 2 ** bits).
+         Каждый раунд - умножение на нечетное число и xorshift, оба шага обратимы по модулю степени двойки.
+        """
+        mask = (1 << self._bits) - 1
+        shift = self._bits // 2 + 1
+        for multiplier, increment in self._rounds:
+            value = (value * multiplier + increment) & mask
+            value ^= value >> shift
+        return value
+
+    def _prepare_rounds(self) -> list:
+        rnd = random.Random(self.seed)
+        return [(rnd.getrandbits(self._bits) | 1, rnd.getrandbits(self._bits)) for _ in range(PERMUTATION_ROUNDS)]
+
+    @staticmethod
+    def _prepare_networks(networks: Iterable[str], exclude: Iterable[str]) -> List[IPNetwork]:
+        """
+        Функция объединяет пересекающиеся диапазоны и вычитает из них исключения.
+        :raise ValueError: если диапазон задан неверно.
+        """
+        parsed = [ipaddress.ip_network(network.strip()) for network in networks if network.strip()]
+        if not parsed:
+            raise ValueError('Не задан диапазон ip адресов')
+        result = list()
+        for version in (4, 6):
+            result.extend(ipaddress.collapse_addresses(net for net in parsed if net.version == version))
+        for excluded in (ipaddress.ip_network(network.strip()) for network in exclude if network.strip()):
+            remaining = list()
+            for network in result:
+                if network.version != excluded.version or not network.overlaps(excluded):
+                    remaining.append(network)
+                elif not network.subnet_of(excluded):
+                    remaining.extend(network.address_exclude(excluded))
+            result = remaining
+        return sorted(result, key=lambda net: (net.version, net.network_address))